@@ -1,4 +1,7 @@
 import os
+import threading
+from contextlib import contextmanager
+
 import torch
 from pathlib import Path
 
@@ -15,6 +18,43 @@ else:
 # global variable: embedding_storage_mode
 embedding_storage_mode = "default"
 
+# embedding storage mode of each thread, set by store_embeddings, see get_embedding_storage_mode
+_thread_local = threading.local()
+
+
+def get_embedding_storage_mode() -> str:
+    """
+    Returns the embedding storage mode of the current thread, which is the mode of its last store_embeddings call
+    (e.g. by predict) or of an enclosing thread_settings block, and otherwise flair.embedding_storage_mode. Since the
+    mode is kept per thread, several threads can predict with different storage modes concurrently.
+    """
+    return getattr(_thread_local, "embedding_storage_mode", embedding_storage_mode)
+
+
+@contextmanager
+def thread_settings(embedding_storage_mode: str = None):
+    """
+    Sets the embedding storage mode of the current thread inside of the block and restores the previous mode of the
+    thread afterwards, e.g. to run worker threads with the mode of the thread that started them:
+
+    >>> storage_mode = flair.get_embedding_storage_mode()
+    >>> with flair.thread_settings(embedding_storage_mode=storage_mode):
+    >>>     tagger.predict(sentences)
+
+    :param embedding_storage_mode: the embedding storage mode of the current thread, by default its current mode
+    """
+    previous = getattr(_thread_local, "embedding_storage_mode", None)
+    if embedding_storage_mode is not None:
+        _thread_local.embedding_storage_mode = embedding_storage_mode
+    try:
+        yield
+    finally:
+        if previous is None:
+            _thread_local.__dict__.pop("embedding_storage_mode", None)
+        else:
+            _thread_local.embedding_storage_mode = previous
+
+
 from . import data
 from . import models
 from . import visual
@@ -0,0 +1,375 @@
+import argparse
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from itertools import islice
+from typing import List, Dict, Iterable, Iterator, TextIO, Optional
+
+from flair.data import Sentence, Token
+from flair.inference_utils import MultiProcessPredictor, _label_names, _predictions_to_dict
+from flair.tokenization import (
+    Tokenizer,
+    SegtokTokenizer,
+    SpaceTokenizer,
+    SpacyTokenizer,
+    JapaneseTokenizer,
+    SciSpacyTokenizer,
+    SentenceSplitter,
+    NoSentenceSplitter,
+    SegtokSentenceSplitter,
+    NewlineSentenceSplitter,
+    SpacySentenceSplitter,
+    SciSpacySentenceSplitter,
+)
+
+log = logging.getLogger("flair")
+
+
+class Document:
+    """
+    A line of the input, or a sentence of a CoNLL file, with its sentences.
+    :param sentences: the sentences of the document, with start_pos and end_pos relative to the text
+    :param text: the original text, None for CoNLL input
+    :param fields: the JSON object of a JSONL line, or the token columns of a CoNLL sentence
+    """
+
+    def __init__(self, sentences: List[Sentence], text: str = None, fields=None):
+        self.sentences = sentences
+        self.text = text
+        self.fields = fields
+
+
+def read_text(lines: Iterable[str], sentence_splitter: SentenceSplitter) -> Iterator[Document]:
+    """Reads one document per line."""
+    for line in lines:
+        text = line.rstrip("\r\n")
+        yield Document(sentence_splitter.split(text) if text.strip() else [], text=text)
+
+
+def read_jsonl(
+    lines: Iterable[str], sentence_splitter: SentenceSplitter, text_field: str = "text"
+) -> Iterator[Document]:
+    """Reads one JSON object per line, the text in text_field is the document."""
+    for line in lines:
+        if not line.strip():
+            continue
+        fields = json.loads(line)
+        text = fields[text_field]
+        yield Document(sentence_splitter.split(text) if text.strip() else [], text=text, fields=fields)
+
+
+def read_conll(lines: Iterable[str]) -> Iterator[Document]:
+    """
+    Reads sentences in CoNLL format, with one token per line in the first column and sentences separated by empty
+    lines. The columns of each token are kept, so predictions can be added as further columns.
+    """
+    rows: List[List[str]] = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.strip() and not line.startswith("-DOCSTART-"):
+            rows.append(line.split("\t") if "\t" in line else line.split())
+        elif rows:
+            yield _conll_document(rows)
+            rows = []
+    if rows:
+        yield _conll_document(rows)
+
+
+def _conll_document(rows: List[List[str]]) -> Document:
+    sentence = Sentence()
+    # tokens that only consist of zero-width characters are not added to the sentence
+    tokens: List[Optional[Token]] = []
+    for row in rows:
+        length = len(sentence)
+        sentence.add_token(Token(row[0]))
+        tokens.append(sentence[length] if len(sentence) > length else None)
+    return Document([sentence] if len(sentence) > 0 else [], fields={"rows": rows, "tokens": tokens})
+
+
+class JsonlWriter:
+    """Writes a JSON object per document with the predicted labels and spans of each sentence."""
+
+    def __init__(self, output: TextIO, label_names: List[str]):
+        self.output = output
+        self.label_names = label_names
+
+    def write(self, document: Document):
+        record = dict(document.fields) if isinstance(document.fields, dict) and "rows" not in document.fields else {}
+        if document.text is not None:
+            record["text"] = document.text
+
+        sentences = []
+        for sentence in document.sentences:
+            predictions = _predictions_to_dict(sentence, self.label_names)
+            predictions["start_pos"] = sentence.start_pos
+            predictions["end_pos"] = sentence.end_pos
+            sentences.append(predictions)
+        record["sentences"] = sentences
+
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self.output.flush()
+
+
+class ConllWriter:
+    """
+    Writes one token per line with one column per predicted label type, and sentences separated by empty lines.
+    Tokens of CoNLL input keep their columns. Sentence labels are written as comments before the tokens.
+    """
+
+    def __init__(self, output: TextIO, label_names: List[str]):
+        self.output = output
+        self.label_names = label_names
+
+    def write(self, document: Document):
+        if document.fields is not None and "rows" in document.fields:
+            rows = document.fields["rows"]
+            tokens = document.fields["tokens"]
+        else:
+            rows, tokens = None, None
+
+        for sentence in document.sentences:
+            for label_name in self.label_names:
+                for label in sentence.get_labels(label_name):
+                    self.output.write(f"# {label_name} = {label.value}\t{label.score:.4f}\n")
+
+            if rows is not None:
+                for row, token in zip(rows, tokens):
+                    self._write_token(row, token)
+            else:
+                for token in sentence:
+                    self._write_token([token.text], token)
+            self.output.write("\n")
+
+    def _write_token(self, columns: List[str], token: Optional[Token]):
+        tags = [token.get_tag(label_name).value if token is not None else "" for label_name in self.label_names]
+        self.output.write("\t".join(columns + [tag if tag else "O" for tag in tags]) + "\n")
+
+    def flush(self):
+        self.output.flush()
+
+
+def bulk_predict(
+    model,
+    documents: Iterable[Document],
+    writer,
+    mini_batch_size: int = None,
+    chunk_size: int = 1000,
+    num_workers: int = 1,
+    prefetch: int = 2,
+    report_interval: float = 10.0,
+    **predict_kwargs,
+) -> Dict:
+    """
+    Predicts the sentences of a stream of documents and writes the documents in input order. Reading, prediction
+    and writing run in separate threads, so they overlap. The documents are processed in chunks and at most
+    prefetch chunks wait to be predicted or written, so memory use does not grow with the input.
+    :param model: a SequenceTagger, MultiTagger or TextClassifier
+    :param documents: an iterable of documents, e.g. from read_text, read_jsonl or read_conll
+    :param writer: a JsonlWriter, ConllWriter or other object with a write(document) and a flush() method. It is
+    flushed after each chunk, so the output can be followed while it is written
+    :param mini_batch_size: mini-batch size, by default the one of the inference settings of the model
+    :param chunk_size: number of documents predicted together, larger chunks give better length-sorted batches
+    :param num_workers: number of worker processes, if larger than 1 the model predicts on CPU with a
+    MultiProcessPredictor
+    :param prefetch: number of chunks that are read ahead and that wait to be written
+    :param report_interval: seconds between progress reports in the log
+    :param predict_kwargs: further arguments passed to the predict method of the model, e.g. label_name
+    :return: the numbers of documents, sentences and tokens, and the elapsed time in seconds
+    """
+    read_queue: queue.Queue = queue.Queue(maxsize=prefetch)
+    write_queue: queue.Queue = queue.Queue(maxsize=prefetch)
+    errors: List[BaseException] = []
+
+    def read():
+        try:
+            iterator = iter(documents)
+            while True:
+                chunk = list(islice(iterator, chunk_size))
+                if not chunk:
+                    break
+                read_queue.put(chunk)
+        except BaseException as error:
+            errors.append(error)
+        finally:
+            read_queue.put(None)
+
+    def write_chunks():
+        failed = False
+        while True:
+            chunk = write_queue.get()
+            if chunk is None:
+                return
+            # after a failure, the queue is still drained so prediction does not block
+            if failed:
+                continue
+            try:
+                for document in chunk:
+                    writer.write(document)
+                writer.flush()
+            except BaseException as error:
+                errors.append(error)
+                failed = True
+
+    # worker processes are started before the threads, a fork copies only the calling thread
+    predictor = MultiProcessPredictor(model, num_workers=num_workers) if num_workers > 1 else None
+
+    reader_thread = threading.Thread(target=read, daemon=True)
+    writer_thread = threading.Thread(target=write_chunks, daemon=True)
+    reader_thread.start()
+    writer_thread.start()
+
+    statistics = {"documents": 0, "sentences": 0, "tokens": 0}
+    start = time.time()
+    last_report = start
+    try:
+        while not errors:
+            chunk = read_queue.get()
+            if chunk is None:
+                break
+
+            sentences = [sentence for document in chunk for sentence in document.sentences]
+            if sentences:
+                if predictor is not None:
+                    predictor.predict(sentences, mini_batch_size=mini_batch_size, **predict_kwargs)
+                else:
+                    model.predict(sentences, mini_batch_size=mini_batch_size, **predict_kwargs)
+            write_queue.put(chunk)
+
+            statistics["documents"] += len(chunk)
+            statistics["sentences"] += len(sentences)
+            statistics["tokens"] += sum(len(sentence) for sentence in sentences)
+
+            if time.time() - last_report >= report_interval:
+                last_report = time.time()
+                _log_progress(statistics, last_report - start)
+    finally:
+        write_queue.put(None)
+        writer_thread.join()
+        if predictor is not None:
+            predictor.close()
+
+    if errors:
+        raise errors[0]
+
+    statistics["seconds"] = time.time() - start
+    _log_progress(statistics, statistics["seconds"])
+    return statistics
+
+
+def _log_progress(statistics: Dict, elapsed: float):
+    elapsed = max(elapsed, 1e-9)
+    log.info(
+        f"{statistics['documents']} documents, {statistics['sentences']} sentences in {elapsed:.1f}s "
+        f"({statistics['sentences'] / elapsed:.1f} sentences/s, {statistics['tokens'] / elapsed:.1f} tokens/s)"
+    )
+
+
+def _get_tokenizer(name: str) -> Tokenizer:
+    kind, _, argument = name.partition(":")
+    if kind == "segtok":
+        return SegtokTokenizer()
+    if kind == "space":
+        return SpaceTokenizer()
+    if kind == "spacy":
+        return SpacyTokenizer(argument)
+    if kind == "japanese":
+        return JapaneseTokenizer(argument or "janome")
+    if kind == "scispacy":
+        return SciSpacyTokenizer()
+    raise ValueError(f'Unknown tokenizer "{name}".')
+
+
+def _get_sentence_splitter(name: str, tokenizer: Tokenizer) -> SentenceSplitter:
+    kind, _, argument = name.partition(":")
+    if kind == "none":
+        return NoSentenceSplitter(tokenizer)
+    if kind == "segtok":
+        return SegtokSentenceSplitter(tokenizer)
+    if kind == "newline":
+        return NewlineSentenceSplitter(tokenizer)
+    if kind == "spacy":
+        return SpacySentenceSplitter(argument, tokenizer)
+    if kind == "scispacy":
+        return SciSpacySentenceSplitter()
+    raise ValueError(f'Unknown sentence splitter "{name}".')
+
+
+def _read_lines(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        if path == "-":
+            yield from sys.stdin
+        else:
+            with open(path, encoding="utf-8") as file:
+                yield from file
+
+
+def main(arguments: List[str] = None):
+    parser = argparse.ArgumentParser(description="Predict large amounts of text with a Flair model.")
+    parser.add_argument("inputs", nargs="*", default=["-"], help="input files, '-' or none to read from stdin")
+    parser.add_argument("--model", default="ner", help="model name or path, comma-separated for a multi-tagger")
+    parser.add_argument("--model-type", choices=["tagger", "multi-tagger", "classifier"], default="tagger")
+    parser.add_argument("--input-format", choices=["text", "jsonl", "conll"], default="text")
+    parser.add_argument("--text-field", default="text", help="field of the text in JSONL input")
+    parser.add_argument("--output", default="-", help="output file, '-' to write to stdout")
+    parser.add_argument("--output-format", choices=["jsonl", "conll"], default="jsonl")
+    parser.add_argument(
+        "--tokenizer", default="segtok", help="segtok, space, spacy:MODEL, japanese:mecab|janome|sudachi or scispacy"
+    )
+    parser.add_argument(
+        "--sentence-splitter", default="none", help="none (one sentence per document), segtok, newline, "
+                                                    "spacy:MODEL or scispacy"
+    )
+    parser.add_argument("--mini-batch-size", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=1000, help="number of documents predicted together")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (CPU only)")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="seconds between progress reports")
+    args = parser.parse_args(arguments)
+
+    from flair.models import SequenceTagger, MultiTagger, TextClassifier
+
+    # the log goes to stderr so that it does not mix with output written to stdout
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)-15s %(message)s"))
+    log.handlers = [handler]
+
+    if args.model_type == "tagger":
+        model = SequenceTagger.load(args.model)
+    elif args.model_type == "multi-tagger":
+        model = MultiTagger.load(args.model.split(","))
+    else:
+        model = TextClassifier.load(args.model)
+
+    lines = _read_lines(args.inputs)
+    if args.input_format == "conll":
+        documents = read_conll(lines)
+    else:
+        sentence_splitter = _get_sentence_splitter(args.sentence_splitter, _get_tokenizer(args.tokenizer))
+        if args.input_format == "jsonl":
+            documents = read_jsonl(lines, sentence_splitter, args.text_field)
+        else:
+            documents = read_text(lines, sentence_splitter)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        writer_class = JsonlWriter if args.output_format == "jsonl" else ConllWriter
+        bulk_predict(
+            model,
+            documents,
+            writer_class(output, _label_names(model, {})),
+            mini_batch_size=args.mini_batch_size,
+            chunk_size=args.chunk_size,
+            num_workers=args.workers,
+            report_interval=args.report_interval,
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import torch, flair
 import logging
 import re
 
+import numpy as np
+
 from abc import abstractmethod, ABC
 
 from collections import Counter
@@ -14,7 +16,7 @@ from operator import itemgetter
 from torch.utils.data import Dataset
 from torch.utils.data.dataset import ConcatDataset, Subset
 
-from typing import List, Dict, Union, Callable, Optional
+from typing import List, Dict, Union, Callable, Optional, Tuple, Set
 
 log = logging.getLogger("flair")
 
@@ -208,17 +210,80 @@ class DataPoint:
         else:
             self.annotation_layers[label_type].append(Label(value, score))
 
+        self._invalidate_label_tensors(label_type)
+
         return self
 
     def set_label(self, label_type: str, value: str, score: float = 1.):
         self.annotation_layers[label_type] = [Label(value, score)]
 
+        self._invalidate_label_tensors(label_type)
+
         return self
 
     def remove_labels(self, label_type: str):
         if label_type in self.annotation_layers.keys():
             del self.annotation_layers[label_type]
 
+        self._invalidate_label_tensors(label_type)
+
+    def get_label_indices(self, label_type: str, dictionary: Dictionary) -> torch.Tensor:
+        """
+        Returns the dictionary IDs of all labels of the given type as a LongTensor. The tensor is computed once per
+        dictionary and kept until the labels of this type change.
+        """
+        return self._get_label_tensor(
+            "indices",
+            label_type,
+            dictionary,
+            lambda: torch.tensor(
+                [dictionary.get_idx_for_item(label.value) for label in self.get_labels(label_type)],
+                dtype=torch.long,
+            ),
+        )
+
+    def get_label_one_hot(self, label_type: str, dictionary: Dictionary) -> torch.Tensor:
+        """
+        Returns a FloatTensor of dictionary size with a 1 for each label of the given type. The tensor is computed
+        once per dictionary and kept until the labels of this type change.
+        """
+
+        def one_hot():
+            vector = torch.zeros(len(dictionary), dtype=torch.float)
+            for label in self.get_labels(label_type):
+                idx = dictionary.item2idx.get(label.value.encode("utf-8"))
+                if idx is not None:
+                    vector[idx] = 1.
+            return vector
+
+        return self._get_label_tensor("one_hot", label_type, dictionary, one_hot)
+
+    def _get_label_tensor(
+            self, kind: str, label_type: str, dictionary: Dictionary, compute: Callable[[], torch.Tensor]
+    ) -> torch.Tensor:
+
+        if "_label_tensors" not in self.__dict__:
+            self._label_tensors = {}
+
+        # an entry is only valid for the very dictionary (and dictionary size) it was computed with
+        cached = self._label_tensors.get((kind, label_type))
+        if cached is not None and cached[0] is dictionary and cached[1] == len(dictionary):
+            return cached[2]
+
+        tensor = compute()
+        self._label_tensors[(kind, label_type)] = (dictionary, len(dictionary), tensor)
+        return tensor
+
+    def _invalidate_label_tensors(self, label_type: str = None):
+        label_tensors = self.__dict__.get("_label_tensors")
+        if not label_tensors:
+            return
+
+        # entries without label type hold all labels and are affected by any change
+        for key in list(label_tensors.keys()):
+            if label_type is None or key[1] is None or key[1] == label_type:
+                del label_tensors[key]
+
     def get_labels(self, label_type: str = None):
         if label_type is None:
             return self.labels
@@ -291,6 +356,17 @@ class Token(DataPoint):
         self._embeddings: Dict = {}
         self.tags_proba_dist: Dict[str, List[Label]] = {}
 
+    @property
+    def annotation_layers(self) -> Dict[str, List[Label]]:
+        # tags predicted as arrays for the whole sentence become labels on first access
+        if self.sentence is not None and self.sentence._tag_predictions_pending:
+            self.sentence._materialize_tag_predictions()
+        return self._annotation_layers
+
+    @annotation_layers.setter
+    def annotation_layers(self, annotation_layers: Dict[str, List[Label]]):
+        self._annotation_layers = annotation_layers
+
     def add_tag_label(self, tag_type: str, tag: Label):
         self.set_label(tag_type, tag.value, tag.score)
 
@@ -300,6 +376,13 @@ class Token(DataPoint):
     def add_tag(self, tag_type: str, tag_value: str, confidence=1.0):
         self.set_label(tag_type, tag_value, confidence)
 
+    def _invalidate_label_tensors(self, label_type: str = None):
+        super()._invalidate_label_tensors(label_type)
+
+        # tag tensors are cached on the sentence
+        if self.sentence is not None:
+            self.sentence._invalidate_label_tensors(label_type)
+
     def get_tag(self, label_type):
         if len(self.get_labels(label_type)) == 0: return Label('')
         return self.get_labels(label_type)[0]
@@ -307,6 +390,18 @@ class Token(DataPoint):
     def get_tags_proba_dist(self, tag_type: str) -> List[Label]:
         if tag_type in self.tags_proba_dist:
             return self.tags_proba_dist[tag_type]
+
+        # distributions predicted for a whole sentence are turned into labels on request
+        if self.sentence is not None and tag_type in self.sentence.tags_proba_dist:
+            proba_dist, tag_dictionary = self.sentence.tags_proba_dist[tag_type]
+            token_index = self.idx - 1
+            if not (0 <= token_index < len(self.sentence) and self.sentence.tokens[token_index] is self):
+                token_index = self.sentence.tokens.index(self)
+            return [
+                Label(tag_dictionary.get_item_for_index(tag_id), score)
+                for tag_id, score in enumerate(proba_dist[token_index].tolist())
+            ]
+
         return []
 
     def get_head(self):
@@ -314,7 +409,7 @@ class Token(DataPoint):
 
     def set_embedding(self, name: str, vector: torch.tensor):
         device = flair.device
-        if (flair.embedding_storage_mode == "cpu") and len(self._embeddings.keys()) > 0:
+        if (flair.get_embedding_storage_mode() == "cpu") and len(self._embeddings.keys()) > 0:
             device = next(iter(self._embeddings.values())).device
         if device != vector.device:
             vector = vector.to(device)
@@ -343,7 +438,7 @@ class Token(DataPoint):
         for embed in sorted(self._embeddings.keys()):
             if embedding_names and embed not in embedding_names: continue
             embed = self._embeddings[embed].to(flair.device)
-            if (flair.embedding_storage_mode == "cpu") and embed.device != flair.device:
+            if (flair.get_embedding_storage_mode() == "cpu") and embed.device != flair.device:
                 embed = embed.to(flair.device)
             embeddings.append(embed)
         return embeddings
@@ -547,6 +642,11 @@ class Sentence(DataPoint):
 
         self._embeddings: Dict = {}
 
+        self.tags_proba_dist: Dict[str, Tuple[np.ndarray, Dictionary]] = {}
+
+        self._tag_predictions: Dict[str, Tuple[np.ndarray, np.ndarray, Dictionary]] = {}
+        self._tag_predictions_pending: Set[str] = set()
+
         self.language_code: str = language_code
 
         self.start_pos = start_position
@@ -599,87 +699,125 @@ class Sentence(DataPoint):
             return
 
         self.tokens.append(token)
+        self._invalidate_label_tensors()
 
         # set token idx if not set
         token.sentence = self
         if token.idx is None:
             token.idx = len(self.tokens)
 
-    def get_label_names(self):
-        label_names = []
-        for label in self.labels:
-            label_names.append(label.value)
-        return label_names
+    def get_tag_indices(self, tag_type: str, dictionary: Dictionary) -> torch.Tensor:
+        """
+        Returns the dictionary IDs of the tags of the given type of all tokens as a LongTensor. The tensor is computed
+        once per dictionary and kept until a tag of this type changes.
+        """
+        return self._get_label_tensor(
+            "tags",
+            tag_type,
+            dictionary,
+            lambda: torch.tensor(
+                [dictionary.get_idx_for_item(token.get_tag(tag_type).value) for token in self.tokens],
+                dtype=torch.long,
+            ),
+        )
 
-    def _add_spans_internal(self, spans: List[Span], label_type: str, min_score):
+    def add_tags_proba_dist(self, tag_type: str, proba_dist: np.ndarray, tag_dictionary: Dictionary):
+        """
+        Sets the probability distributions over all tags for all tokens of this sentence.
+        :param tag_type: the tag type the distributions were predicted for
+        :param proba_dist: array of shape [tokens, tags] holding one distribution per token
+        :param tag_dictionary: dictionary mapping the columns of the array to tags
+        """
+        self.tags_proba_dist[tag_type] = (proba_dist, tag_dictionary)
 
-        current_span = []
+        # the sentence-level distributions replace any set for individual tokens
+        for token in self.tokens:
+            token.tags_proba_dist.pop(tag_type, None)
 
-        tags = defaultdict(lambda: 0.0)
+    def add_tag_predictions(
+            self, tag_type: str, tag_ids: np.ndarray, scores: np.ndarray, tag_dictionary: Dictionary
+    ):
+        """
+        Sets the predicted tags of all tokens of this sentence as arrays. Labels are only created for the tokens once
+        labels of a token are accessed, e.g. through Token.get_tag or Sentence.get_spans.
+        :param tag_type: the tag type the tags were predicted for
+        :param tag_ids: array holding the ID of the predicted tag of each token
+        :param scores: array holding the confidence of each predicted tag
+        :param tag_dictionary: dictionary mapping the IDs to tags
+        """
+        self._tag_predictions[tag_type] = (tag_ids, scores, tag_dictionary)
+        self._tag_predictions_pending.add(tag_type)
+        self._invalidate_label_tensors(tag_type)
 
-        previous_tag_value: str = "O"
-        for token in self:
+    def get_tag_predictions(self, tag_type: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns the arrays of tag IDs and confidences set with add_tag_predictions, or None if there are none. The
+        arrays hold the prediction as it was made, later changes to the labels of the tokens are not reflected.
+        """
+        if tag_type in self._tag_predictions:
+            tag_ids, scores, _ = self._tag_predictions[tag_type]
+            return tag_ids, scores
+        return None
 
-            tag: Label = token.get_tag(label_type)
-            tag_value = tag.value
+    def get_span_predictions(self, tag_type: str, min_score=-1) -> List[Tuple[int, int, str, float]]:
+        """
+        Returns the spans of the given tag type as (start, end, tag, score) tuples with token offsets and exclusive
+        end. Unlike get_spans, this reads tags predicted as arrays directly and creates no Label or Span objects.
+        """
+        if tag_type in self._tag_predictions_pending:
+            tag_ids, scores, tag_dictionary = self._tag_predictions[tag_type]
+            tag_values = [tag_dictionary.get_item_for_index(tag_id) for tag_id in tag_ids.tolist()]
+            return get_spans_from_tags(tag_values, scores.tolist(), min_score)
 
-            # non-set tags are OUT tags
-            if tag_value == "" or tag_value == "O" or tag_value == "_":
-                tag_value = "O-"
+        tags: List[Label] = [token.get_tag(tag_type) for token in self]
+        return get_spans_from_tags([tag.value for tag in tags], [tag.score for tag in tags], min_score)
 
-            # anything that is not a BIOES tag is a SINGLE tag
-            if tag_value[0:2] not in ["B-", "I-", "O-", "E-", "S-"]:
-                tag_value = "S-" + tag_value
+    def get_document_spans(self, tag_type: str, min_score=-1) -> List[Tuple[int, int, str, float]]:
+        """
+        Returns the spans of the given tag type like get_span_predictions, but as (start, end, tag, score) tuples with
+        character offsets in the document the sentence was split from (see start_pos). Requires a tokenizer that sets
+        the start positions of the tokens.
+        """
+        offset = self.start_pos if self.start_pos is not None else 0
+        return [
+            (offset + self.tokens[start].start_pos, offset + self.tokens[end - 1].end_pos, tag, score)
+            for (start, end, tag, score) in self.get_span_predictions(tag_type, min_score)
+        ]
 
-            # anything that is not OUT is IN
-            in_span = False
-            if tag_value[0:2] not in ["O-"]:
-                in_span = True
+    def _materialize_tag_predictions(self):
+        pending = self._tag_predictions_pending
+        self._tag_predictions_pending = set()
 
-            # single and begin tags start a new span
-            starts_new_span = False
-            if tag_value[0:2] in ["B-", "S-"]:
-                starts_new_span = True
+        for tag_type in pending:
+            tag_ids, scores, tag_dictionary = self._tag_predictions[tag_type]
+            for token, tag_id, score in zip(self.tokens, tag_ids.tolist(), scores.tolist()):
+                token._annotation_layers[tag_type] = [Label(tag_dictionary.get_item_for_index(tag_id), score)]
 
-            if (
-                    previous_tag_value[0:2] in ["S-"]
-                    and previous_tag_value[2:] != tag_value[2:]
-                    and in_span
-            ):
-                starts_new_span = True
-
-            if (starts_new_span or not in_span) and len(current_span) > 0:
-                scores = [t.get_labels(label_type)[0].score for t in current_span]
-                span_score = sum(scores) / len(scores)
-                if span_score > min_score:
-                    span = Span(current_span)
-                    span.add_label(
-                        label_type=label_type,
-                        value=sorted(tags.items(), key=lambda k_v: k_v[1], reverse=True)[0][0],
-                        score=span_score)
-                    spans.append(span)
-
-                current_span = []
-                tags = defaultdict(lambda: 0.0)
-
-            if in_span:
-                current_span.append(token)
-                weight = 1.1 if starts_new_span else 1.0
-                tags[tag_value[2:]] += weight
-
-            # remember previous tag
-            previous_tag_value = tag_value
-
-        if len(current_span) > 0:
-            scores = [t.get_labels(label_type)[0].score for t in current_span]
-            span_score = sum(scores) / len(scores)
-            if span_score > min_score:
-                span = Span(current_span)
-                span.add_label(
-                    label_type=label_type,
-                    value=sorted(tags.items(), key=lambda k_v: k_v[1], reverse=True)[0][0],
-                    score=span_score)
-                spans.append(span)
+    def get_tags_proba_dist(self, tag_type: str) -> Optional[np.ndarray]:
+        """
+        Returns the probability distributions over all tags for all tokens as an array of shape [tokens, tags], or
+        None if none were set. Use the tag dictionary of the model to map columns to tags.
+        """
+        if tag_type in self.tags_proba_dist:
+            return self.tags_proba_dist[tag_type][0]
+        return None
+
+    def get_label_names(self):
+        label_names = []
+        for label in self.labels:
+            label_names.append(label.value)
+        return label_names
+
+    def _add_spans_internal(self, spans: List[Span], label_type: str, min_score):
+
+        tags: List[Label] = [token.get_tag(label_type) for token in self]
+
+        for start, end, tag, score in get_spans_from_tags(
+                [tag.value for tag in tags], [tag.score for tag in tags], min_score
+        ):
+            span = Span(self.tokens[start:end])
+            span.add_label(label_type=label_type, value=tag, score=score)
+            spans.append(span)
 
         return spans
 
@@ -707,7 +845,7 @@ class Sentence(DataPoint):
 
     def set_embedding(self, name: str, vector: torch.tensor):
         device = flair.device
-        if (flair.embedding_storage_mode == "cpu") and len(self._embeddings.keys()) > 0:
+        if (flair.get_embedding_storage_mode() == "cpu") and len(self._embeddings.keys()) > 0:
             device = next(iter(self._embeddings.values())).device
         if device != vector.device:
             vector = vector.to(device)
@@ -969,7 +1107,7 @@ class Image(DataPoint):
 
     def set_embedding(self, name: str, vector: torch.tensor):
         device = flair.device
-        if (flair.embedding_storage_mode == "cpu") and len(self._embeddings.keys()) > 0:
+        if (flair.get_embedding_storage_mode() == "cpu") and len(self._embeddings.keys()) > 0:
             device = next(iter(self._embeddings.values())).device
         if device != vector.device:
             vector = vector.to(device)
@@ -1317,6 +1455,80 @@ class MultiCorpus(Corpus):
         return output
 
 
+def get_spans_from_tags(
+        tag_values: List[str], scores: List[float], min_score: float = -1
+) -> List[Tuple[int, int, str, float]]:
+    """
+    Groups a sequence of BIOES (or BIO or plain) tags into spans.
+    :param tag_values: the tag of each token
+    :param scores: the confidence of each tag
+    :param min_score: spans with an average confidence at or below this value are skipped
+    :return: list of (start, end, tag, score) tuples, with token offsets and exclusive end
+    """
+    spans = []
+
+    current_span_start = None
+    current_scores = []
+    tags = defaultdict(lambda: 0.0)
+
+    def close_span(end):
+        span_score = sum(current_scores) / len(current_scores)
+        if span_score > min_score:
+            spans.append(
+                (current_span_start, end, sorted(tags.items(), key=lambda k_v: k_v[1], reverse=True)[0][0], span_score)
+            )
+
+    previous_tag_value: str = "O"
+    for index, (tag_value, score) in enumerate(zip(tag_values, scores)):
+
+        # non-set tags are OUT tags
+        if tag_value == "" or tag_value == "O" or tag_value == "_":
+            tag_value = "O-"
+
+        # anything that is not a BIOES tag is a SINGLE tag
+        if tag_value[0:2] not in ["B-", "I-", "O-", "E-", "S-"]:
+            tag_value = "S-" + tag_value
+
+        # anything that is not OUT is IN
+        in_span = False
+        if tag_value[0:2] not in ["O-"]:
+            in_span = True
+
+        # single and begin tags start a new span
+        starts_new_span = False
+        if tag_value[0:2] in ["B-", "S-"]:
+            starts_new_span = True
+
+        if (
+                previous_tag_value[0:2] in ["S-"]
+                and previous_tag_value[2:] != tag_value[2:]
+                and in_span
+        ):
+            starts_new_span = True
+
+        if (starts_new_span or not in_span) and len(current_scores) > 0:
+            close_span(index)
+
+            current_span_start = None
+            current_scores = []
+            tags = defaultdict(lambda: 0.0)
+
+        if in_span:
+            if current_span_start is None:
+                current_span_start = index
+            current_scores.append(score)
+            weight = 1.1 if starts_new_span else 1.0
+            tags[tag_value[2:]] += weight
+
+        # remember previous tag
+        previous_tag_value = tag_value
+
+    if len(current_scores) > 0:
+        close_span(len(tag_values))
+
+    return spans
+
+
 def iob2(tags):
     """
     Check that tags have a valid IOB format.
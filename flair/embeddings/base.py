@@ -7,6 +7,7 @@ import logging
 
 import flair
 from flair.data import Sentence, Image
+from flair.training_utils import check_inference_precision, inference_autocast
 
 log = logging.getLogger("flair")
 
@@ -14,6 +15,9 @@ log = logging.getLogger("flair")
 class Embeddings(torch.nn.Module):
     """Abstract base class for all embeddings. Every new type of embedding must implement these methods."""
 
+    # "bfloat16" to compute and store the embeddings in reduced precision during inference
+    inference_precision: str = "float32"
+
     def __init__(self):
         """Set some attributes that would otherwise result in errors. Overwrite these in your embedding class."""
         if not hasattr(self, "name"):
@@ -57,10 +61,35 @@ class Embeddings(torch.nn.Module):
                     break
 
         if not everything_embedded or not self.static_embeddings:
-            self._add_embeddings_internal(sentences)
+            if self.inference_precision == "bfloat16" and not self.training:
+                with inference_autocast(self.inference_precision):
+                    self._add_embeddings_internal(sentences)
+                self._store_in_precision(sentences, torch.bfloat16)
+            else:
+                self._add_embeddings_internal(sentences)
 
         return sentences
 
+    def _store_in_precision(self, sentences: List[Sentence], dtype: torch.dtype):
+        for name in self.get_names():
+            for sentence in sentences:
+                data_points = sentence.tokens if self.embedding_type == "word-level" else [sentence]
+                for data_point in data_points:
+                    if name in data_point._embeddings:
+                        data_point._embeddings[name] = data_point._embeddings[name].to(dtype)
+
+    def set_inference_precision(self, precision: str):
+        """
+        Sets the precision in which these embeddings (and all embeddings they contain) are computed and stored
+        during inference. With "bfloat16", they are computed under bfloat16 autocast and the embeddings of tokens
+        and sentences are stored in bfloat16, which halves their memory and bandwidth. Needs torch 1.10 or newer.
+        :param precision: "float32" or "bfloat16"
+        """
+        check_inference_precision(precision)
+        for module in self.modules():
+            if isinstance(module, Embeddings):
+                module.inference_precision = precision
+
     @abstractmethod
     def _add_embeddings_internal(self, sentences: List[Sentence]) -> List[Sentence]:
         """Private method for adding embeddings to all words in a list of sentences."""
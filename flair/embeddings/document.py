@@ -1,5 +1,6 @@
 from abc import abstractmethod
 import logging
+import threading
 from typing import List, Union
 
 import torch
@@ -11,6 +12,7 @@ from flair.data import Sentence
 from flair.embeddings.base import Embeddings, ScalarMix
 from flair.embeddings.token import TokenEmbeddings, StackedEmbeddings, FlairEmbeddings
 from flair.nn import LockedDropout, WordDropout
+from flair.training_utils import inference_autocast
 
 log = logging.getLogger("flair")
 
@@ -57,6 +59,7 @@ class TransformerDocumentEmbeddings(DocumentEmbeddings):
 
         # load tokenizer and transformer model
         self.tokenizer = AutoTokenizer.from_pretrained(model)
+        self._tokenizer_lock = threading.Lock()
         config = AutoConfig.from_pretrained(model, output_hidden_states=True)
         self.model = AutoModel.from_pretrained(model, config=config)
 
@@ -112,11 +115,13 @@ class TransformerDocumentEmbeddings(DocumentEmbeddings):
             for sentence in sentences:
 
                 # tokenize and truncate to max subtokens (TODO: check better truncation strategies)
-                subtokenized_sentence = self.tokenizer.encode(sentence.to_tokenized_string(),
-                                                              add_special_tokens=True,
-                                                              max_length=self.tokenizer.model_max_length,
-                                                              truncation=True,
-                                                              )
+                # the tokenizer keeps truncation settings between calls and must not be used by several threads at once
+                with self._tokenizer_lock:
+                    subtokenized_sentence = self.tokenizer.encode(sentence.to_tokenized_string(),
+                                                                  add_special_tokens=True,
+                                                                  max_length=self.tokenizer.model_max_length,
+                                                                  truncation=True,
+                                                                  )
 
                 subtokenized_sentences.append(
                     torch.tensor(subtokenized_sentence, dtype=torch.long, device=flair.device))
@@ -175,10 +180,12 @@ class TransformerDocumentEmbeddings(DocumentEmbeddings):
     def __getstate__(self):
         state = self.__dict__.copy()
         state["tokenizer"] = None
+        state["_tokenizer_lock"] = None
         return state
 
     def __setstate__(self, d):
         self.__dict__ = d
+        self._tokenizer_lock = threading.Lock()
 
         # reload tokenizer to get around serialization issues
         model_name = self.name.split('transformer-document-')[-1]
@@ -244,28 +251,33 @@ class DocumentPoolEmbeddings(DocumentEmbeddings):
 
         self.embeddings.embed(sentences)
 
-        for sentence in sentences:
-            word_embeddings = []
-            for token in sentence.tokens:
-                word_embeddings.append(token.get_embedding().unsqueeze(0))
+        precision = self.inference_precision if not self.training else "float32"
+        with inference_autocast(precision):
+            for sentence in sentences:
+                word_embeddings = []
+                for token in sentence.tokens:
+                    word_embeddings.append(token.get_embedding().unsqueeze(0))
+
+                word_embeddings = torch.cat(word_embeddings, dim=0).to(flair.device)
 
-            word_embeddings = torch.cat(word_embeddings, dim=0).to(flair.device)
+                if self.fine_tune_mode in ["nonlinear", "linear"]:
+                    word_embeddings = self.embedding_flex(word_embeddings)
 
-            if self.fine_tune_mode in ["nonlinear", "linear"]:
-                word_embeddings = self.embedding_flex(word_embeddings)
+                if self.fine_tune_mode in ["nonlinear"]:
+                    word_embeddings = self.embedding_flex_nonlinear(word_embeddings)
+                    word_embeddings = self.embedding_flex_nonlinear_map(word_embeddings)
 
-            if self.fine_tune_mode in ["nonlinear"]:
-                word_embeddings = self.embedding_flex_nonlinear(word_embeddings)
-                word_embeddings = self.embedding_flex_nonlinear_map(word_embeddings)
+                if self.pooling == "mean":
+                    pooled_embedding = torch.mean(word_embeddings, 0)
+                elif self.pooling == "max":
+                    pooled_embedding, _ = torch.max(word_embeddings, 0)
+                elif self.pooling == "min":
+                    pooled_embedding, _ = torch.min(word_embeddings, 0)
 
-            if self.pooling == "mean":
-                pooled_embedding = torch.mean(word_embeddings, 0)
-            elif self.pooling == "max":
-                pooled_embedding, _ = torch.max(word_embeddings, 0)
-            elif self.pooling == "min":
-                pooled_embedding, _ = torch.min(word_embeddings, 0)
+                sentence.set_embedding(self.name, pooled_embedding)
 
-            sentence.set_embedding(self.name, pooled_embedding)
+        if precision == "bfloat16":
+            self._store_in_precision(sentences, torch.bfloat16)
 
     def _add_embeddings_internal(self, sentences: List[Sentence]):
         pass
@@ -425,9 +437,9 @@ class DocumentRNNEmbeddings(DocumentEmbeddings):
         if self.reproject_words:
             sentence_tensor = self.word_reprojection_map(sentence_tensor)
 
-        # push through RNN
+        # push through RNN, which autocast does not cover, so it always runs in float32
         packed = pack_padded_sequence(
-            sentence_tensor, lengths, enforce_sorted=False, batch_first=True
+            sentence_tensor.float(), lengths, enforce_sorted=False, batch_first=True
         )
         rnn_out, hidden = self.rnn(packed)
         outputs, output_lengths = pad_packed_sequence(rnn_out, batch_first=True)
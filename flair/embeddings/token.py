@@ -3,6 +3,7 @@ from abc import abstractmethod
 from pathlib import Path
 from typing import List, Union, Dict
 from collections import Counter
+from collections.abc import Mapping
 from functools import lru_cache
 
 import torch
@@ -14,6 +15,8 @@ import gensim
 import os
 import re
 import logging
+import threading
+import warnings
 import numpy as np
 
 from flair.data import Sentence, Token, Corpus, Dictionary
@@ -23,6 +26,66 @@ from flair.file_utils import cached_path, open_inside_zip
 log = logging.getLogger("flair")
 
 
+def _memory_map_vectors(vectors, source: str, vectors_file: Union[str, Path] = None):
+    """
+    Returns the gensim vectors loaded memory-mapped from vectors_file, and the path of the file. If no file is given,
+    the file the vectors were loaded from is used if it stores the matrix in a separate .npy file (like the gensim
+    files downloaded by flair), otherwise the vectors are saved to a file in the flair cache.
+    """
+    if vectors_file is None:
+        if Path(f"{source}.vectors.npy").exists():
+            vectors_file = source
+        else:
+            source_hash = hashlib.md5(str(source).encode("utf-8")).hexdigest()[:8]
+            file_name = f"{Path(source).name}-{source_hash}.gensim"
+            vectors_file = Path(flair.cache_root) / "embeddings" / "memory-mapped" / file_name
+
+    vectors_file = Path(vectors_file)
+    if not vectors_file.exists():
+        log.info(f"Saving the vectors of {source} to {vectors_file}")
+        vectors_file.parent.mkdir(parents=True, exist_ok=True)
+        vectors.save(str(vectors_file))
+
+    return type(vectors).load(str(vectors_file), mmap="r"), str(vectors_file)
+
+
+def _load_memory_mapped_vectors(vectors_type, name: str, vectors_file: str):
+    if not Path(vectors_file).exists():
+        raise ValueError(f'The memory-mapped vectors of "{name}" are not available at "{vectors_file}".')
+    return vectors_type.load(vectors_file, mmap="r")
+
+
+class _Gensim3Vocabulary(Mapping):
+    """Maps the words of gensim 3.x vectors to their rows through the vocab entries, without copying the vocab."""
+
+    def __init__(self, vocab: Dict):
+        self.vocab = vocab
+
+    def __getitem__(self, word: str) -> int:
+        return self.vocab[word].index
+
+    def get(self, word: str, default=None):
+        entry = self.vocab.get(word)
+        return default if entry is None else entry.index
+
+    def __iter__(self):
+        return iter(self.vocab)
+
+    def __len__(self) -> int:
+        return len(self.vocab)
+
+
+def _get_fallback_word_id(word: str, vocabulary: Dict[str, int]) -> int:
+    """Returns the row of the lowercase, #-digit or 0-digit form of a word, or -1 if none is in the vocabulary."""
+    lowercase = word.lower()
+    word_id = vocabulary.get(lowercase, -1)
+    if word_id < 0:
+        word_id = vocabulary.get(re.sub(r"\d", "#", lowercase), -1)
+    if word_id < 0:
+        word_id = vocabulary.get(re.sub(r"\d", "0", lowercase), -1)
+    return word_id
+
+
 class TokenEmbeddings(Embeddings):
     """Abstract base class for all token-level embeddings. Ever new type of word embedding must implement these methods."""
 
@@ -109,11 +172,13 @@ class StackedEmbeddings(TokenEmbeddings):
 class WordEmbeddings(TokenEmbeddings):
     """Standard static word embeddings, such as GloVe or FastText."""
 
-    def __init__(self, embeddings: str, field: str = None):
+    def __init__(self, embeddings: str, field: str = None, memory_mapped: bool = False):
         """
         Initializes classic word embeddings. Constructor downloads required files if not there.
         :param embeddings: one of: 'glove', 'extvec', 'crawl' or two-letter language code or custom
         If you want to use a custom embedding file, just pass the path to the embeddings as embeddings variable.
+        :param memory_mapped: if True, the vectors are memory-mapped from a file instead of being loaded, see
+        memory_map
         """
         self.embeddings = embeddings
 
@@ -185,56 +250,130 @@ class WordEmbeddings(TokenEmbeddings):
             )
         else:
             self.precomputed_word_embeddings = gensim.models.KeyedVectors.load(
-                str(embeddings)
+                str(embeddings), mmap="r" if memory_mapped else None
             )
 
         self.field = field
+        self.vectors_file = None
 
         self.__embedding_length: int = self.precomputed_word_embeddings.vector_size
         super().__init__()
 
+        if memory_mapped:
+            self.memory_map()
+
+    def memory_map(self, vectors_file: Union[str, Path] = None):
+        """
+        Memory-maps the vectors read-only from a file, so processes using the same file share their memory through
+        the page cache. Saved models reference the file instead of containing the vectors, so it must exist at the
+        same path where the models are loaded.
+        :param vectors_file: gensim file of the vectors, with the matrix in a separate .npy file. By default the
+        file the embeddings were loaded from if it is such a file, otherwise the vectors are saved to the flair cache
+        """
+        self.precomputed_word_embeddings, self.vectors_file = _memory_map_vectors(
+            self.precomputed_word_embeddings, self.name, vectors_file
+        )
+        self.__dict__["_lookup"] = None
+        self._buffers.pop("_lookup_vectors", None)
+
     @property
     def embedding_length(self) -> int:
         return self.__embedding_length
 
-    @lru_cache(maxsize=10000, typed=False)
+    # number of resolved fallbacks of unknown words that are cached
+    word_id_cache_size: int = 100000
+
     def get_cached_vec(self, word: str) -> torch.Tensor:
-        if word in self.precomputed_word_embeddings:
-            word_embedding = self.precomputed_word_embeddings[word]
-        elif word.lower() in self.precomputed_word_embeddings:
-            word_embedding = self.precomputed_word_embeddings[word.lower()]
-        elif re.sub(r"\d", "#", word.lower()) in self.precomputed_word_embeddings:
-            word_embedding = self.precomputed_word_embeddings[
-                re.sub(r"\d", "#", word.lower())
-            ]
-        elif re.sub(r"\d", "0", word.lower()) in self.precomputed_word_embeddings:
-            word_embedding = self.precomputed_word_embeddings[
-                re.sub(r"\d", "0", word.lower())
-            ]
-        else:
-            word_embedding = np.zeros(self.embedding_length, dtype="float")
+        return self._embed_words([word])[0]
 
-        word_embedding = torch.tensor(
-            word_embedding.tolist(), device=flair.device, dtype=torch.float
+    def _get_lookup(self) -> Dict:
+        """
+        Returns the vocabulary (word to row of the vectors) and the cache of resolved fallbacks. On first use, the
+        vectors are also registered as the non-persistent buffer _lookup_vectors, so they follow the device of the
+        module. Neither is stored in the state_dict or pickled, since they share the memory of
+        precomputed_word_embeddings.
+        """
+        lookup = self.__dict__.get("_lookup")
+        if lookup is None:
+            keyed_vectors = self.precomputed_word_embeddings
+            if hasattr(keyed_vectors, "key_to_index"):
+                vocabulary = keyed_vectors.key_to_index
+            else:
+                vocabulary = _Gensim3Vocabulary(keyed_vectors.vocab)
+            with warnings.catch_warnings():
+                # memory-mapped vectors are read-only, which torch warns about
+                warnings.filterwarnings("ignore", message="The given NumPy array is not writ")
+                vectors = torch.from_numpy(keyed_vectors.vectors).float()
+            self.register_buffer("_lookup_vectors", vectors.to(flair.device), persistent=False)
+            lookup = {
+                "vocabulary": vocabulary,
+                "word_ids": {},
+            }
+            self.__dict__["_lookup"] = lookup
+        return lookup
+
+    def _get_word_id(self, word: str, lookup: Dict) -> int:
+        """Returns the row of the word or of its lowercase, #-digit or 0-digit form, or -1 if none is known."""
+        vocabulary = lookup["vocabulary"]
+        word_id = vocabulary.get(word)
+        if word_id is not None:
+            return word_id
+
+        word_ids = lookup["word_ids"]
+        word_id = word_ids.get(word)
+        if word_id is not None:
+            return word_id
+
+        word_id = _get_fallback_word_id(word, vocabulary)
+
+        if len(word_ids) >= self.word_id_cache_size:
+            word_ids.clear()
+        word_ids[word] = word_id
+        return word_id
+
+    def _embed_words(self, words: List[str]) -> torch.Tensor:
+        """Returns the vectors of the words with a single lookup, zero vectors for unknown words."""
+        lookup = self._get_lookup()
+        ids = torch.tensor(
+            [self._get_word_id(word, lookup) for word in words], dtype=torch.long, device=self._lookup_vectors.device
         )
-        return word_embedding
+        known = ids >= 0
+        vectors = self._lookup_vectors[ids.clamp(min=0)]
+        vectors[~known] = 0.0
+        return vectors.to(flair.device)
 
     def _add_embeddings_internal(self, sentences: List[Sentence]) -> List[Sentence]:
 
-        for i, sentence in enumerate(sentences):
+        tokens = [token for sentence in sentences for token in sentence.tokens]
+        if not tokens:
+            return sentences
 
-            for token, token_idx in zip(sentence.tokens, range(len(sentence.tokens))):
+        if "field" not in self.__dict__ or self.field is None:
+            words = [token.text for token in tokens]
+        else:
+            words = [token.get_tag(self.field).value for token in tokens]
 
-                if "field" not in self.__dict__ or self.field is None:
-                    word = token.text
-                else:
-                    word = token.get_tag(self.field).value
+        for token, word_embedding in zip(tokens, self._embed_words(words)):
+            token.set_embedding(self.name, word_embedding)
 
-                word_embedding = self.get_cached_vec(word=word)
+        return sentences
 
-                token.set_embedding(self.name, word_embedding)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lookup"] = None
+        state["_buffers"] = {name: buffer for name, buffer in self._buffers.items() if name != "_lookup_vectors"}
+        state["_non_persistent_buffers_set"] = self._non_persistent_buffers_set - {"_lookup_vectors"}
+        # memory-mapped vectors are loaded from their file
+        if state.get("vectors_file"):
+            state["precomputed_word_embeddings"] = None
+        return state
 
-        return sentences
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if self.__dict__.get("vectors_file"):
+            self.precomputed_word_embeddings = _load_memory_mapped_vectors(
+                gensim.models.KeyedVectors, self.name, self.vectors_file
+            )
 
     def __str__(self):
         return self.name
@@ -365,6 +504,7 @@ class FlairEmbeddings(TokenEmbeddings):
                  chars_per_chunk: int = 512,
                  with_whitespace: bool = True,
                  tokenized_lm: bool = True,
+                 scripted_lm: bool = False,
                  ):
         """
         initializes contextual string embeddings using a character-level language model.
@@ -380,6 +520,12 @@ class FlairEmbeddings(TokenEmbeddings):
                  state at last character of word.
         :param tokenized_lm: Whether this lm is tokenized. Default is True, but for LMs trained over unprocessed text
                 False might be better.
+        :param scripted_lm: If True, the language model runs compiled with TorchScript (see LanguageModel.script),
+                which removes the Python overhead per chunk. The language model still runs eagerly when it is
+                fine-tuned. The compiled model is not saved with the embeddings but compiled again on first use after
+                loading (which takes about a second), since it shares the weights of the language model: a saved
+                copy would store the weights twice and would not follow later changes of the language model, e.g.
+                of its device or by Model.quantize.
         """
         super().__init__()
 
@@ -556,6 +702,7 @@ class FlairEmbeddings(TokenEmbeddings):
         self.with_whitespace: bool = with_whitespace
         self.tokenized_lm: bool = tokenized_lm
         self.chars_per_chunk: int = chars_per_chunk
+        self.scripted_lm: bool = scripted_lm
 
         # embed a dummy sentence to determine embedding_length
         dummy_sentence: Sentence = Sentence()
@@ -577,7 +724,8 @@ class FlairEmbeddings(TokenEmbeddings):
             self.chars_per_chunk = 512
 
         if not self.fine_tune:
-            pass
+            # the language model stays in eval mode, only the flag is set, which e.g. the inference precision checks
+            self.training = mode
         else:
             super(FlairEmbeddings, self).train(mode)
 
@@ -605,10 +753,17 @@ class FlairEmbeddings(TokenEmbeddings):
             start_marker = self.lm.document_delimiter if "document_delimiter" in self.lm.__dict__ else '\n'
             end_marker = " "
 
-            # get hidden states from language model
-            all_hidden_states_in_lm = self.lm.get_representation(
-                text_sentences, start_marker, end_marker, self.chars_per_chunk
-            )
+            # get hidden states from language model, fine-tuning always runs it eagerly
+            compiled_lm = self._get_compiled_lm() if not (self.fine_tune and self.training) else None
+            if compiled_lm is not None:
+                char_indices = self.lm.get_char_indices(text_sentences, start_marker, end_marker)
+                all_hidden_states_in_lm = compiled_lm(
+                    char_indices.to(flair.device, non_blocking=True), self.chars_per_chunk
+                )
+            else:
+                all_hidden_states_in_lm = self.lm.get_representation(
+                    text_sentences, start_marker, end_marker, self.chars_per_chunk
+                )
 
             if not self.fine_tune:
                 all_hidden_states_in_lm = all_hidden_states_in_lm.detach()
@@ -644,7 +799,7 @@ class FlairEmbeddings(TokenEmbeddings):
                     offset_backward -= len(token.text)
 
                     # only clone if optimization mode is 'gpu'
-                    if flair.embedding_storage_mode == "gpu":
+                    if flair.get_embedding_storage_mode() == "gpu":
                         embedding = embedding.clone()
 
                     token.set_embedding(self.name, embedding)
@@ -653,6 +808,26 @@ class FlairEmbeddings(TokenEmbeddings):
 
         return sentences
 
+    def _get_compiled_lm(self):
+        """Returns the language model compiled with TorchScript if scripted_lm is set, otherwise None."""
+        if not self.__dict__.get("scripted_lm", False):
+            return None
+
+        # the compiled model is not registered as a submodule, since it shares the weights of the language model,
+        # and it is compiled again if the RNN was replaced, e.g. by Model.quantize
+        compiled = self.__dict__.get("_compiled_lm")
+        if compiled is None or compiled[0] is not self.lm.rnn:
+            compiled = (self.lm.rnn, self.lm.script())
+            self.__dict__["_compiled_lm"] = compiled
+        return compiled[1]
+
+    def __getstate__(self):
+        # the compiled language model would store the weights of the language model a second time, so it is
+        # compiled again on first use instead (see scripted_lm)
+        state = self.__dict__.copy()
+        state["_compiled_lm"] = None
+        return state
+
     def __str__(self):
         return self.name
 
@@ -798,6 +973,7 @@ class TransformerWordEmbeddings(TokenEmbeddings):
 
         # load tokenizer and transformer model
         self.tokenizer = AutoTokenizer.from_pretrained(model, **kwargs)
+        self._tokenizer_lock = threading.Lock()
         config = AutoConfig.from_pretrained(model, output_hidden_states=True, **kwargs)
         self.model = AutoModel.from_pretrained(model, config=config, **kwargs)
 
@@ -897,46 +1073,48 @@ class TransformerWordEmbeddings(TokenEmbeddings):
         non_empty_sentences = []
         empty_sentences = []
 
-        for sentence in sentences:
-            tokenized_string = sentence.to_tokenized_string()
+        # the tokenizer keeps truncation settings between calls and must not be used by several threads at once
+        with self._tokenizer_lock:
+            for sentence in sentences:
+                tokenized_string = sentence.to_tokenized_string()
 
-            # method 1: subtokenize sentence
-            # subtokenized_sentence = self.tokenizer.encode(tokenized_string, add_special_tokens=True)
+                # method 1: subtokenize sentence
+                # subtokenized_sentence = self.tokenizer.encode(tokenized_string, add_special_tokens=True)
 
-            # method 2:
-            # transformer specific tokenization
-            subtokenized_sentence = self.tokenizer.tokenize(tokenized_string)
-            if len(subtokenized_sentence) == 0:
-                empty_sentences.append(sentence)
-                continue
-            else:
-                non_empty_sentences.append(sentence)
+                # method 2:
+                # transformer specific tokenization
+                subtokenized_sentence = self.tokenizer.tokenize(tokenized_string)
+                if len(subtokenized_sentence) == 0:
+                    empty_sentences.append(sentence)
+                    continue
+                else:
+                    non_empty_sentences.append(sentence)
 
-            token_subtoken_lengths = self.reconstruct_tokens_from_subtokens(sentence, subtokenized_sentence)
-            subtokenized_sentences_token_lengths.append(token_subtoken_lengths)
+                token_subtoken_lengths = self.reconstruct_tokens_from_subtokens(sentence, subtokenized_sentence)
+                subtokenized_sentences_token_lengths.append(token_subtoken_lengths)
 
-            subtoken_ids_sentence = self.tokenizer.convert_tokens_to_ids(subtokenized_sentence)
+                subtoken_ids_sentence = self.tokenizer.convert_tokens_to_ids(subtokenized_sentence)
 
-            nr_sentence_parts = 0
+                nr_sentence_parts = 0
 
-            while subtoken_ids_sentence:
-                nr_sentence_parts += 1
-                encoded_inputs = self.tokenizer.encode_plus(subtoken_ids_sentence,
-                                                            max_length=self.max_subtokens_sequence_length,
-                                                            stride=self.stride,
-                                                            return_overflowing_tokens=self.allow_long_sentences,
-                                                            truncation=True,
-                                                            )
+                while subtoken_ids_sentence:
+                    nr_sentence_parts += 1
+                    encoded_inputs = self.tokenizer.encode_plus(subtoken_ids_sentence,
+                                                                max_length=self.max_subtokens_sequence_length,
+                                                                stride=self.stride,
+                                                                return_overflowing_tokens=self.allow_long_sentences,
+                                                                truncation=True,
+                                                                )
 
-                subtoken_ids_split_sentence = encoded_inputs['input_ids']
-                subtokenized_sentences.append(torch.tensor(subtoken_ids_split_sentence, dtype=torch.long))
+                    subtoken_ids_split_sentence = encoded_inputs['input_ids']
+                    subtokenized_sentences.append(torch.tensor(subtoken_ids_split_sentence, dtype=torch.long))
 
-                if 'overflowing_tokens' in encoded_inputs:
-                    subtoken_ids_sentence = encoded_inputs['overflowing_tokens']
-                else:
-                    subtoken_ids_sentence = None
+                    if 'overflowing_tokens' in encoded_inputs:
+                        subtoken_ids_sentence = encoded_inputs['overflowing_tokens']
+                    else:
+                        subtoken_ids_sentence = None
 
-            sentence_parts_lengths.append(nr_sentence_parts)
+                sentence_parts_lengths.append(nr_sentence_parts)
 
         # empty sentences get zero embeddings
         for sentence in empty_sentences:
@@ -1104,10 +1282,10 @@ class TransformerWordEmbeddings(TokenEmbeddings):
         return token_subtoken_lengths
 
     def train(self, mode=True):
-        # if fine-tuning is not enabled (i.e. a "feature-based approach" used), this
-        # module should never be in training mode
+        # if fine-tuning is not enabled (i.e. a "feature-based approach" used), the
+        # model should never be in training mode, only the flag of this module is set
         if not self.fine_tune:
-            pass
+            self.training = mode
         else:
             super().train(mode)
 
@@ -1128,10 +1306,12 @@ class TransformerWordEmbeddings(TokenEmbeddings):
     def __getstate__(self):
         state = self.__dict__.copy()
         state["tokenizer"] = None
+        state["_tokenizer_lock"] = None
         return state
 
     def __setstate__(self, d):
         self.__dict__ = d
+        self._tokenizer_lock = threading.Lock()
 
         # reload tokenizer to get around serialization issues
         model_name = self.name.split('transformer-word-')[-1]
@@ -1144,13 +1324,14 @@ class TransformerWordEmbeddings(TokenEmbeddings):
 class FastTextEmbeddings(TokenEmbeddings):
     """FastText Embeddings with oov functionality"""
 
-    def __init__(self, embeddings: str, use_local: bool = True, field: str = None):
+    def __init__(self, embeddings: str, use_local: bool = True, field: str = None, memory_mapped: bool = False):
         """
         Initializes fasttext word embeddings. Constructor downloads required embedding file and stores in cache
         if use_local is False.
 
         :param embeddings: path to your embeddings '.bin' file
         :param use_local: set this to False if you are using embeddings from a remote source
+        :param memory_mapped: if True, the vectors are memory-mapped from a file in the flair cache, see memory_map
         """
 
         cache_dir = Path("embeddings")
@@ -1176,8 +1357,36 @@ class FastTextEmbeddings(TokenEmbeddings):
         self.__embedding_length: int = self.precomputed_word_embeddings.vector_size
 
         self.field = field
+        self.vectors_file = None
         super().__init__()
 
+        if memory_mapped:
+            self.memory_map()
+
+    def memory_map(self, vectors_file: Union[str, Path] = None):
+        """
+        Memory-maps the word and n-gram vectors read-only from a file, see WordEmbeddings.memory_map.
+        :param vectors_file: gensim file of the FastText model, by default a file in the flair cache
+        """
+        self.precomputed_word_embeddings, self.vectors_file = _memory_map_vectors(
+            self.precomputed_word_embeddings, self.name, vectors_file
+        )
+        self.get_cached_vec.cache_clear()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # memory-mapped vectors are loaded from their file
+        if state.get("vectors_file"):
+            state["precomputed_word_embeddings"] = None
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if self.__dict__.get("vectors_file"):
+            self.precomputed_word_embeddings = _load_memory_mapped_vectors(
+                gensim.models.FastText, self.name, self.vectors_file
+            )
+
     @property
     def embedding_length(self) -> int:
         return self.__embedding_length
@@ -1381,13 +1590,32 @@ class HashEmbeddings(TokenEmbeddings):
 
 
 class MuseCrosslingualEmbeddings(TokenEmbeddings):
-    def __init__(self,):
+    def __init__(self, memory_mapped: bool = False):
+        """
+        Initializes MUSE crosslingual embeddings, which load the vectors of each language on first use.
+        :param memory_mapped: if True, the vectors are memory-mapped from the downloaded files instead of being
+        loaded, and not stored in saved models, see WordEmbeddings.memory_map
+        """
         self.name: str = f"muse-crosslingual"
         self.static_embeddings = True
         self.__embedding_length: int = 300
         self.language_embeddings = {}
+        self.memory_mapped = memory_mapped
         super().__init__()
 
+    def memory_map(self):
+        """Memory-maps the vectors of all languages from the downloaded files, see WordEmbeddings.memory_map."""
+        self.memory_mapped = True
+        self.language_embeddings = {}
+        self.get_cached_vec.cache_clear()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # memory-mapped vectors are loaded from the downloaded files on first use
+        if state.get("memory_mapped", False):
+            state["language_embeddings"] = {}
+        return state
+
     @lru_cache(maxsize=10000, typed=False)
     def get_cached_vec(self, language_code: str, word: str) -> torch.Tensor:
         current_embedding_model = self.language_embeddings[language_code]
@@ -1453,9 +1681,9 @@ class MuseCrosslingualEmbeddings(TokenEmbeddings):
                 )
 
                 # load the model
-                self.language_embeddings[
-                    language_code
-                ] = gensim.models.KeyedVectors.load(str(embeddings_file))
+                self.language_embeddings[language_code] = gensim.models.KeyedVectors.load(
+                    str(embeddings_file), mmap="r" if self.__dict__.get("memory_mapped", False) else None
+                )
 
             for token, token_idx in zip(sentence.tokens, range(len(sentence.tokens))):
 
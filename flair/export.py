@@ -0,0 +1,527 @@
+import copy
+import logging
+from pathlib import Path
+from typing import List, Dict, Tuple, Union, Optional
+
+import torch
+import torch.nn.functional as F
+
+import flair
+from flair.embeddings import WordEmbeddings, DocumentPoolEmbeddings
+from flair.embeddings.token import _get_fallback_word_id
+from flair.models import SequenceTagger, TextClassifier
+from flair.models.sequence_tagger_model import START_TAG, STOP_TAG
+
+log = logging.getLogger("flair")
+
+
+def _replace_digits(word: str, replacement: str) -> str:
+    characters: List[str] = []
+    for character in word:
+        characters.append(replacement if character.isdigit() else character)
+    return "".join(characters)
+
+
+class _StaticWordEmbeddings(torch.nn.Module):
+    """
+    Looks up the vectors of WordEmbeddings, either from word IDs resolved in Python or from the token strings. For
+    token strings, the fallbacks for unknown words (lowercase, #-digit and 0-digit forms) are only the same as those
+    of WordEmbeddings for ASCII characters, since TorchScript lowercases and detects digits only in ASCII.
+    """
+
+    vocabulary: Dict[str, int]
+
+    def __init__(self, vocabulary: Dict[str, int], vectors: torch.Tensor):
+        super().__init__()
+        self.vocabulary = vocabulary
+        # the last row is the zero vector of unknown words
+        self.register_buffer("vectors", torch.cat([vectors, torch.zeros(1, vectors.size(1))]))
+
+    def _word_id(self, word: str) -> int:
+        if word in self.vocabulary:
+            return self.vocabulary[word]
+        word = word.lower()
+        if word in self.vocabulary:
+            return self.vocabulary[word]
+        hashed = _replace_digits(word, "#")
+        if hashed in self.vocabulary:
+            return self.vocabulary[hashed]
+        zeroed = _replace_digits(word, "0")
+        if zeroed in self.vocabulary:
+            return self.vocabulary[zeroed]
+        return self.vectors.size(0) - 1
+
+    def forward(self, tokens: List[List[str]], max_length: int) -> torch.Tensor:
+        unknown = self.vectors.size(0) - 1
+        ids: List[List[int]] = []
+        for sentence in tokens:
+            sentence_ids = [self._word_id(word) for word in sentence]
+            ids.append(sentence_ids + [unknown] * (max_length - len(sentence)))
+        return F.embedding(torch.tensor(ids, dtype=torch.long, device=self.vectors.device), self.vectors)
+
+    def embed_ids(self, word_ids: torch.Tensor) -> torch.Tensor:
+        """Returns the vectors of a [batch, max_length] tensor of word IDs, in which -1 marks unknown words."""
+        word_ids = word_ids.to(self.vectors.device)
+        return F.embedding(word_ids.masked_fill(word_ids < 0, self.vectors.size(0) - 1), self.vectors)
+
+    @classmethod
+    def from_embeddings(cls, embeddings: WordEmbeddings):
+        lookup = embeddings._get_lookup()
+        return cls(dict(lookup["vocabulary"]), embeddings._lookup_vectors.detach().cpu().clone())
+
+
+class _TokenEmbeddings(torch.nn.Module):
+    """
+    Builds the padded [batch, max_length, embedding_length] token embeddings of a batch. Static word embeddings are
+    looked up from the token strings, all other embeddings are passed in as tensors of shape
+    [batch, max_length, embedding_length]. The embeddings are concatenated in the order of their names, like
+    Token.get_each_embedding does.
+    """
+
+    layout_is_static: List[bool]
+    layout_index: List[int]
+    external_embedding_names: List[str]
+    external_embedding_lengths: List[int]
+
+    def __init__(self, named_embeddings: Dict[str, flair.embeddings.Embeddings]):
+        super().__init__()
+        static_embeddings = []
+        self.layout_is_static = []
+        self.layout_index = []
+        self.external_embedding_names = []
+        self.external_embedding_lengths = []
+
+        for name in sorted(named_embeddings.keys()):
+            embedding = named_embeddings[name]
+            # WordEmbeddings on another field than the token text need the tags of the tokens
+            if isinstance(embedding, WordEmbeddings) and getattr(embedding, "field", None) is None:
+                self.layout_is_static.append(True)
+                self.layout_index.append(len(static_embeddings))
+                static_embeddings.append(_StaticWordEmbeddings.from_embeddings(embedding))
+            else:
+                self.layout_is_static.append(False)
+                self.layout_index.append(len(self.external_embedding_names))
+                self.external_embedding_names.append(name)
+                self.external_embedding_lengths.append(embedding.embedding_length)
+
+        self.static_embeddings = torch.nn.ModuleList(static_embeddings)
+
+    def forward(
+            self,
+            tokens: List[List[str]],
+            external_embeddings: List[torch.Tensor],
+            word_ids: Optional[List[torch.Tensor]] = None,
+    ) -> torch.Tensor:
+        max_length = max([len(sentence) for sentence in tokens])
+
+        static: List[torch.Tensor] = []
+        lookup_index = 0
+        for lookup in self.static_embeddings:
+            if word_ids is None:
+                static.append(lookup(tokens, max_length))
+            else:
+                static.append(lookup.embed_ids(word_ids[lookup_index]))
+            lookup_index += 1
+
+        parts: List[torch.Tensor] = []
+        for is_static, index in zip(self.layout_is_static, self.layout_index):
+            if is_static:
+                parts.append(static[index])
+            else:
+                parts.append(external_embeddings[index].float())
+        return torch.cat(parts, 2)
+
+    @torch.jit.export
+    def get_vocabularies(self) -> List[Dict[str, int]]:
+        """Returns the vocabulary of each static word embedding, in the order in which word IDs are passed in."""
+        vocabularies: List[Dict[str, int]] = []
+        for lookup in self.static_embeddings:
+            vocabularies.append(lookup.vocabulary)
+        return vocabularies
+
+
+class _SequenceTaggerHead(torch.nn.Module):
+    """The layers of a SequenceTagger on top of its embeddings, decoding the best tag of each token."""
+
+    __constants__ = ["reproject_embeddings", "use_rnn", "train_initial_hidden_state", "use_crf", "id_start", "id_stop"]
+
+    def __init__(self, tagger: SequenceTagger):
+        super().__init__()
+        self.reproject_embeddings = bool(tagger.reproject_embeddings)
+        self.use_rnn = bool(tagger.use_rnn)
+        self.train_initial_hidden_state = self.use_rnn and bool(tagger.train_initial_hidden_state)
+        self.use_crf = bool(tagger.use_crf)
+
+        self.embedding2nn = copy.deepcopy(tagger.embedding2nn) if self.reproject_embeddings else torch.nn.Identity()
+        self.rnn = copy.deepcopy(tagger.rnn) if self.use_rnn else torch.nn.Identity()
+        self.linear = copy.deepcopy(tagger.linear)
+
+        if self.train_initial_hidden_state:
+            self.register_buffer("lstm_init_h", tagger.lstm_init_h.detach().clone())
+            self.register_buffer("lstm_init_c", tagger.lstm_init_c.detach().clone())
+        else:
+            self.register_buffer("lstm_init_h", torch.zeros(1))
+            self.register_buffer("lstm_init_c", torch.zeros(1))
+
+        if self.use_crf:
+            self.register_buffer("transitions", tagger.transitions.detach().clone())
+            self.id_start = tagger.tag_dictionary.get_idx_for_item(START_TAG)
+            self.id_stop = tagger.tag_dictionary.get_idx_for_item(STOP_TAG)
+        else:
+            self.register_buffer("transitions", torch.zeros(1))
+            self.id_start = 0
+            self.id_stop = 0
+
+    def forward(self, embeddings: torch.Tensor, lengths: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        sentence_tensor = embeddings
+        if self.reproject_embeddings:
+            sentence_tensor = self.embedding2nn(sentence_tensor)
+
+        if self.use_rnn:
+            packed = torch.nn.utils.rnn.pack_padded_sequence(
+                sentence_tensor, lengths.cpu(), batch_first=True, enforce_sorted=False
+            )
+            if self.train_initial_hidden_state:
+                batch_size = embeddings.size(0)
+                initial_hidden_state = (
+                    self.lstm_init_h.unsqueeze(1).repeat(1, batch_size, 1),
+                    self.lstm_init_c.unsqueeze(1).repeat(1, batch_size, 1),
+                )
+                rnn_output, _ = self.rnn(packed, initial_hidden_state)
+            else:
+                rnn_output, _ = self.rnn(packed)
+            sentence_tensor, _ = torch.nn.utils.rnn.pad_packed_sequence(
+                rnn_output, batch_first=True, total_length=embeddings.size(1)
+            )
+
+        features = self.linear(sentence_tensor)
+
+        if self.use_crf:
+            return self._viterbi_decode(features, lengths)
+
+        confidences, tag_ids = torch.max(F.softmax(features, dim=2), dim=2)
+        return confidences, tag_ids
+
+    def _viterbi_decode(self, features: torch.Tensor, lengths: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Decodes the best tag sequences like SequenceTagger._viterbi_decode."""
+        batch_size = features.size(0)
+        seq_len = features.size(1)
+        tagset_size = features.size(2)
+        device = features.device
+
+        mask = torch.arange(seq_len, device=device).unsqueeze(0) < lengths.to(device).unsqueeze(1)
+        identity = torch.arange(tagset_size, device=device).unsqueeze(0).expand(batch_size, tagset_size)
+
+        backpointers = torch.empty([batch_size, seq_len, tagset_size], dtype=torch.long, device=device)
+        backscores = torch.empty([batch_size, seq_len, tagset_size], dtype=torch.float, device=device)
+
+        forward_var = torch.full([batch_size, tagset_size], -10000.0, dtype=torch.float, device=device)
+        forward_var[:, self.id_start] = 0.0
+
+        for index in range(seq_len):
+            next_tag_var = forward_var.unsqueeze(1) + self.transitions.unsqueeze(0)
+            viterbivars_t, bptrs_t = torch.max(next_tag_var, dim=2)
+            viterbivars_t = viterbivars_t + features[:, index]
+
+            step_mask = mask[:, index].unsqueeze(1)
+            forward_var = torch.where(step_mask, viterbivars_t, forward_var)
+            backscores[:, index] = viterbivars_t
+            backpointers[:, index] = torch.where(step_mask, bptrs_t, identity)
+
+        terminal_var = forward_var + self.transitions[self.id_stop].unsqueeze(0)
+        terminal_var[:, self.id_stop] = -10000.0
+        terminal_var[:, self.id_start] = -10000.0
+        best_tag_id = terminal_var.argmax(dim=1)
+
+        best_path = torch.empty([batch_size, seq_len], dtype=torch.long, device=device)
+        best_path[:, seq_len - 1] = best_tag_id
+        for index in range(seq_len - 1, 0, -1):
+            best_tag_id = backpointers[:, index].gather(1, best_tag_id.unsqueeze(1)).squeeze(1)
+            best_path[:, index - 1] = best_tag_id
+
+        best_scores, _ = torch.max(F.softmax(backscores, dim=2), dim=2)
+        return best_scores, best_path
+
+
+class _ExportedSequenceTagger(torch.nn.Module):
+
+    model_type: str
+    external_embedding_names: List[str]
+    external_embedding_lengths: List[int]
+    labels: List[str]
+
+    def __init__(self, tagger: SequenceTagger):
+        super().__init__()
+        self.model_type = "SequenceTagger"
+        self.token_embeddings = _TokenEmbeddings(tagger.embeddings.get_named_embeddings_dict())
+        self.external_embedding_names = self.token_embeddings.external_embedding_names
+        self.external_embedding_lengths = self.token_embeddings.external_embedding_lengths
+        self.head = _SequenceTaggerHead(tagger)
+        self.labels = tagger.tag_dictionary.get_items()
+
+    def forward(
+            self,
+            tokens: List[List[str]],
+            external_embeddings: List[torch.Tensor],
+            word_ids: Optional[List[torch.Tensor]] = None,
+    ) -> Tuple[List[List[str]], List[List[float]]]:
+        """
+        Returns the tag and confidence of each token of the given non-empty sentences.
+        :param tokens: the token strings of each sentence
+        :param external_embeddings: one [batch, max_length, embedding_length] tensor for each external embedding
+        :param word_ids: one [batch, max_length] tensor of word IDs for each static word embedding, see
+        ExportedModel. If None, the words are looked up from the token strings
+        """
+        embeddings = self.token_embeddings(tokens, external_embeddings, word_ids)
+        lengths = torch.tensor([len(sentence) for sentence in tokens], dtype=torch.long)
+        return self.predict_embeddings(embeddings, lengths)
+
+    @torch.jit.export
+    def predict_embeddings(
+            self, embeddings: torch.Tensor, lengths: torch.Tensor
+    ) -> Tuple[List[List[str]], List[List[float]]]:
+        """
+        Returns the tag and confidence of each token from precomputed token embeddings.
+        :param embeddings: the embeddings of all tokens of shape [batch, max_length, embedding_length]
+        :param lengths: the number of tokens of each sentence
+        """
+        confidences, tag_ids = self.head(embeddings, lengths)
+        all_tag_ids: List[List[int]] = tag_ids.tolist()
+        all_confidences: List[List[float]] = confidences.tolist()
+        all_lengths: List[int] = lengths.tolist()
+
+        tags: List[List[str]] = []
+        scores: List[List[float]] = []
+        for index in range(len(all_lengths)):
+            length = all_lengths[index]
+            tags.append([self.labels[tag_id] for tag_id in all_tag_ids[index][:length]])
+            scores.append(all_confidences[index][:length])
+        return tags, scores
+
+
+class _ExportedTextClassifier(torch.nn.Module):
+
+    __constants__ = ["pool_tokens", "pooling", "multi_label", "multi_label_threshold"]
+
+    model_type: str
+    external_embedding_names: List[str]
+    external_embedding_lengths: List[int]
+    labels: List[str]
+
+    def __init__(self, classifier: TextClassifier):
+        super().__init__()
+        self.model_type = "TextClassifier"
+        document_embeddings = classifier.document_embeddings
+
+        # DocumentPoolEmbeddings are computed in the bundle, other document embeddings are external inputs
+        self.pool_tokens = isinstance(document_embeddings, DocumentPoolEmbeddings)
+        if self.pool_tokens:
+            self.token_embeddings = _TokenEmbeddings(document_embeddings.embeddings.get_named_embeddings_dict())
+            self.external_embedding_names = self.token_embeddings.external_embedding_names
+            self.external_embedding_lengths = self.token_embeddings.external_embedding_lengths
+            self.pooling = document_embeddings.pooling
+            if document_embeddings.fine_tune_mode == "linear":
+                self.flex = torch.nn.Sequential(copy.deepcopy(document_embeddings.embedding_flex))
+            elif document_embeddings.fine_tune_mode == "nonlinear":
+                self.flex = torch.nn.Sequential(
+                    copy.deepcopy(document_embeddings.embedding_flex),
+                    torch.nn.ReLU(),
+                    copy.deepcopy(document_embeddings.embedding_flex_nonlinear_map),
+                )
+            else:
+                self.flex = torch.nn.Sequential()
+        else:
+            self.token_embeddings = _TokenEmbeddings({})
+            self.external_embedding_names = [document_embeddings.name]
+            self.external_embedding_lengths = [document_embeddings.embedding_length]
+            self.pooling = "none"
+            self.flex = torch.nn.Sequential()
+
+        self.decoder = copy.deepcopy(classifier.decoder)
+        self.multi_label = bool(classifier.multi_label)
+        self.multi_label_threshold = float(classifier.multi_label_threshold)
+        self.labels = classifier.label_dictionary.get_items()
+
+    def forward(
+            self,
+            tokens: List[List[str]],
+            external_embeddings: List[torch.Tensor],
+            word_ids: Optional[List[torch.Tensor]] = None,
+    ) -> Tuple[List[List[str]], List[List[float]]]:
+        """
+        Returns the labels and confidences of the given non-empty sentences.
+        :param tokens: the token strings of each sentence
+        :param external_embeddings: one [batch, max_length, embedding_length] tensor for each external token
+        embedding of DocumentPoolEmbeddings, or the [batch, embedding_length] document embeddings otherwise
+        :param word_ids: one [batch, max_length] tensor of word IDs for each static word embedding, see
+        ExportedModel. If None, the words are looked up from the token strings
+        """
+        if not self.pool_tokens:
+            return self.predict_embeddings(external_embeddings[0].float())
+
+        embeddings = self.flex(self.token_embeddings(tokens, external_embeddings, word_ids))
+        lengths = torch.tensor([len(sentence) for sentence in tokens], dtype=torch.long, device=embeddings.device)
+        mask = (torch.arange(embeddings.size(1), device=embeddings.device).unsqueeze(0) < lengths.unsqueeze(1))
+        mask = mask.unsqueeze(2)
+
+        if self.pooling == "mean":
+            document_embeddings = (embeddings * mask.float()).sum(1) / lengths.unsqueeze(1).float()
+        elif self.pooling == "max":
+            document_embeddings, _ = embeddings.masked_fill(~mask, float("-inf")).max(1)
+        else:
+            document_embeddings, _ = embeddings.masked_fill(~mask, float("inf")).min(1)
+
+        return self.predict_embeddings(document_embeddings)
+
+    @torch.jit.export
+    def predict_embeddings(self, embeddings: torch.Tensor) -> Tuple[List[List[str]], List[List[float]]]:
+        """
+        Returns the labels and confidences from precomputed document embeddings.
+        :param embeddings: the document embeddings of shape [batch, embedding_length]
+        """
+        scores = self.decoder(embeddings)
+
+        labels: List[List[str]] = []
+        confidences: List[List[float]] = []
+        if self.multi_label:
+            probabilities: List[List[float]] = torch.sigmoid(scores).tolist()
+            for sentence_probabilities in probabilities:
+                sentence_labels: List[str] = []
+                sentence_confidences: List[float] = []
+                for index, probability in enumerate(sentence_probabilities):
+                    if probability > self.multi_label_threshold:
+                        sentence_labels.append(self.labels[index])
+                        sentence_confidences.append(probability)
+                labels.append(sentence_labels)
+                confidences.append(sentence_confidences)
+        else:
+            best_confidences, best_ids = torch.max(F.softmax(scores, dim=1), dim=1)
+            all_ids: List[int] = best_ids.tolist()
+            all_confidences: List[float] = best_confidences.tolist()
+            for label_id, confidence in zip(all_ids, all_confidences):
+                labels.append([self.labels[label_id]])
+                confidences.append([confidence])
+        return labels, confidences
+
+
+def export_torchscript(model: Union[SequenceTagger, TextClassifier], path: Union[str, Path]):
+    """
+    Exports a trained SequenceTagger or TextClassifier as a self-contained TorchScript bundle, which runs without
+    flair and with little Python overhead. The bundle contains the layers of the model on top of its embeddings
+    (for taggers including the CRF decoding), the tag or label dictionary, and the vectors and vocabulary of
+    WordEmbeddings, which are looked up from the token strings. All other embeddings, e.g. FlairEmbeddings or
+    transformers, are external inputs of the bundle (see the external_embedding_names of the bundle), and
+    TextClassifiers with other document embeddings than DocumentPoolEmbeddings take the document embeddings as
+    input. Load the bundle with ExportedModel, or with torch.jit.load in environments without flair. Without flair,
+    the bundle looks up WordEmbeddings from the token strings, and its fallbacks for unknown words only handle ASCII
+    characters like WordEmbeddings does, while ExportedModel resolves the word IDs in Python.
+    :param model: the model to export, which must not be quantized
+    :param path: the file the bundle is written to
+    :return: the scripted bundle
+    """
+    if model.quantization:
+        raise ValueError("Quantized models cannot be exported, export the model before quantizing it.")
+
+    if type(model) is SequenceTagger:
+        bundle = _ExportedSequenceTagger(model)
+    elif type(model) is TextClassifier:
+        bundle = _ExportedTextClassifier(model)
+    else:
+        raise ValueError(f"Only SequenceTagger and TextClassifier can be exported, not {type(model).__name__}")
+
+    # the bundle holds copies of the layers, which run in float32 on CPU
+    scripted = torch.jit.script(bundle.cpu().float().eval())
+    torch.jit.save(scripted, str(path))
+
+    if scripted.external_embedding_names:
+        log.info(f"Exported {path} with the external embeddings {list(scripted.external_embedding_names)}")
+    return scripted
+
+
+class ExportedModel:
+    """
+    Runs a bundle written by export_torchscript.
+
+    >>> model = ExportedModel("tagger.pt")
+    >>> model.predict(["I love Berlin ."])
+    [{'tokens': ['I', 'love', 'Berlin', '.'], 'labels': ['O', 'O', 'S-LOC', 'O'], 'scores': [...]}]
+    """
+
+    def __init__(self, path: Union[str, Path], device: str = "cpu"):
+        self.module = torch.jit.load(str(path), map_location=device)
+        self.model_type: str = self.module.model_type
+        self.external_embedding_names: List[str] = list(self.module.external_embedding_names)
+        # word IDs are resolved in Python, since TorchScript lowercases and detects digits only in ASCII
+        self.vocabularies: List[Dict[str, int]] = self.module.token_embeddings.get_vocabularies()
+
+    def _get_word_ids(self, tokens: List[List[str]], vocabulary: Dict[str, int]) -> torch.Tensor:
+        """Returns the [batch, max_length] word IDs of the tokens like WordEmbeddings, with -1 for unknown words."""
+        max_length = max(len(sentence_tokens) for sentence_tokens in tokens)
+        word_ids = []
+        for sentence_tokens in tokens:
+            sentence_ids = [
+                vocabulary[word] if word in vocabulary else _get_fallback_word_id(word, vocabulary)
+                for word in sentence_tokens
+            ]
+            word_ids.append(sentence_ids + [-1] * (max_length - len(sentence_tokens)))
+        return torch.tensor(word_ids, dtype=torch.long)
+
+    def predict(
+            self,
+            sentences: List[Union[str, List[str]]],
+            external_embeddings: Optional[List[torch.Tensor]] = None,
+    ) -> List[Dict]:
+        """
+        Predicts the tags or labels of the given sentences.
+        :param sentences: sentences as lists of tokens, or as strings that are split at whitespace
+        :param external_embeddings: one tensor for each of the external_embedding_names, with the embeddings of all
+        sentences padded to [batch, max_length, embedding_length] (or [batch, embedding_length] for the document
+        embeddings of a TextClassifier)
+        :return: a dictionary with the tokens, labels and scores of each sentence
+        """
+        tokens = [sentence.split() if isinstance(sentence, str) else list(sentence) for sentence in sentences]
+        external_embeddings = list(external_embeddings or [])
+        if len(external_embeddings) != len(self.external_embedding_names):
+            raise ValueError(
+                f"Expected the external embeddings {self.external_embedding_names}, "
+                f"got {len(external_embeddings)} tensors"
+            )
+
+        # empty sentences get no predictions
+        results = [{"tokens": sentence_tokens, "labels": [], "scores": []} for sentence_tokens in tokens]
+        keep = [index for index, sentence_tokens in enumerate(tokens) if sentence_tokens]
+        if not keep:
+            return results
+        kept_tokens = [tokens[index] for index in keep]
+        if len(keep) < len(tokens):
+            external_embeddings = [embedding[keep] for embedding in external_embeddings]
+
+        # token embeddings are cut to the longest of the remaining sentences, document embeddings have no length
+        max_length = max(len(sentence_tokens) for sentence_tokens in kept_tokens)
+        external_embeddings = [
+            embedding[:, :max_length] if embedding.dim() == 3 else embedding for embedding in external_embeddings
+        ]
+
+        word_ids = [self._get_word_ids(kept_tokens, vocabulary) for vocabulary in self.vocabularies]
+
+        with torch.no_grad():
+            labels, scores = self.module(kept_tokens, external_embeddings, word_ids)
+
+        for index, sentence_labels, sentence_scores in zip(keep, labels, scores):
+            results[index]["labels"] = sentence_labels
+            results[index]["scores"] = sentence_scores
+        return results
+
+    def predict_embeddings(
+            self, embeddings: torch.Tensor, lengths: Optional[List[int]] = None
+    ) -> Tuple[List[List[str]], List[List[float]]]:
+        """
+        Predicts from precomputed embeddings, see the predict_embeddings method of the exported bundles.
+        :param embeddings: [batch, max_length, embedding_length] token embeddings for a SequenceTagger, or
+        [batch, embedding_length] document embeddings for a TextClassifier
+        :param lengths: the number of tokens of each sentence, only for a SequenceTagger
+        """
+        with torch.no_grad():
+            if self.model_type == "SequenceTagger":
+                return self.module.predict_embeddings(embeddings, torch.tensor(lengths, dtype=torch.long))
+            return self.module.predict_embeddings(embeddings)
@@ -1,14 +1,25 @@
+import asyncio
+import hashlib
 import logging
+import os
 import pickle
 import re
 import shutil
 import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
 from pathlib import Path
+from typing import List, Union, Dict, Tuple, Optional
 import numpy as np
 import torch
 from tqdm import tqdm
 
 import flair
+from flair.data import Sentence, Token, Dictionary
 from flair.embeddings import WordEmbeddings
 
 # this is the default init size of a lmdb database for embeddings
@@ -133,6 +144,8 @@ class WordEmbeddingsStore:
             if type(embedding) == WordEmbeddings:
                 WordEmbeddingsStore(embedding, backend)
                 del embedding.precomputed_word_embeddings
+                embedding.__dict__.pop("_lookup", None)
+                embedding._buffers.pop("_lookup_vectors", None)
 
     @staticmethod
     def load_stores(model, backend='sqlite'):
@@ -294,3 +307,692 @@ class LmdbWordEmbeddingsStoreBackend(WordEmbeddingsStoreBackend):
             logger.warning("-" * 100)
             word_vector = np.zeros((self.k,), dtype=np.float32)
         return word_vector
+
+
+class PredictionCache:
+    """
+    Caches the predictions of SequenceTaggers, MultiTaggers and TextClassifiers by the content of each sentence.
+
+    Sentences are keyed by a hash of their tokenized text, the identity of the model and the prediction options.
+    Duplicate sentences within a call are predicted once and the labels are copied to the other copies. The
+    predictions of up to max_size sentences are kept across calls and evicted in least-recently-used order.
+    The cache assumes that the models do not change, call clear() after training or modifying a model.
+
+    >>> from flair.inference_utils import PredictionCache
+    >>> cache = PredictionCache(max_size=100000)
+    >>> cache.predict(tagger, sentences, mini_batch_size=32)
+    >>> print(cache.hits, cache.misses)
+    """
+
+    def __init__(self, max_size: int = 10000):
+        """
+        :param max_size: maximum number of sentences whose predictions are kept across calls
+        """
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        # ids of the models are only valid while the models exist, so each model gets a token of its own
+        self._model_tokens: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._next_model_token = count()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests > 0 else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Removes all cached predictions and resets the statistics."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def predict(self, model, sentences: Union[List[Sentence], Sentence], mini_batch_size: int = None, **predict_kwargs):
+        """
+        Predicts the sentences with the model like its predict method. Only sentences whose predictions are not
+        cached are passed to the model, each distinct sentence once.
+        :param model: a SequenceTagger, MultiTagger or TextClassifier
+        :param sentences: a Sentence or a List of Sentence
+        :param mini_batch_size: mini batch size used by the model, by default the one of its inference settings
+        :param predict_kwargs: further arguments passed to the predict method of the model, e.g. label_name
+        """
+        if predict_kwargs.get("return_loss", False):
+            raise ValueError("Losses cannot be computed for cached predictions.")
+
+        if isinstance(sentences, Sentence):
+            sentences = [sentences]
+
+        label_names = _label_names(model, predict_kwargs)
+
+        # options that do not change the predictions are not part of the key
+        options = tuple(
+            sorted((key, repr(value)) for key, value in predict_kwargs.items()
+                   if key not in ["verbose", "embedding_storage_mode", "num_threads"])
+        )
+        if model not in self._model_tokens:
+            self._model_tokens[model] = next(self._next_model_token)
+        model_key = (type(model).__name__, self._model_tokens[model], options)
+
+        # group the sentences that are not cached by their key
+        uncached: Dict[Tuple, List[Sentence]] = OrderedDict()
+        for sentence in sentences:
+            key = model_key + (hashlib.sha1(sentence.to_tokenized_string().encode("utf-8")).hexdigest(),)
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                _restore_predictions(self._entries[key], sentence)
+                self.hits += 1
+            elif key in uncached:
+                uncached[key].append(sentence)
+                self.hits += 1
+            else:
+                uncached[key] = [sentence]
+                self.misses += 1
+
+        if not uncached:
+            return
+
+        model.predict(
+            [duplicates[0] for duplicates in uncached.values()], mini_batch_size=mini_batch_size, **predict_kwargs
+        )
+
+        for key, duplicates in uncached.items():
+            entry = _snapshot_predictions(duplicates[0], label_names)
+            for duplicate in duplicates[1:]:
+                _restore_predictions(entry, duplicate)
+
+            self._entries[key] = entry
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+def _label_names(model, predict_kwargs) -> List[str]:
+    """Returns the label types a call of model.predict with the given arguments adds to the sentences."""
+    from flair.models import SequenceTagger, MultiTagger, TextClassifier
+
+    if isinstance(model, MultiTagger):
+        return list(model.name_to_tagger.keys())
+    if predict_kwargs.get("label_name") is not None:
+        return [predict_kwargs["label_name"]]
+    if isinstance(model, SequenceTagger):
+        return [model.tag_type]
+    if isinstance(model, TextClassifier):
+        return [model.label_type if model.label_type is not None else "label"]
+    raise ValueError(f"Models of type {type(model).__name__} are not supported.")
+
+
+def _predictions_to_dict(sentence: Sentence, label_names: List[str]) -> Dict:
+    """Returns the predicted labels and spans of the given label types in a form that can be serialized to JSON."""
+    labels = []
+    entities = []
+    for label_name in label_names:
+        for label in sentence.get_labels(label_name):
+            labels.append({"type": label_name, **label.to_dict()})
+        for span in sentence.get_spans(label_name):
+            entities.append(
+                {
+                    "type": label_name,
+                    "text": span.to_original_text(),
+                    "start_pos": span.start_pos,
+                    "end_pos": span.end_pos,
+                    "labels": [label.to_dict() for label in span.labels],
+                }
+            )
+    return {"text": sentence.to_original_text(), "labels": labels, "entities": entities}
+
+
+def _snapshot_predictions(sentence: Sentence, label_names: List[str]) -> Dict:
+    """Returns the predictions of the given label types in a sentence in a form that can be pickled."""
+    entry = {}
+    for label_name in label_names:
+        layer = {
+            "labels": [(label.value, label.score) for label in sentence.get_labels(label_name)],
+            "proba_dist": sentence.tags_proba_dist.get(label_name),
+        }
+
+        # array-backed tag predictions are copied as arrays, without creating token labels
+        if label_name in sentence._tag_predictions_pending:
+            layer["tag_predictions"] = sentence._tag_predictions[label_name]
+        else:
+            layer["token_labels"] = [
+                [(label.value, label.score) for label in token.get_labels(label_name)] for token in sentence
+            ]
+
+        entry[label_name] = layer
+    return entry
+
+
+def _restore_predictions(entry: Dict, sentence: Sentence):
+    """Replaces the predictions of a sentence for the label types of an entry taken with _snapshot_predictions."""
+    for label_name, layer in entry.items():
+        # earlier labels are removed also if the cached prediction has no labels
+        sentence.remove_labels(label_name)
+        sentence.tags_proba_dist.pop(label_name, None)
+        sentence._tag_predictions.pop(label_name, None)
+        sentence._tag_predictions_pending.discard(label_name)
+        for token in sentence:
+            token._annotation_layers.pop(label_name, None)
+            token.tags_proba_dist.pop(label_name, None)
+            token._invalidate_label_tensors(label_name)
+
+        for value, score in layer["labels"]:
+            sentence.add_label(label_name, value, score)
+
+        if "tag_predictions" in layer:
+            sentence.add_tag_predictions(label_name, *layer["tag_predictions"])
+        else:
+            for token, token_labels in zip(sentence, layer["token_labels"]):
+                for index, (value, score) in enumerate(token_labels):
+                    if index == 0:
+                        token.set_label(label_name, value, score)
+                    else:
+                        token.add_label(label_name, value, score)
+
+        if layer["proba_dist"] is not None:
+            sentence.add_tags_proba_dist(label_name, *layer["proba_dist"])
+
+
+# models of the running MultiProcessPredictors, inherited by forked workers
+_worker_models: Dict[int, object] = {}
+_worker_model = None
+
+
+def _init_worker(model_key: int, model, num_threads: int):
+    global _worker_model
+    _worker_model = model if model is not None else _worker_models[model_key]
+    torch.set_num_threads(num_threads)
+
+
+def _tag_dictionaries(model) -> List[Dictionary]:
+    """Returns the tag dictionaries of a model, in the same order in the main process and in the workers."""
+    taggers = list(model.name_to_tagger.values()) if hasattr(model, "name_to_tagger") else [model]
+    return [tagger.tag_dictionary for tagger in taggers if hasattr(tagger, "tag_dictionary")]
+
+
+def _map_dictionaries(entry: Dict, map_dictionary):
+    """Replaces the dictionaries of the tag arrays in an entry taken with _snapshot_predictions."""
+    for layer in entry.values():
+        if "tag_predictions" in layer:
+            tag_ids, scores, tag_dictionary = layer["tag_predictions"]
+            layer["tag_predictions"] = (tag_ids, scores, map_dictionary(tag_dictionary))
+        if layer["proba_dist"] is not None:
+            proba_dist, tag_dictionary = layer["proba_dist"]
+            layer["proba_dist"] = (proba_dist, map_dictionary(tag_dictionary))
+
+
+def _predict_shard(arguments) -> List[Dict]:
+    sentences, label_names, mini_batch_size, predict_kwargs = arguments
+    _worker_model.predict(sentences, mini_batch_size=mini_batch_size, **predict_kwargs)
+
+    # the dictionaries of the model are sent back as their index, not pickled with every sentence
+    dictionary_indices = {id(dictionary): index for index, dictionary in enumerate(_tag_dictionaries(_worker_model))}
+    entries = [_snapshot_predictions(sentence, label_names) for sentence in sentences]
+    for entry in entries:
+        _map_dictionaries(entry, lambda dictionary: dictionary_indices.get(id(dictionary), dictionary))
+    return entries
+
+
+class MultiProcessPredictor:
+    """
+    Predicts with a SequenceTagger, MultiTagger or TextClassifier in several worker processes on CPU.
+
+    The model is loaded once in the main process. With the 'fork' start method (the default where available), the
+    workers inherit it and share its weights copy-on-write. With 'spawn', the weights are moved to shared memory.
+    Sentences are sorted by length, split into shards of similar length and predicted by the workers, and the
+    predictions are added to the sentences in the main process.
+
+    >>> from flair.inference_utils import MultiProcessPredictor
+    >>> tagger = SequenceTagger.load("ner-fast")
+    >>> with MultiProcessPredictor(tagger, num_workers=8) as predictor:
+    >>>     predictor.predict(sentences, mini_batch_size=32)
+    """
+
+    def __init__(self, model, num_workers: int = None, threads_per_worker: int = 1, start_method: str = None):
+        """
+        :param model: a SequenceTagger, MultiTagger or TextClassifier
+        :param num_workers: number of worker processes, the number of CPUs by default
+        :param threads_per_worker: number of threads each worker uses for torch operations
+        :param start_method: 'fork' or 'spawn', defaults to 'fork' where available
+        """
+        import torch.multiprocessing as mp
+
+        if flair.device.type != "cpu":
+            raise ValueError("MultiProcessPredictor predicts on CPU, set flair.device to 'cpu' before loading models.")
+
+        if start_method is None:
+            start_method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+
+        # a MultiTagger holds several taggers
+        modules = list(model.name_to_tagger.values()) if hasattr(model, "name_to_tagger") else [model]
+        for module in modules:
+            module.eval()
+
+        self.model = model
+        self.num_workers = num_workers if num_workers is not None else os.cpu_count()
+        self.threads_per_worker = threads_per_worker
+
+        if start_method == "fork":
+            _worker_models[id(model)] = model
+            initargs = (id(model), None, threads_per_worker)
+        else:
+            for module in modules:
+                module.share_memory()
+            initargs = (id(model), model, threads_per_worker)
+
+        self._pool = mp.get_context(start_method).Pool(self.num_workers, initializer=_init_worker, initargs=initargs)
+
+    def predict(
+        self,
+        sentences: Union[List[Sentence], Sentence],
+        mini_batch_size: int = None,
+        shard_size: int = None,
+        **predict_kwargs,
+    ):
+        """
+        Predicts the sentences in the worker processes. The predictions are directly added to the sentences. The
+        embeddings of the sentences are cleared, since they are not sent to the workers.
+        :param sentences: a Sentence or a List of Sentence
+        :param mini_batch_size: mini batch size used by the workers, by default the one of the inference settings of
+        the model, or 32
+        :param shard_size: number of sentences sent to a worker at once, 4 mini-batches by default
+        :param predict_kwargs: further arguments passed to the predict method of the model, e.g. label_name
+        """
+        if predict_kwargs.get("return_loss", False):
+            raise ValueError("Losses cannot be computed by MultiProcessPredictor.")
+
+        if isinstance(sentences, Sentence):
+            sentences = [sentences]
+
+        if mini_batch_size is None:
+            mini_batch_size = (self.model.inference_settings or {}).get("mini_batch_size", 32)
+        if shard_size is None:
+            shard_size = 4 * mini_batch_size
+
+        label_names = _label_names(self.model, predict_kwargs)
+
+        # shards of sentences with similar length need little padding
+        order = sorted(range(len(sentences)), key=lambda index: len(sentences[index]), reverse=True)
+        shards = [order[start:start + shard_size] for start in range(0, len(order), shard_size)]
+
+        # embeddings are not sent to the workers
+        for sentence in sentences:
+            sentence.clear_embeddings()
+
+        arguments = (
+            ([sentences[index] for index in shard], label_names, mini_batch_size, predict_kwargs) for shard in shards
+        )
+
+        dictionaries = _tag_dictionaries(self.model)
+
+        for shard, entries in zip(shards, self._pool.imap(_predict_shard, arguments)):
+            for index, entry in zip(shard, entries):
+                _map_dictionaries(entry, lambda item: dictionaries[item] if isinstance(item, int) else item)
+                _restore_predictions(entry, sentences[index])
+
+    def close(self):
+        """Stops the worker processes."""
+        self._pool.close()
+        self._pool.join()
+        _worker_models.pop(id(self.model), None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncPredictor:
+    """
+    Predicts with a SequenceTagger, MultiTagger or TextClassifier from concurrent asyncio tasks in micro-batches.
+
+    Each call of apredict queues its sentences. A background task collects queued requests into a micro-batch of
+    up to max_batch_size sentences, waiting at most max_wait_time seconds after the first request for more to
+    arrive. The micro-batch is predicted in a dedicated executor thread, so the event loop is not blocked, and the
+    request futures are resolved once the predictions are added to the sentences.
+
+    >>> from flair.inference_utils import AsyncPredictor
+    >>> predictor = AsyncPredictor(tagger, max_batch_size=32, max_wait_time=0.005)
+    >>> sentence = await predictor.apredict(Sentence("I love Berlin"))
+    >>> await predictor.close()
+    """
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_time: float = 0.005, **predict_kwargs):
+        """
+        :param model: a SequenceTagger, MultiTagger or TextClassifier
+        :param max_batch_size: maximum number of sentences in a micro-batch. A request with more sentences is
+        predicted on its own
+        :param max_wait_time: maximum time in seconds a request waits for further requests to share its micro-batch
+        :param predict_kwargs: further arguments passed to the predict method of the model, e.g. label_name
+        """
+        if predict_kwargs.get("return_loss", False):
+            raise ValueError("Losses cannot be computed by AsyncPredictor.")
+
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.predict_kwargs = predict_kwargs
+
+        # all micro-batches run in the same thread, one after another
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._queue: asyncio.Queue = None
+        self._batcher: asyncio.Future = None
+        self._next_request = None
+        self._in_flight = []
+
+    async def apredict(self, sentences: Union[List[Sentence], Sentence]) -> Union[List[Sentence], Sentence]:
+        """
+        Queues the sentences for prediction and returns them once the predictions are added.
+        :param sentences: a Sentence or a List of Sentence
+        """
+        batch = [sentences] if isinstance(sentences, Sentence) else sentences
+        if not batch:
+            return sentences
+
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.ensure_future(self._run())
+
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((batch, future))
+        await future
+        return sentences
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            requests = [await self._get_request()]
+            size = len(requests[0][0])
+
+            deadline = loop.time() + self.max_wait_time
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._get_request(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+                # a request that does not fit starts the next micro-batch
+                if size + len(request[0]) > self.max_batch_size:
+                    self._next_request = request
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            # requests that were cancelled while waiting are not predicted
+            requests = [request for request in requests if not request[1].done()]
+            if not requests:
+                continue
+
+            self._in_flight = requests
+            batch = [sentence for sentences, _ in requests for sentence in sentences]
+            try:
+                await loop.run_in_executor(self._executor, self._predict, batch)
+            except Exception as error:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(error)
+            else:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_result(None)
+            self._in_flight = []
+
+    async def _get_request(self):
+        if self._next_request is not None:
+            request, self._next_request = self._next_request, None
+            return request
+        return await self._queue.get()
+
+    def _predict(self, sentences: List[Sentence]):
+        self.model.predict(sentences, mini_batch_size=self.max_batch_size, **self.predict_kwargs)
+
+    async def close(self):
+        """Stops the background task and the executor thread. Requests still waiting in the queue are cancelled."""
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+
+            pending = list(self._in_flight)
+            if self._next_request is not None:
+                pending.append(self._next_request)
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            for _, future in pending:
+                future.cancel()
+            self._next_request = None
+            self._in_flight = []
+
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+def tune_batch_size(
+    model,
+    sentences: List[Sentence],
+    batch_sizes: List[int] = None,
+    token_budgets: List[int] = None,
+    max_memory_mb: float = None,
+    repeats: int = 3,
+    apply: bool = True,
+    **predict_kwargs,
+) -> Dict:
+    """
+    Finds the mini-batch size with which a model predicts a sample of sentences fastest. The batch sizes are tried
+    in increasing order, each is timed repeats times and the fastest run counts. The search stops at the first batch
+    size that runs out of memory or whose peak memory exceeds max_memory_mb. Token budgets for predict_stream
+    (max_tokens_per_batch) are tuned in the same way if given.
+
+    With apply=True, the best settings are stored in model.inference_settings. predict and predict_stream then use
+    them if no mini-batch size or token budget is passed, and Model.save stores them with the model.
+
+    >>> from flair.inference_utils import tune_batch_size
+    >>> settings = tune_batch_size(tagger, sample_sentences, max_memory_mb=4000)
+    >>> tagger.save("tuned-tagger.pt")
+
+    :param model: a SequenceTagger, MultiTagger or TextClassifier
+    :param sentences: representative sentences, copies of them are predicted so they are not changed
+    :param batch_sizes: mini-batch sizes to try, powers of 2 from 1 to 256 by default
+    :param token_budgets: values of max_tokens_per_batch to try with predict_stream, none by default. Not
+    supported for MultiTaggers
+    :param max_memory_mb: memory cap in MB, compared to the peak allocated GPU memory during the runs of a setting if
+    flair.device is a GPU, or otherwise to the peak resident memory of the process during the runs, which is sampled
+    from /proc/self/statm. The cap is ignored on CPUs of systems without /proc/self/statm
+    :param repeats: number of timed runs per setting
+    :param apply: if True, the best settings are stored in model.inference_settings
+    :param predict_kwargs: further arguments passed to the predict method of the model, e.g. all_tag_prob
+    :return: the best settings, with the measured throughput of each tried setting under 'benchmarks'
+    """
+    if not sentences:
+        raise ValueError("Pass some sentences to tune the batch size.")
+    if token_budgets and not hasattr(model, "predict_stream"):
+        raise ValueError(f"Token budgets cannot be tuned for models of type {type(model).__name__}.")
+    for key in ["mini_batch_size", "max_tokens_per_batch", "return_loss", "verbose"]:
+        predict_kwargs.pop(key, None)
+    if max_memory_mb is not None and flair.device.type != "cuda" and _resident_memory_mb() is None:
+        logger.warning("The resident memory cannot be measured on this system, max_memory_mb is ignored.")
+
+    if batch_sizes is None:
+        batch_sizes = [2 ** exponent for exponent in range(9)]
+    # larger batches than the sample hold the same sentences
+    batch_sizes = sorted(set(min(batch_size, len(sentences)) for batch_size in batch_sizes))
+
+    def predict_in_batches(batch, batch_size):
+        model.predict(batch, mini_batch_size=batch_size, **predict_kwargs)
+
+    def predict_stream(batch, token_budget):
+        for _ in model.predict_stream(batch, max_tokens_per_batch=token_budget, window_size=len(batch),
+                                      **predict_kwargs):
+            pass
+
+    # the first run is slower, e.g. because of lazy initialization
+    predict_in_batches(_copy_sentences(sentences), batch_sizes[0])
+
+    settings = {}
+    benchmarks = []
+    for name, values, predict in [("mini_batch_size", batch_sizes, predict_in_batches),
+                                  ("max_tokens_per_batch", sorted(token_budgets or []), predict_stream)]:
+        best_throughput = 0.0
+        for value in values:
+            throughput, peak_memory_mb = _benchmark(predict, sentences, value, repeats)
+
+            if throughput is None:
+                logger.info(f"{name} {value}: out of memory")
+                break
+            if max_memory_mb is not None and peak_memory_mb is not None and peak_memory_mb > max_memory_mb:
+                logger.info(f"{name} {value}: peak memory of {peak_memory_mb:.0f} MB exceeds {max_memory_mb:.0f} MB")
+                break
+
+            logger.info(f"{name} {value}: {throughput:.1f} sentences per second")
+            benchmarks.append({name: value, "sentences_per_second": throughput, "peak_memory_mb": peak_memory_mb})
+            if throughput > best_throughput:
+                best_throughput = throughput
+                settings[name] = value
+
+        if name not in settings and values:
+            raise RuntimeError(f"No {name} could be benchmarked within the memory cap.")
+
+    if apply:
+        model.inference_settings = {**(model.inference_settings or {}), **settings}
+
+    return {**settings, "benchmarks": benchmarks}
+
+
+def _copy_sentences(sentences: List[Sentence]) -> List[Sentence]:
+    copies = []
+    for sentence in sentences:
+        copy = Sentence()
+        for token in sentence:
+            copy.add_token(Token(token.text, whitespace_after=token.whitespace_after))
+        copies.append(copy)
+    return copies
+
+
+def _resident_memory_mb() -> Optional[float]:
+    """Returns the resident memory of the process in MB, or None if /proc/self/statm is not available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _ResidentMemorySampler:
+    """Samples the resident memory of the process in a background thread and keeps the highest value."""
+
+    def __init__(self, enabled: bool = True, interval: float = 0.005):
+        self.interval = interval
+        self.peak_memory_mb = _resident_memory_mb() if enabled else None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        memory_mb = _resident_memory_mb()
+        if memory_mb is not None and memory_mb > self.peak_memory_mb:
+            self.peak_memory_mb = memory_mb
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        if self.peak_memory_mb is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.peak_memory_mb is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._sample()
+
+
+def _benchmark(predict, sentences: List[Sentence], value: int, repeats: int) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Returns the best throughput in sentences per second of repeated runs and the peak memory in MB during the runs,
+    the allocated GPU memory on GPUs and the resident memory of the process otherwise.
+    """
+    on_gpu = flair.device.type == "cuda"
+    if on_gpu:
+        torch.cuda.empty_cache()
+        torch.cuda.reset_max_memory_allocated(flair.device)
+
+    best_time = None
+    with _ResidentMemorySampler(enabled=not on_gpu) as sampler:
+        for _ in range(repeats):
+            batch = _copy_sentences(sentences)
+            try:
+                start = time.time()
+                predict(batch, value)
+                if on_gpu:
+                    torch.cuda.synchronize(flair.device)
+                elapsed = time.time() - start
+            except RuntimeError as error:
+                if "out of memory" not in str(error):
+                    raise
+                if on_gpu:
+                    torch.cuda.empty_cache()
+                return None, None
+            best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+    if on_gpu:
+        peak_memory_mb = torch.cuda.max_memory_allocated(flair.device) / 2 ** 20
+    else:
+        peak_memory_mb = sampler.peak_memory_mb
+
+    return len(sentences) / max(best_time, 1e-9), peak_memory_mb
+
+
+def quantize_and_evaluate(
+    model, sentences, dtype: torch.dtype = torch.qint8, mini_batch_size: int = 32, num_workers: int = 8
+) -> Dict:
+    """
+    Evaluates a SequenceTagger or TextClassifier, quantizes it in place with Model.quantize and evaluates it again,
+    to show how much accuracy quantization costs and how much time it saves.
+
+    >>> from flair.inference_utils import quantize_and_evaluate
+    >>> report = quantize_and_evaluate(tagger, corpus.dev)
+    >>> print(report["delta"])
+    >>> tagger.save("quantized-tagger.pt")
+
+    :param model: the model on CPU, it is quantized when the function returns
+    :param sentences: the sentences to evaluate on, e.g. corpus.dev
+    :param dtype: the dtype passed to Model.quantize
+    :return: main score and evaluation time of the model before and after quantization, and the change of the score
+    """
+    start = time.time()
+    result, _ = model.evaluate(sentences, mini_batch_size=mini_batch_size, num_workers=num_workers)
+    seconds = time.time() - start
+
+    model.quantize(dtype)
+
+    start = time.time()
+    quantized_result, _ = model.evaluate(sentences, mini_batch_size=mini_batch_size, num_workers=num_workers)
+    quantized_seconds = time.time() - start
+
+    report = {
+        "main_score": result.main_score,
+        "quantized_main_score": quantized_result.main_score,
+        "delta": quantized_result.main_score - result.main_score,
+        "seconds": seconds,
+        "quantized_seconds": quantized_seconds,
+    }
+    logger.info(
+        f"Quantization changed the main score from {result.main_score:.4f} to {quantized_result.main_score:.4f} "
+        f"and the evaluation time from {seconds:.1f}s to {quantized_seconds:.1f}s"
+    )
+    return report
@@ -0,0 +1,161 @@
+import logging
+from typing import List, Union, Optional, Callable
+
+from flair.data import Sentence
+from flair.models.sequence_tagger_model import SequenceTagger
+from flair.models.text_classification_model import TextClassifier
+
+log = logging.getLogger("flair")
+
+
+class CascadeModel:
+    """
+    Predicts with a fast model first and passes only the sentences the fast model is not confident about to a
+    second, more accurate model. Both models must predict the same task, i.e. both are SequenceTaggers or both
+    are TextClassifiers. The stage that produced the predictions of a sentence is added to the sentence as a label
+    of type stage_label_name, with value 'fast' or 'accurate' and the confidence of the fast model as score.
+    """
+
+    FAST_STAGE: str = "fast"
+    ACCURATE_STAGE: str = "accurate"
+
+    def __init__(
+            self,
+            fast_model: Union[SequenceTagger, TextClassifier],
+            accurate_model: Union[SequenceTagger, TextClassifier],
+            criterion: Union[str, Callable[[Sentence, str], float]] = "token",
+            threshold: float = 0.9,
+            label_name: Optional[str] = None,
+            stage_label_name: Optional[str] = None,
+    ):
+        """
+        Initializes a CascadeModel
+        :param fast_model: model that predicts all sentences
+        :param accurate_model: model that predicts the sentences on which the fast model is not confident
+        :param criterion: how the confidence of the fast model in a sentence is computed. 'token' is the lowest
+        score of a predicted tag, 'span' the lowest score of a predicted span (both for SequenceTaggers) and 'label'
+        the lowest score of a predicted class (for TextClassifiers). Can also be a function that gets the sentence
+        and the label name and returns the confidence.
+        :param threshold: sentences on which the fast model has a lower confidence are passed to the accurate model
+        :param label_name: name of the label type the predictions are added as. Defaults to the label type of the
+        fast model
+        :param stage_label_name: name of the label type the stage is added as. Defaults to label_name + '-stage'
+        """
+
+        if isinstance(fast_model, SequenceTagger) != isinstance(accurate_model, SequenceTagger):
+            raise ValueError(
+                f"Fast and accurate model must be of the same type, "
+                f"but are {type(fast_model).__name__} and {type(accurate_model).__name__}."
+            )
+
+        if criterion in ["token", "span"] and not isinstance(fast_model, SequenceTagger):
+            raise ValueError(f"Criterion '{criterion}' is only available for SequenceTaggers.")
+        if criterion == "label" and not isinstance(fast_model, TextClassifier):
+            raise ValueError(f"Criterion '{criterion}' is only available for TextClassifiers.")
+        if isinstance(criterion, str) and criterion not in ["token", "span", "label"]:
+            raise ValueError(f"Unknown criterion '{criterion}', use 'token', 'span', 'label' or a function.")
+
+        self.fast_model = fast_model
+        self.accurate_model = accurate_model
+        self.criterion = criterion
+        self.threshold = threshold
+
+        if label_name is None:
+            if isinstance(fast_model, SequenceTagger):
+                label_name = fast_model.tag_type
+            else:
+                label_name = fast_model.label_type if fast_model.label_type is not None else "label"
+        self.label_name = label_name
+
+        self.stage_label_name = stage_label_name if stage_label_name is not None else f"{label_name}-stage"
+
+    def predict(
+            self,
+            sentences: Union[List[Sentence], Sentence],
+            mini_batch_size: int = 32,
+            verbose: bool = False,
+    ):
+        """
+        Predicts all sentences with the fast model and the sentences on which it is not confident again with the
+        accurate model. The predictions are directly added to the sentences.
+        :param sentences: a Sentence or a List of Sentence
+        :param mini_batch_size: mini batch size used by both models
+        :param verbose: set to True to display a progress bar
+        """
+        if isinstance(sentences, Sentence):
+            sentences = [sentences]
+
+        self._predict_with(self.fast_model, sentences, mini_batch_size, verbose)
+
+        uncertain_sentences = []
+        uncertain_confidences = []
+        for sentence in sentences:
+            confidence = self.confidence(sentence)
+            if confidence < self.threshold:
+                uncertain_sentences.append(sentence)
+                uncertain_confidences.append(confidence)
+            else:
+                sentence.set_label(self.stage_label_name, self.FAST_STAGE, confidence)
+
+        log.debug(f"Cascading {len(uncertain_sentences)} of {len(sentences)} sentence(s) to the accurate model.")
+
+        if not uncertain_sentences:
+            return
+
+        # text classifiers append labels, so the labels of the fast model are removed first. Taggers replace them.
+        if isinstance(self.accurate_model, TextClassifier):
+            for sentence in uncertain_sentences:
+                sentence.remove_labels(self.label_name)
+
+        self._predict_with(self.accurate_model, uncertain_sentences, mini_batch_size, verbose)
+
+        for sentence, confidence in zip(uncertain_sentences, uncertain_confidences):
+            sentence.set_label(self.stage_label_name, self.ACCURATE_STAGE, confidence)
+
+    def confidence(self, sentence: Sentence) -> float:
+        """
+        Returns the confidence of the predictions in the sentence according to the criterion. Sentences without
+        predictions count as fully confident.
+        """
+        if callable(self.criterion):
+            return self.criterion(sentence, self.label_name)
+
+        if self.criterion == "token":
+            if len(sentence) == 0:
+                return 1.0
+            predictions = sentence.get_tag_predictions(self.label_name)
+            if predictions is not None:
+                return float(predictions[1].min())
+            return min(token.get_tag(self.label_name).score for token in sentence)
+
+        if self.criterion == "span":
+            if len(sentence) == 0:
+                return 1.0
+            spans = sentence.get_span_predictions(self.label_name)
+            return min([score for (_, _, _, score) in spans], default=1.0)
+
+        return min([label.score for label in sentence.get_labels(self.label_name)], default=1.0)
+
+    def _predict_with(
+            self,
+            model: Union[SequenceTagger, TextClassifier],
+            sentences: List[Sentence],
+            mini_batch_size: int,
+            verbose: bool,
+    ):
+        if isinstance(model, SequenceTagger):
+            # tags are read from the arrays to compute the confidence, labels are only created on access
+            model.predict(
+                sentences,
+                mini_batch_size=mini_batch_size,
+                verbose=verbose,
+                label_name=self.label_name,
+                lazy_labels=True,
+            )
+        else:
+            model.predict(
+                sentences,
+                mini_batch_size=mini_batch_size,
+                verbose=verbose,
+                label_name=self.label_name,
+            )
@@ -75,7 +75,9 @@ class LanguageModel(nn.Module):
         encoded = self.encoder(input)
         emb = self.drop(encoded)
 
-        self.rnn.flatten_parameters()
+        # RNNs quantized with Model.quantize have no flat weights
+        if isinstance(self.rnn, torch.nn.RNNBase):
+            self.rnn.flatten_parameters()
 
         output, hidden = self.rnn(emb, hidden)
 
@@ -162,6 +164,34 @@ class LanguageModel(nn.Module):
 
         return output
 
+    def get_char_indices(self, strings: List[str], start_marker: str, end_marker: str) -> torch.Tensor:
+        """
+        Returns the character IDs that get_representation passes to the RNN as a LongTensor of shape
+        [characters, strings]. The strings are reversed for backward language models, wrapped in the markers and
+        padded with whitespace to the longest string.
+        """
+        padded_strings = [
+            f"{start_marker}{string if self.is_forward_lm else string[::-1]}{end_marker}" for string in strings
+        ]
+        longest_padded_str: int = max(len(string) for string in padded_strings)
+
+        padding_char_index = self.dictionary.get_idx_for_item(" ")
+
+        sequences_as_char_indices: List[List[int]] = []
+        for string in padded_strings:
+            char_indices = self.dictionary.get_idx_for_items(list(string))
+            char_indices += [padding_char_index] * (longest_padded_str - len(string))
+            sequences_as_char_indices.append(char_indices)
+
+        return torch.tensor(sequences_as_char_indices, dtype=torch.long).transpose(0, 1)
+
+    def script(self) -> torch.jit.ScriptModule:
+        """
+        Compiles the RNN part of get_representation with TorchScript, see ScriptedLanguageModel. The compiled module
+        shares the weights of this language model.
+        """
+        return torch.jit.script(ScriptedLanguageModel(self))
+
     def get_output(self, text: str):
         char_indices = [self.dictionary.get_idx_for_item(char) for char in text]
         input_vector = torch.LongTensor([char_indices]).transpose(0, 1)
@@ -425,4 +455,47 @@ class LanguageModel(nn.Module):
                 setattr(child_module, "_flat_weights_names",
                         _flat_weights_names)
 
-            child_module._apply(fn)
\ No newline at end of file
+            child_module._apply(fn)
+
+
+class ScriptedLanguageModel(nn.Module):
+    """
+    The encoder, RNN and optional projection of LanguageModel.get_representation, run chunk by chunk with the hidden
+    state carried over, as a module that can be compiled with TorchScript, so no Python code runs per chunk. It shares
+    the layers of the language model and skips the decoder. The characters are mapped to IDs in Python with
+    LanguageModel.get_char_indices, since TorchScript iterates over the UTF-8 bytes of strings, not their characters.
+
+    >>> compiled_lm = language_model.script()
+    >>> hidden_states = compiled_lm(language_model.get_char_indices(strings, "\\n", " ").to(flair.device), 512)
+    """
+
+    __constants__ = ["nlayers", "hidden_size", "use_proj"]
+
+    def __init__(self, lm: LanguageModel):
+        super().__init__()
+        self.nlayers = lm.nlayers
+        self.hidden_size = lm.hidden_size
+        self.encoder = lm.encoder
+        self.rnn = lm.rnn
+        self.use_proj = lm.proj is not None
+        self.proj = lm.proj if self.use_proj else nn.Identity()
+
+    def forward(self, char_indices: torch.Tensor, chars_per_chunk: int) -> torch.Tensor:
+        """
+        Returns the same hidden states as LanguageModel.get_representation.
+        :param char_indices: character IDs of shape [characters, strings], see LanguageModel.get_char_indices
+        :param chars_per_chunk: number of characters passed to the RNN at once
+        """
+        hidden = (
+            torch.zeros([self.nlayers, char_indices.size(1), self.hidden_size], device=char_indices.device),
+            torch.zeros([self.nlayers, char_indices.size(1), self.hidden_size], device=char_indices.device),
+        )
+
+        output_parts: List[torch.Tensor] = []
+        for chunk_start in range(0, char_indices.size(0), chars_per_chunk):
+            output, hidden = self.rnn(self.encoder(char_indices[chunk_start:chunk_start + chars_per_chunk]), hidden)
+            if self.use_proj:
+                output = self.proj(output)
+            output_parts.append(output)
+
+        return torch.cat(output_parts)
@@ -1,8 +1,9 @@
 import logging
 import sys
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Union, Optional, Dict
+from typing import List, Union, Optional, Dict, Tuple, Set
 from warnings import warn
 
 import numpy as np
@@ -15,7 +16,7 @@ from torch.utils.data.dataset import Dataset
 from tqdm import tqdm
 
 import flair.nn
-from flair.data import Dictionary, Sentence, Label
+from flair.data import Dictionary, Sentence, Label, get_spans_from_tags
 from flair.datasets import SentenceDataset, DataLoader
 from flair.embeddings import TokenEmbeddings, StackedEmbeddings, Embeddings
 from flair.file_utils import cached_path, unzip_file
@@ -299,30 +300,37 @@ class SequenceTagger(flair.nn.Model):
     def predict(
             self,
             sentences: Union[List[Sentence], Sentence],
-            mini_batch_size=32,
+            mini_batch_size: int = None,
             all_tag_prob: bool = False,
             verbose: bool = False,
             label_name: Optional[str] = None,
             return_loss=False,
             embedding_storage_mode="none",
+            lazy_labels: bool = False,
     ):
         """
         Predict sequence tags for Named Entity Recognition task
         :param sentences: a Sentence or a List of Sentence
         :param mini_batch_size: size of the minibatch, usually bigger is more rapid but consume more memory,
-        up to a point when it has no more effect.
-        :param all_tag_prob: True to compute the score for each tag on each token,
-        otherwise only the score of the best tag is returned
+        up to a point when it has no more effect. By default the one in the inference settings of the model, or 32
+        :param all_tag_prob: True to compute the probability of each tag on each token (the marginals if a CRF is
+        used). They are attached to each sentence as an array of shape [tokens, tags], see
+        Sentence.get_tags_proba_dist. Otherwise only the score of the best tag is returned
         :param verbose: set to True to display a progress bar
         :param return_loss: set to True to return loss
         :param label_name: set this to change the name of the label type that is predicted
         :param embedding_storage_mode: default is 'none' which is always best. Only set to 'cpu' or 'gpu' if
         you wish to not only predict, but also keep the generated embeddings in CPU or GPU memory respectively.
         'gpu' to store embeddings in GPU memory.
+        :param lazy_labels: set to True to attach the predicted tag IDs and confidences to each sentence as arrays
+        (see Sentence.get_tag_predictions and Sentence.get_span_predictions). Label objects are then only created
+        when the labels of a token are accessed, e.g. through get_tag or get_spans.
         """
         if label_name == None:
             label_name = self.tag_type
 
+        mini_batch_size = self._resolve_mini_batch_size(mini_batch_size)
+
         with torch.no_grad():
             if not sentences:
                 return sentences
@@ -343,11 +351,6 @@ class SequenceTagger(flair.nn.Model):
                 dataset=SentenceDataset(reordered_sentences), batch_size=mini_batch_size
             )
 
-            if self.use_crf:
-                transitions = self.transitions.detach().cpu().numpy()
-            else:
-                transitions = None
-
             # progress bar for verbosity
             if verbose:
                 dataloader = tqdm(dataloader)
@@ -366,26 +369,15 @@ class SequenceTagger(flair.nn.Model):
                 if not batch:
                     continue
 
-                feature = self.forward(batch)
+                with self._inference_autocast():
+                    feature = self._forward_features(batch)
+                # the CRF and softmax always run in float32
+                feature = feature.float()
 
                 if return_loss:
                     overall_loss += self._calculate_loss(feature, batch)
 
-                tags, all_tags = self._obtain_labels(
-                    feature=feature,
-                    batch_sentences=batch,
-                    transitions=transitions,
-                    get_all_tags=all_tag_prob,
-                )
-
-                for (sentence, sent_tags) in zip(batch, tags):
-                    for (token, tag) in zip(sentence.tokens, sent_tags):
-                        token.add_tag_label(label_name, tag)
-
-                # all_tags will be empty if all_tag_prob is set to False, so the for loop will be avoided
-                for (sentence, sent_all_tags) in zip(batch, all_tags):
-                    for (token, token_all_tags) in zip(sentence.tokens, sent_all_tags):
-                        token.add_tags_proba_dist(label_name, token_all_tags)
+                self._add_predictions(batch, feature, label_name, all_tag_prob, lazy_labels)
 
                 # clearing token embeddings to save memory
                 store_embeddings(batch, storage_mode=embedding_storage_mode)
@@ -393,6 +385,47 @@ class SequenceTagger(flair.nn.Model):
             if return_loss:
                 return overall_loss / batch_no
 
+    def _add_predictions(
+            self,
+            batch: List[Sentence],
+            feature: torch.Tensor,
+            label_name: str,
+            all_tag_prob: bool = False,
+            lazy_labels: bool = False,
+    ):
+        """
+        Decodes the features of a mini-batch and adds the predicted tags to its sentences.
+        :param batch: the (non-empty) sentences the features were computed for
+        :param feature: output of _forward_features() for this batch
+        :param label_name: name of the label type the predictions are added as
+        :param all_tag_prob: True to also add the tag distribution of each token
+        :param lazy_labels: True to only store tag arrays and create the labels on first access
+        """
+        if lazy_labels:
+            tag_ids, confidences, all_tags = self._obtain_tag_arrays(
+                feature=feature,
+                batch_sentences=batch,
+                get_all_tags=all_tag_prob,
+            )
+
+            for (sentence, sent_tag_ids, sent_confidences) in zip(batch, tag_ids, confidences):
+                sentence.add_tag_predictions(label_name, sent_tag_ids, sent_confidences, self.tag_dictionary)
+
+        else:
+            tags, all_tags = self._obtain_labels(
+                feature=feature,
+                batch_sentences=batch,
+                get_all_tags=all_tag_prob,
+            )
+
+            for (sentence, sent_tags) in zip(batch, tags):
+                for (token, tag) in zip(sentence.tokens, sent_tags):
+                    token.add_tag_label(label_name, tag)
+
+        # all_tags will be empty if all_tag_prob is set to False, so the for loop will be avoided
+        for (sentence, sent_all_tags) in zip(batch, all_tags):
+            sentence.add_tags_proba_dist(label_name, sent_all_tags, self.tag_dictionary)
+
     def _requires_span_F1_evaluation(self) -> bool:
         span_F1 = False
         for item in self.tag_dictionary.get_items():
@@ -407,72 +440,66 @@ class SequenceTagger(flair.nn.Model):
 
         metric = Metric("Evaluation", beta=self.beta)
 
-        lines: List[str] = []
+        # spans of all sentences as (sentence index, start, end, tag id) tuples
+        span_tags = Dictionary(add_unk=False)
+        gold_spans: Set[Tuple[int, int, int, int]] = set()
+        predicted_spans: Set[Tuple[int, int, int, int]] = set()
 
-        y_true = []
-        y_pred = []
+        outfile = open(Path(out_path), "w", encoding="utf-8") if out_path else None
 
-        for batch in data_loader:
-
-            # predict for batch
-            loss = self.predict(batch,
-                                embedding_storage_mode=embedding_storage_mode,
-                                mini_batch_size=mini_batch_size,
-                                label_name='predicted',
-                                return_loss=True)
-            eval_loss += loss
-            batch_no += 1
+        try:
+            sentence_index = 0
+            for batch in data_loader:
 
-            for sentence in batch:
+                # read the gold spans before the predictions are added, which would create the token labels
+                gold_spans_for_batch = [self._get_gold_spans(sentence) for sentence in batch]
 
-                # make list of gold tags
-                gold_spans = sentence.get_spans(self.tag_type)
-                gold_tags = [(span.tag, repr(span)) for span in gold_spans]
-
-                # make list of predicted tags
-                predicted_spans = sentence.get_spans("predicted")
-                predicted_tags = [(span.tag, repr(span)) for span in predicted_spans]
-
-                # check for true positives, false positives and false negatives
-                for tag, prediction in predicted_tags:
-                    if (tag, prediction) in gold_tags:
-                        metric.add_tp(tag)
-                    else:
-                        metric.add_fp(tag)
-
-                for tag, gold in gold_tags:
-                    if (tag, gold) not in predicted_tags:
-                        metric.add_fn(tag)
-
-                tags_gold = []
-                tags_pred = []
-
-                # also write to file in BIO format to use old conlleval script
-                if out_path:
-                    for token in sentence:
-                        # check if in gold spans
-                        gold_tag = 'O'
-                        for span in gold_spans:
-                            if token in span:
-                                gold_tag = 'B-' + span.tag if token == span[0] else 'I-' + span.tag
-                        tags_gold.append(gold_tag)
-
-                        predicted_tag = 'O'
-                        # check if in predicted spans
-                        for span in predicted_spans:
-                            if token in span:
-                                predicted_tag = 'B-' + span.tag if token == span[0] else 'I-' + span.tag
-                        tags_pred.append(predicted_tag)
-
-                        lines.append(f'{token.text} {gold_tag} {predicted_tag}\n')
-                    lines.append('\n')
-
-                y_true.append(tags_gold)
-                y_pred.append(tags_pred)
+                # predict for batch
+                loss = self.predict(batch,
+                                    embedding_storage_mode=embedding_storage_mode,
+                                    mini_batch_size=mini_batch_size,
+                                    label_name='predicted',
+                                    return_loss=True,
+                                    lazy_labels=True)
+                eval_loss += loss
+                batch_no += 1
 
-        if out_path:
-            with open(Path(out_path), "w", encoding="utf-8") as outfile:
-                outfile.write("".join(lines))
+                lines: List[str] = []
+                for sentence, sentence_gold_spans in zip(batch, gold_spans_for_batch):
+
+                    sentence_predicted_spans = sentence.get_span_predictions("predicted")
+
+                    for (start, end, tag, _) in sentence_gold_spans:
+                        gold_spans.add((sentence_index, start, end, span_tags.add_item(tag)))
+                    for (start, end, tag, _) in sentence_predicted_spans:
+                        predicted_spans.add((sentence_index, start, end, span_tags.add_item(tag)))
+
+                    sentence_index += 1
+
+                    # also write to file in BIO format to use old conlleval script
+                    if outfile:
+                        gold_tags = self._spans_to_bio(sentence_gold_spans, len(sentence))
+                        predicted_tags = self._spans_to_bio(sentence_predicted_spans, len(sentence))
+                        for token, gold_tag, predicted_tag in zip(sentence, gold_tags, predicted_tags):
+                            lines.append(f'{token.text} {gold_tag} {predicted_tag}\n')
+                        lines.append('\n')
+
+                if outfile:
+                    outfile.write("".join(lines))
+        finally:
+            if outfile:
+                outfile.close()
+
+        # count true positives, false positives and false negatives of all classes at once
+        for kind, spans in [
+            ("tp", gold_spans & predicted_spans),
+            ("fp", predicted_spans - gold_spans),
+            ("fn", gold_spans - predicted_spans),
+        ]:
+            tag_ids = np.fromiter((span[3] for span in spans), dtype=np.int64, count=len(spans))
+            for tag_id, count in enumerate(np.bincount(tag_ids, minlength=len(span_tags)).tolist()):
+                if count > 0:
+                    getattr(metric, f"add_{kind}")(span_tags.get_item_for_index(tag_id), count)
 
         eval_loss /= batch_no
 
@@ -501,6 +528,31 @@ class SequenceTagger(flair.nn.Model):
 
         return result, eval_loss
 
+    def _get_gold_spans(self, sentence: Sentence) -> List[Tuple[int, int, str, float]]:
+        """
+        Returns the gold spans of a sentence as (start, end, tag, score) tuples, without creating Span objects. They are
+        read from the gold tags of the tokens, so spans with tags missing from the tag dictionary are kept and count as
+        false negatives. Pending array-backed predictions of other types, e.g. of an earlier evaluation, are not
+        turned into labels.
+        """
+        if self.tag_type in sentence._tag_predictions_pending:
+            return sentence.get_span_predictions(self.tag_type)
+
+        tag_values = []
+        for token in sentence:
+            labels = token._annotation_layers.get(self.tag_type)
+            tag_values.append(labels[0].value if labels else "")
+        return get_spans_from_tags(tag_values, [1.0] * len(tag_values))
+
+    @staticmethod
+    def _spans_to_bio(spans: List[Tuple[int, int, str, float]], length: int) -> List[str]:
+        tags = ["O"] * length
+        for (start, end, tag, _) in spans:
+            tags[start] = "B-" + tag
+            for index in range(start + 1, end):
+                tags[index] = "I-" + tag
+        return tags
+
     def evaluate(
             self,
             sentences: Union[List[Sentence], Dataset],
@@ -616,21 +668,53 @@ class SequenceTagger(flair.nn.Model):
     def forward_loss(
             self, data_points: Union[List[Sentence], Sentence], sort=True
     ) -> torch.tensor:
-        features = self.forward(data_points)
+        features = self._forward_features(data_points)
         return self._calculate_loss(features, data_points)
 
+    @property
+    def _flat_token_mode(self) -> bool:
+        """Without RNN and CRF every token is tagged on its own, so batches are processed without padding."""
+        return not self.use_rnn and not self.use_crf
+
     def forward(self, sentences: List[Sentence]):
+        """
+        Returns the emission scores of all tokens, padded to [batch, max_len, tagset_size].
+        """
+
+        features = self._forward_features(sentences)
+
+        if self._flat_token_mode:
+            lengths: List[int] = [len(sentence.tokens) for sentence in sentences]
+            features = torch.nn.utils.rnn.pad_sequence(self._split_by_lengths(features, lengths), batch_first=True)
+
+        return features
+
+    def _forward_features(self, sentences: List[Sentence]):
+        """
+        Like forward(), but taggers without RNN and CRF return the scores of all tokens without padding as
+        [total_tokens, tagset_size]. This is the layout _calculate_loss() and _add_predictions() expect.
+        """
 
         self.embeddings.embed(sentences)
 
+        return self._forward_from_embeddings(sentences)
+
+    def _forward_from_embeddings(self, sentences: List[Sentence]):
+        """
+        Like _forward_features(), but expects the tokens to already carry the embeddings of this tagger.
+        """
+
         names = self.embeddings.get_names()
 
+        if self._flat_token_mode:
+            return self._forward_flat(sentences, names)
+
         lengths: List[int] = [len(sentence.tokens) for sentence in sentences]
         longest_token_sequence_in_batch: int = max(lengths)
 
         pre_allocated_zero_tensor = torch.zeros(
             self.embeddings.embedding_length * longest_token_sequence_in_batch,
-            dtype=torch.float,
+            dtype=self._inference_dtype,
             device=flair.device,
         )
 
@@ -669,8 +753,9 @@ class SequenceTagger(flair.nn.Model):
             sentence_tensor = self.embedding2nn(sentence_tensor)
 
         if self.use_rnn:
+            # autocast does not cover RNNs, so they always run in float32
             packed = torch.nn.utils.rnn.pack_padded_sequence(
-                sentence_tensor, lengths, enforce_sorted=False, batch_first=True
+                sentence_tensor.float(), lengths, enforce_sorted=False, batch_first=True
             )
 
             # if initial hidden state is trainable, use this state
@@ -699,38 +784,75 @@ class SequenceTagger(flair.nn.Model):
 
         return features
 
-    def _score_sentence(self, feats, tags, lens_):
+    def _forward_flat(self, sentences: List[Sentence], names: List[str]):
+
+        lengths: List[int] = [len(sentence.tokens) for sentence in sentences]
 
-        start = torch.tensor(
-            [self.tag_dictionary.get_idx_for_item(START_TAG)], device=flair.device
+        all_embs = [
+            emb for sentence in sentences for token in sentence for emb in token.get_each_embedding(names)
+        ]
+
+        token_tensor = torch.cat(all_embs).view(
+            [
+                sum(lengths),
+                self.embeddings.embedding_length,
+            ]
         )
-        start = start[None, :].repeat(tags.shape[0], 1)
 
-        stop = torch.tensor(
-            [self.tag_dictionary.get_idx_for_item(STOP_TAG)], device=flair.device
+        # --------------------------------------------------------------------
+        # FF PART
+        # --------------------------------------------------------------------
+        if self.use_dropout > 0.0:
+            token_tensor = self.dropout(token_tensor)
+        if self.use_word_dropout > 0.0:
+            token_tensor = self.word_dropout(token_tensor.unsqueeze(0)).squeeze(0)
+        if self.use_locked_dropout > 0.0 and self.training:
+            # draw one mask per sentence and share it among the tokens of the sentence
+            mask = self.locked_dropout(
+                token_tensor.new_ones(len(sentences), 1, self.embeddings.embedding_length)
+            )
+            token_tensor = token_tensor * mask[self._token_to_sentence_index(lengths), 0]
+
+        if self.reproject_embeddings:
+            token_tensor = self.embedding2nn(token_tensor)
+
+        features = self.linear(token_tensor)
+
+        return features
+
+    @staticmethod
+    def _token_to_sentence_index(lengths: List[int]) -> torch.Tensor:
+        return torch.repeat_interleave(
+            torch.arange(len(lengths), device=flair.device),
+            torch.tensor(lengths, device=flair.device),
         )
-        stop = stop[None, :].repeat(tags.shape[0], 1)
+
+    def _score_sentence(self, feats, tags, lens_):
+
+        id_start = self.tag_dictionary.get_idx_for_item(START_TAG)
+        id_stop = self.tag_dictionary.get_idx_for_item(STOP_TAG)
+
+        batch_size, seq_len = tags.shape
+        lengths = torch.tensor(lens_, device=flair.device)
+        positions = torch.arange(seq_len + 1, device=flair.device)[None, :]
+
+        start = torch.full((batch_size, 1), id_start, dtype=torch.long, device=flair.device)
+        stop = torch.full((batch_size, 1), id_stop, dtype=torch.long, device=flair.device)
 
         pad_start_tags = torch.cat([start, tags], 1)
         pad_stop_tags = torch.cat([tags, stop], 1)
 
-        for i in range(len(lens_)):
-            pad_stop_tags[i, lens_[i]:] = self.tag_dictionary.get_idx_for_item(
-                STOP_TAG
-            )
-
-        score = torch.FloatTensor(feats.shape[0]).to(flair.device)
+        # every position after the last token transitions to STOP
+        pad_stop_tags = torch.where(positions >= lengths[:, None], stop, pad_stop_tags)
 
-        for i in range(feats.shape[0]):
-            r = torch.LongTensor(range(lens_[i])).to(flair.device)
+        # sum transition scores from START to STOP and emission scores of all gold tags
+        transition_scores = self.transitions[pad_stop_tags, pad_start_tags]
+        transition_scores = transition_scores.masked_fill(positions > lengths[:, None], 0.0)
 
-            score[i] = torch.sum(
-                self.transitions[
-                    pad_stop_tags[i, : lens_[i] + 1], pad_start_tags[i, : lens_[i] + 1]
-                ]
-            ) + torch.sum(feats[i, r, tags[i, : lens_[i]]])
+        emission_scores = feats.gather(2, tags[:, :, None]).squeeze(2)
+        emission_scores = emission_scores.masked_fill(positions[:, :-1] >= lengths[:, None], 0.0)
 
-        return score
+        return transition_scores.sum(1) + emission_scores.sum(1)
 
     def _calculate_loss(
             self, features: torch.tensor, sentences: List[Sentence]
@@ -738,21 +860,18 @@ class SequenceTagger(flair.nn.Model):
 
         lengths: List[int] = [len(sentence.tokens) for sentence in sentences]
 
-        tag_list: List = []
-        for s_id, sentence in enumerate(sentences):
-            # get the tags in this sentence
-            tag_idx: List[int] = [
-                self.tag_dictionary.get_idx_for_item(token.get_tag(self.tag_type).value)
-                for token in sentence
-            ]
-            # add tags as tensor
-            tag = torch.tensor(tag_idx, device=flair.device)
-            tag_list.append(tag)
+        # get the tags of each sentence (cached on the sentence after the first lookup)
+        tag_list: List[torch.Tensor] = [
+            sentence.get_tag_indices(self.tag_type, self.tag_dictionary) for sentence in sentences
+        ]
 
-        if self.use_crf:
-            # pad tags if using batch-CRF decoder
-            tags, _ = pad_tensors(tag_list)
+        if self._flat_token_mode:
+            return self._calculate_flat_loss(features, torch.cat(tag_list).to(flair.device), lengths)
+
+        # pad tags and move them to the device in one go
+        tags = torch.nn.utils.rnn.pad_sequence(tag_list, batch_first=True).to(flair.device)
 
+        if self.use_crf:
             forward_score = self._forward_alg(features, lengths)
             gold_score = self._score_sentence(features, tags, lengths)
 
@@ -763,205 +882,234 @@ class SequenceTagger(flair.nn.Model):
         else:
             score = 0
             for sentence_feats, sentence_tags, sentence_length in zip(
-                    features, tag_list, lengths
+                    features, tags, lengths
             ):
                 sentence_feats = sentence_feats[:sentence_length]
                 score += torch.nn.functional.cross_entropy(
-                    sentence_feats, sentence_tags, weight=self.loss_weights
+                    sentence_feats, sentence_tags[:sentence_length], weight=self.loss_weights
                 )
             score /= len(features)
             return score
 
+    def _calculate_flat_loss(self, features: torch.Tensor, tags: torch.Tensor, lengths: List[int]) -> torch.Tensor:
+
+        token_losses = F.cross_entropy(features, tags, weight=self.loss_weights, reduction="none")
+
+        if self.loss_weights is not None:
+            token_weights = self.loss_weights[tags]
+        else:
+            token_weights = torch.ones_like(token_losses)
+
+        # average per sentence and then over the batch, like the padded path
+        sentence_index = self._token_to_sentence_index(lengths)
+        sentence_losses = token_losses.new_zeros(len(lengths)).index_add(0, sentence_index, token_losses)
+        sentence_weights = token_weights.new_zeros(len(lengths)).index_add(0, sentence_index, token_weights)
+
+        return (sentence_losses / sentence_weights).mean()
+
     def _obtain_labels(
             self,
             feature: torch.Tensor,
             batch_sentences: List[Sentence],
-            transitions: Optional[np.ndarray],
             get_all_tags: bool,
-    ) -> (List[List[Label]], List[List[List[Label]]]):
+    ) -> (List[List[Label]], List[np.ndarray]):
         """
         Returns a tuple of two lists:
          - The first list corresponds to the most likely `Label` per token in each sentence.
-         - The second list contains a probability distribution over all `Labels` for each token
-           in a sentence for all sentences.
+         - The second list contains an array of shape [tokens, tags] for each sentence, holding the probability
+           distribution over all tags for each token (marginals if a CRF is used).
+        """
+        tag_ids, confidences, all_tags = self._obtain_tag_arrays(feature, batch_sentences, get_all_tags)
+
+        tags = [
+            [
+                Label(self.tag_dictionary.get_item_for_index(tag), conf)
+                for conf, tag in zip(sentence_confidences.tolist(), sentence_tag_ids.tolist())
+            ]
+            for sentence_tag_ids, sentence_confidences in zip(tag_ids, confidences)
+        ]
+
+        return tags, all_tags
+
+    def _obtain_tag_arrays(
+            self,
+            feature: torch.Tensor,
+            batch_sentences: List[Sentence],
+            get_all_tags: bool,
+    ) -> (List[np.ndarray], List[np.ndarray], List[np.ndarray]):
+        """
+        Returns a tuple of three lists with one array per sentence:
+         - The IDs of the most likely tag of each token.
+         - The confidences of these tags.
+         - The probability distributions over all tags of shape [tokens, tags] (empty if get_all_tags is False).
         """
 
         lengths: List[int] = [len(sentence.tokens) for sentence in batch_sentences]
 
-        tags = []
-        all_tags = []
-        feature = feature.cpu()
         if self.use_crf:
-            feature = feature.numpy()
+            confidences_batch, tag_seq_batch = self._viterbi_decode(features=feature, lengths=lengths)
+            if get_all_tags:
+                scores_batch = self._forward_backward(features=feature, lengths=lengths)
+        elif self._flat_token_mode:
+            scores_batch = F.softmax(feature, dim=1)
+            confidences_batch, tag_seq_batch = torch.max(scores_batch, dim=1)
         else:
+            feature = feature.cpu()
             for index, length in enumerate(lengths):
                 feature[index, length:] = 0
-            softmax_batch = F.softmax(feature, dim=2).cpu()
-            scores_batch, prediction_batch = torch.max(softmax_batch, dim=2)
-            feature = zip(softmax_batch, scores_batch, prediction_batch)
-
-        for feats, length in zip(feature, lengths):
-            if self.use_crf:
-                confidences, tag_seq, scores = self._viterbi_decode(
-                    feats=feats[:length],
-                    transitions=transitions,
-                    all_scores=get_all_tags,
-                )
-            else:
-                softmax, score, prediction = feats
-                confidences = score[:length].tolist()
-                tag_seq = prediction[:length].tolist()
-                scores = softmax[:length].tolist()
-
-            tags.append(
-                [
-                    Label(self.tag_dictionary.get_item_for_index(tag), conf)
-                    for conf, tag in zip(confidences, tag_seq)
-                ]
-            )
-
+            scores_batch = F.softmax(feature, dim=2)
+            confidences_batch, tag_seq_batch = torch.max(scores_batch, dim=2)
+
+        # move results to the CPU once per batch
+        confidences_batch = confidences_batch.cpu().numpy()
+        tag_seq_batch = tag_seq_batch.cpu().numpy()
+        if get_all_tags:
+            scores_batch = scores_batch.cpu().numpy()
+
+        # split unpadded results back into sentences
+        if self._flat_token_mode:
+            confidences_batch = self._split_by_lengths(confidences_batch, lengths)
+            tag_seq_batch = self._split_by_lengths(tag_seq_batch, lengths)
             if get_all_tags:
-                all_tags.append(
-                    [
-                        [
-                            Label(
-                                self.tag_dictionary.get_item_for_index(score_id), score
-                            )
-                            for score_id, score in enumerate(score_dist)
-                        ]
-                        for score_dist in scores
-                    ]
-                )
+                scores_batch = self._split_by_lengths(scores_batch, lengths)
 
-        return tags, all_tags
+        tag_ids = [tag_seq_batch[index][:length].copy() for index, length in enumerate(lengths)]
+        confidences = [confidences_batch[index][:length].copy() for index, length in enumerate(lengths)]
+
+        all_tags = []
+        if get_all_tags:
+            all_tags = [scores_batch[index][:length].copy() for index, length in enumerate(lengths)]
+
+        return tag_ids, confidences, all_tags
 
     @staticmethod
-    def _softmax(x, axis):
-        # reduce raw values to avoid NaN during exp
-        x_norm = x - x.max(axis=axis, keepdims=True)
-        y = np.exp(x_norm)
-        return y / y.sum(axis=axis, keepdims=True)
-
-    def _viterbi_decode(
-            self, feats: np.ndarray, transitions: np.ndarray, all_scores: bool
-    ):
+    def _split_by_lengths(items: List, lengths: List[int]) -> List[List]:
+        split = []
+        offset = 0
+        for length in lengths:
+            split.append(items[offset: offset + length])
+            offset += length
+        return split
+
+    def _viterbi_decode(self, features: torch.Tensor, lengths: List[int]):
+        """
+        Decodes the best tag sequence for all sentences of a padded mini-batch at once.
+        Returns a tuple of the per-token confidences and the best paths (both [batch, max_len]).
+        """
         id_start = self.tag_dictionary.get_idx_for_item(START_TAG)
         id_stop = self.tag_dictionary.get_idx_for_item(STOP_TAG)
 
-        backpointers = np.empty(shape=(feats.shape[0], self.tagset_size), dtype=np.int_)
-        backscores = np.empty(
-            shape=(feats.shape[0], self.tagset_size), dtype=np.float32
-        )
+        batch_size, seq_len, tagset_size = features.shape
+        device = features.device
+
+        transitions = self.transitions.detach().to(device)
+
+        # padded positions leave the viterbi variables untouched and point back to the same tag
+        mask = torch.arange(seq_len, device=device)[None, :] < torch.tensor(lengths, device=device)[:, None]
+        identity = torch.arange(tagset_size, device=device)[None, :].expand(batch_size, tagset_size)
+
+        backpointers = torch.empty(batch_size, seq_len, tagset_size, dtype=torch.long, device=device)
+        backscores = torch.empty(batch_size, seq_len, tagset_size, dtype=torch.float, device=device)
 
-        init_vvars = np.expand_dims(
-            np.repeat(-10000.0, self.tagset_size), axis=0
-        ).astype(np.float32)
-        init_vvars[0][id_start] = 0
+        forward_var = torch.full((batch_size, tagset_size), -10000.0, dtype=torch.float, device=device)
+        forward_var[:, id_start] = 0.0
 
-        forward_var = init_vvars
-        for index, feat in enumerate(feats):
+        for index in range(seq_len):
             # broadcasting will do the job of reshaping and is more efficient than calling repeat
-            next_tag_var = forward_var + transitions
-            bptrs_t = next_tag_var.argmax(axis=1)
-            viterbivars_t = next_tag_var[np.arange(bptrs_t.shape[0]), bptrs_t]
-            forward_var = viterbivars_t + feat
-            backscores[index] = forward_var
-            forward_var = forward_var[np.newaxis, :]
-            backpointers[index] = bptrs_t
-
-        terminal_var = forward_var.squeeze() + transitions[id_stop]
-        terminal_var[id_stop] = -10000.0
-        terminal_var[id_start] = -10000.0
-        best_tag_id = terminal_var.argmax()
-
-        best_path = [best_tag_id]
-        for bptrs_t in reversed(backpointers):
-            best_tag_id = bptrs_t[best_tag_id]
-            best_path.append(best_tag_id)
-
-        start = best_path.pop()
-        assert start == id_start
-        best_path.reverse()
-
-        best_scores_softmax = self._softmax(backscores, axis=1)
-        best_scores_np = np.max(best_scores_softmax, axis=1)
-
-        # default value
-        all_scores_np = np.zeros(0, dtype=np.float64)
-        if all_scores:
-            all_scores_np = best_scores_softmax
-            for index, (tag_id, tag_scores) in enumerate(zip(best_path, all_scores_np)):
-                if type(tag_id) != int and tag_id.item() != tag_scores.argmax():
-                    swap_index_score = tag_scores.argmax()
-                    (
-                        all_scores_np[index][tag_id.item()],
-                        all_scores_np[index][swap_index_score],
-                    ) = (
-                        all_scores_np[index][swap_index_score],
-                        all_scores_np[index][tag_id.item()],
-                    )
-                elif type(tag_id) == int and tag_id != tag_scores.argmax():
-                    swap_index_score = tag_scores.argmax()
-                    (
-                        all_scores_np[index][tag_id],
-                        all_scores_np[index][swap_index_score],
-                    ) = (
-                        all_scores_np[index][swap_index_score],
-                        all_scores_np[index][tag_id],
-                    )
+            next_tag_var = forward_var[:, None, :] + transitions[None, :, :]
+            viterbivars_t, bptrs_t = torch.max(next_tag_var, dim=2)
+            viterbivars_t = viterbivars_t + features[:, index]
 
-        return best_scores_np.tolist(), best_path, all_scores_np.tolist()
+            step_mask = mask[:, index, None]
+            forward_var = torch.where(step_mask, viterbivars_t, forward_var)
+            backscores[:, index] = viterbivars_t
+            backpointers[:, index] = torch.where(step_mask, bptrs_t, identity)
 
-    def _forward_alg(self, feats, lens_):
+        terminal_var = forward_var + transitions[id_stop][None, :]
+        terminal_var[:, id_stop] = -10000.0
+        terminal_var[:, id_start] = -10000.0
+        best_tag_id = terminal_var.argmax(dim=1)
 
-        init_alphas = torch.FloatTensor(self.tagset_size).fill_(-10000.0)
-        init_alphas[self.tag_dictionary.get_idx_for_item(START_TAG)] = 0.0
+        # follow the back pointers from the last position of the padded batch
+        best_path = torch.empty(batch_size, seq_len, dtype=torch.long, device=device)
+        best_path[:, -1] = best_tag_id
+        for index in range(seq_len - 1, 0, -1):
+            best_tag_id = backpointers[:, index].gather(1, best_tag_id[:, None]).squeeze(1)
+            best_path[:, index - 1] = best_tag_id
 
-        forward_var = torch.zeros(
-            feats.shape[0],
-            feats.shape[1] + 1,
-            feats.shape[2],
-            dtype=torch.float,
-            device=flair.device,
-        )
+        best_scores_softmax = F.softmax(backscores, dim=2)
+        best_scores, _ = torch.max(best_scores_softmax, dim=2)
 
-        forward_var[:, 0, :] = init_alphas[None, :].repeat(feats.shape[0], 1)
+        return best_scores, best_path
 
-        transitions = self.transitions.view(
-            1, self.transitions.shape[0], self.transitions.shape[1]
-        ).repeat(feats.shape[0], 1, 1)
+    def _forward_backward(self, features: torch.Tensor, lengths: List[int]) -> torch.Tensor:
+        """
+        Computes the marginal probability of every tag at every position for all sentences of a padded
+        mini-batch with the forward-backward algorithm. Returns a tensor of shape [batch, max_len, tagset_size].
+        """
+        return self._log_marginals(features, lengths).exp()
 
-        for i in range(feats.shape[1]):
-            emit_score = feats[:, i, :]
+    def _log_marginals(self, features: torch.Tensor, lengths: List[int], temperature: float = 1.0) -> torch.Tensor:
+        """
+        Computes the log marginal probability of every tag at every position like _forward_backward. Gradients flow
+        into the features and transitions, so the marginals can be used in a training objective. Emission and
+        transition scores are divided by the temperature. Values at padded positions are meaningless.
+        """
+        id_start = self.tag_dictionary.get_idx_for_item(START_TAG)
+        id_stop = self.tag_dictionary.get_idx_for_item(STOP_TAG)
 
-            tag_var = (
-                    emit_score[:, :, None].repeat(1, 1, transitions.shape[2])
-                    + transitions
-                    + forward_var[:, i, :][:, :, None]
-                    .repeat(1, 1, transitions.shape[2])
-                    .transpose(2, 1)
-            )
+        batch_size, seq_len, tagset_size = features.shape
+        device = features.device
 
-            max_tag_var, _ = torch.max(tag_var, dim=2)
+        features = features / temperature
+        transitions = self.transitions.to(device) / temperature
 
-            tag_var = tag_var - max_tag_var[:, :, None].repeat(
-                1, 1, transitions.shape[2]
-            )
+        mask = torch.arange(seq_len, device=device)[None, :] < torch.tensor(lengths, device=device)[:, None]
+
+        alphas = torch.empty(batch_size, seq_len, tagset_size, dtype=torch.float, device=device)
+        betas = torch.empty(batch_size, seq_len, tagset_size, dtype=torch.float, device=device)
+
+        # forward pass (values at padded positions are never read)
+        forward_var = torch.full((batch_size, tagset_size), -10000.0, dtype=torch.float, device=device)
+        forward_var[:, id_start] = 0.0
+        for index in range(seq_len):
+            # tag_var[b, next_tag, previous_tag]
+            tag_var = forward_var[:, None, :] + transitions[None, :, :] + features[:, index, :, None]
+            forward_var = torch.logsumexp(tag_var, dim=2)
+            alphas[:, index] = forward_var
+
+        # backward pass, starting at the last token of each sentence with the transition to STOP
+        backward_var = transitions[id_stop][None, :].repeat(batch_size, 1)
+        betas[:, -1] = backward_var
+        for index in range(seq_len - 2, -1, -1):
+            # tag_var[b, previous_tag, next_tag]
+            tag_var = transitions.t()[None, :, :] + (features[:, index + 1] + backward_var)[:, None, :]
+            backward_var = torch.where(mask[:, index + 1, None], torch.logsumexp(tag_var, dim=2), backward_var)
+            betas[:, index] = backward_var
+
+        return F.log_softmax(alphas + betas, dim=2)
+
+    def _forward_alg(self, feats, lens_):
+
+        id_start = self.tag_dictionary.get_idx_for_item(START_TAG)
+        id_stop = self.tag_dictionary.get_idx_for_item(STOP_TAG)
 
-            agg_ = torch.log(torch.sum(torch.exp(tag_var), dim=2))
+        batch_size, seq_len, tagset_size = feats.shape
 
-            cloned = forward_var.clone()
-            cloned[:, i + 1, :] = max_tag_var + agg_
+        # padded positions keep the forward variables of the last token of each sentence
+        mask = torch.arange(seq_len, device=flair.device)[None, :] < torch.tensor(lens_, device=flair.device)[:, None]
 
-            forward_var = cloned
+        forward_var = torch.full((batch_size, tagset_size), -10000.0, dtype=torch.float, device=flair.device)
+        forward_var[:, id_start] = 0.0
 
-        forward_var = forward_var[range(forward_var.shape[0]), lens_, :]
+        for i in range(seq_len):
+            # tag_var[b, next_tag, previous_tag]
+            tag_var = forward_var[:, None, :] + self.transitions[None, :, :] + feats[:, i, :, None]
+            forward_var = torch.where(mask[:, i, None], torch.logsumexp(tag_var, dim=2), forward_var)
 
-        terminal_var = forward_var + self.transitions[
-                                         self.tag_dictionary.get_idx_for_item(STOP_TAG)
-                                     ][None, :].repeat(forward_var.shape[0], 1)
+        terminal_var = forward_var + self.transitions[id_stop][None, :]
 
-        alpha = log_sum_exp_batch(terminal_var)
+        alpha = torch.logsumexp(terminal_var, dim=1)
 
         return alpha
 
@@ -1127,6 +1275,10 @@ class SequenceTagger(flair.nn.Model):
 
 
 class MultiTagger:
+
+    # settings used by predict if none are passed, e.g. found by flair.inference_utils.tune_batch_size
+    inference_settings: Dict = None
+
     def __init__(self, name_to_tagger: Dict[str, SequenceTagger]):
         super().__init__()
         self.name_to_tagger = name_to_tagger
@@ -1134,20 +1286,24 @@ class MultiTagger:
     def predict(
             self,
             sentences: Union[List[Sentence], Sentence],
-            mini_batch_size=32,
+            mini_batch_size: int = None,
             all_tag_prob: bool = False,
             verbose: bool = False,
             return_loss: bool = False,
+            num_threads: int = 1,
     ):
         """
-        Predict sequence tags for Named Entity Recognition task
+        Predict sequence tags for Named Entity Recognition task. Each mini-batch is embedded only once with the
+        embeddings of all taggers (embeddings shared between taggers are computed a single time), after which the
+        taggers are applied to the embedded batch.
         :param sentences: a Sentence or a List of Sentence
         :param mini_batch_size: size of the minibatch, usually bigger is more rapid but consume more memory,
-        up to a point when it has no more effect.
+        up to a point when it has no more effect. By default the one in the inference settings, or 32
         :param all_tag_prob: True to compute the score for each tag on each token,
         otherwise only the score of the best tag is returned
         :param verbose: set to True to display a progress bar
-        :param return_loss: set to True to return loss
+        :param return_loss: set to True to return a dictionary with the loss of each tagger
+        :param num_threads: number of threads that apply the taggers to an embedded mini-batch in parallel
         """
         if any(["hunflair" in name for name in self.name_to_tagger.keys()]):
             if "spacy" not in sys.modules:
@@ -1160,20 +1316,121 @@ class MultiTagger:
 
         if isinstance(sentences, Sentence):
             sentences = [sentences]
+
+        if mini_batch_size is None:
+            mini_batch_size = (self.inference_settings or {}).get("mini_batch_size", 32)
+
+        shared_embeddings, private_embeddings = self._split_embeddings()
+
+        # taggers with private embeddings overwrite each other's token embeddings and must run one after the other
+        executor = None
+        if num_threads > 1 and len(self.name_to_tagger) > 1 and not any(private_embeddings.values()):
+            executor = ThreadPoolExecutor(max_workers=num_threads)
+
+        losses = {name: 0 for name in self.name_to_tagger}
+
+        # the taggers run with the storage mode of the calling thread
+        storage_mode = flair.get_embedding_storage_mode()
+
+        def apply_tagger(name: str, batch: List[Sentence]):
+            tagger = self.name_to_tagger[name]
+            # grad mode is thread-local, so it is disabled here and not in the caller
+            with torch.no_grad(), flair.thread_settings(embedding_storage_mode=storage_mode):
+                with tagger._inference_autocast():
+                    for embedding in private_embeddings[name]:
+                        embedding._add_embeddings_internal(batch)
+
+                    feature = tagger._forward_from_embeddings(batch)
+                feature = feature.float()
+
+                if return_loss:
+                    losses[name] += tagger._calculate_loss(feature, batch)
+
+                tagger._add_predictions(batch, feature, label_name=name, all_tag_prob=all_tag_prob)
+
+        # sort sentences by length to minimize padding, as in SequenceTagger.predict
+        reordered_sentences = sorted(sentences, key=lambda s: len(s), reverse=True)
+        batches = [
+            reordered_sentences[i:i + mini_batch_size] for i in range(0, len(reordered_sentences), mini_batch_size)
+        ]
+        if verbose:
+            batches = tqdm(batches)
+
+        try:
+            batch_no = 0
+            for batch in batches:
+
+                batch_no += 1
+
+                if verbose:
+                    batches.set_description(f"Inferencing on batch {batch_no}")
+
+                batch = SequenceTagger._filter_empty_sentences(batch)
+                # stop if all sentences are empty
+                if not batch:
+                    continue
+
+                with torch.no_grad():
+                    for embedding in shared_embeddings:
+                        embedding.embed(batch)
+
+                if executor is not None:
+                    futures = [executor.submit(apply_tagger, name, batch) for name in self.name_to_tagger]
+                    for future in futures:
+                        future.result()
+                else:
+                    for name in self.name_to_tagger:
+                        apply_tagger(name, batch)
+
+                # clear embeddings after predicting
+                store_embeddings(batch, storage_mode="none")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if return_loss:
+            return {name: loss / max(batch_no, 1) for name, loss in losses.items()}
+
+    def _split_embeddings(self) -> Tuple[List[Embeddings], Dict[str, List[Embeddings]]]:
+        """
+        Collects the embeddings used by the taggers. Embeddings are identified by their name (which is the key
+        under which they are stored on the tokens), so embeddings whose name is used by a single embedding object
+        are computed once for all taggers. If taggers use different embeddings under the same name, these are
+        private to each tagger and recomputed right before the tagger is applied.
+        """
+        tagger_embeddings: Dict[str, List[Embeddings]] = {}
+        objects_by_name: Dict[str, List[Embeddings]] = {}
         for name, tagger in self.name_to_tagger.items():
-            tagger.predict(
-                sentences=sentences,
-                mini_batch_size=mini_batch_size,
-                all_tag_prob=all_tag_prob,
-                verbose=verbose,
-                label_name=name,
-                return_loss=return_loss,
-                embedding_storage_mode="cpu",
-            )
+            if isinstance(tagger.embeddings, StackedEmbeddings):
+                embeddings = list(tagger.embeddings.embeddings)
+            else:
+                embeddings = [tagger.embeddings]
+            tagger_embeddings[name] = embeddings
+
+            for embedding in embeddings:
+                objects = objects_by_name.setdefault(embedding.name, [])
+                if not any(embedding is other for other in objects):
+                    objects.append(embedding)
+
+        shared_embeddings = [objects[0] for objects in objects_by_name.values() if len(objects) == 1]
+        private_embeddings = {
+            name: [embedding for embedding in embeddings if len(objects_by_name[embedding.name]) > 1]
+            for name, embeddings in tagger_embeddings.items()
+        }
 
-        # clear embeddings after predicting
-        for sentence in sentences:
-            sentence.clear_embeddings()
+        return shared_embeddings, private_embeddings
+
+    def quantize(self, dtype: torch.dtype = torch.qint8):
+        """Quantizes all taggers, see Model.quantize."""
+        for tagger in self.name_to_tagger.values():
+            tagger.quantize(dtype)
+        return self
+
+    def set_inference_precision(self, precision: str):
+        """Sets the inference precision of all taggers, see Model.set_inference_precision."""
+        for tagger in self.name_to_tagger.values():
+            tagger.set_inference_precision(precision)
+        return self
 
     @classmethod
     def load(cls, model_names: Union[List[str], str]):
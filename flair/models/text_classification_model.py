@@ -17,7 +17,6 @@ from flair.data import Dictionary, Sentence, Label, DataPoint
 from flair.datasets import SentenceDataset, DataLoader
 from flair.file_utils import cached_path
 from flair.training_utils import (
-    convert_labels_to_one_hot,
     Result,
     store_embeddings,
 )
@@ -158,7 +157,10 @@ class TextClassifier(flair.nn.Model):
 
     def _forward_scores_and_loss(
             self, data_points: Union[List[Sentence], Sentence], return_loss=False):
-        scores = self.forward(data_points)
+        with self._inference_autocast():
+            scores = self.forward(data_points)
+        # the softmax and sigmoid confidences always run in float32
+        scores = scores.float()
 
         loss = None
         if return_loss:
@@ -169,7 +171,7 @@ class TextClassifier(flair.nn.Model):
     def predict(
         self,
         sentences: Union[List[Sentence], Sentence],
-        mini_batch_size: int = 32,
+        mini_batch_size: int = None,
         multi_class_prob: bool = False,
         verbose: bool = False,
         label_name: Optional[str] = None,
@@ -179,7 +181,8 @@ class TextClassifier(flair.nn.Model):
         """
         Predicts the class labels for the given sentences. The labels are directly added to the sentences.
         :param sentences: list of sentences
-        :param mini_batch_size: mini batch size to use
+        :param mini_batch_size: mini batch size to use, by default the one in the inference settings of the model,
+        or 32
         :param multi_class_prob : return probability for all class for multiclass
         :param verbose: set to True to display a progress bar
         :param return_loss: set to True to return loss
@@ -191,6 +194,8 @@ class TextClassifier(flair.nn.Model):
         if label_name == None:
             label_name = self.label_type if self.label_type is not None else 'label'
 
+        mini_batch_size = self._resolve_mini_batch_size(mini_batch_size)
+
         with torch.no_grad():
             if not sentences:
                 return sentences
@@ -442,24 +447,17 @@ class TextClassifier(flair.nn.Model):
 
     def _labels_to_one_hot(self, sentences: List[Sentence]):
 
-        label_list = []
-        for sentence in sentences:
-            label_list.append([label.value for label in sentence.get_labels(self.label_type)])
-
-        one_hot = convert_labels_to_one_hot(label_list, self.label_dictionary)
-        one_hot = [torch.FloatTensor(l).unsqueeze(0) for l in one_hot]
+        one_hot = [
+            sentence.get_label_one_hot(self.label_type, self.label_dictionary).unsqueeze(0)
+            for sentence in sentences
+        ]
         one_hot = torch.cat(one_hot, 0).to(flair.device)
         return one_hot
 
     def _labels_to_indices(self, sentences: List[Sentence]):
 
         indices = [
-            torch.LongTensor(
-                [
-                    self.label_dictionary.get_idx_for_item(label.value)
-                    for label in sentence.get_labels(self.label_type)
-                ]
-            )
+            sentence.get_label_indices(self.label_type, self.label_dictionary)
             for sentence in sentences
         ]
 
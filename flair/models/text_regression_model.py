@@ -44,10 +44,12 @@ class TextRegressor(flair.models.TextClassifier):
     def predict(
         self,
         sentences: Union[Sentence, List[Sentence]],
-        mini_batch_size: int = 32,
+        mini_batch_size: int = None,
         embedding_storage_mode="none",
     ) -> List[Sentence]:
 
+        mini_batch_size = self._resolve_mini_batch_size(mini_batch_size)
+
         with torch.no_grad():
             if type(sentences) is Sentence:
                 sentences = [sentences]
@@ -63,7 +65,8 @@ class TextRegressor(flair.models.TextClassifier):
             ]
 
             for batch in batches:
-                scores = self.forward(batch)
+                with self._inference_autocast():
+                    scores = self.forward(batch).float()
 
                 for (sentence, score) in zip(batch, scores.tolist()):
                     sentence.labels = [Label(value=str(score[0]))]
@@ -1,11 +1,12 @@
 import warnings
+from itertools import islice
 from pathlib import Path
 
 import torch.nn
 
 from abc import abstractmethod
 
-from typing import Union, List
+from typing import Union, List, Iterable, Iterator, Dict, Optional
 
 from torch.utils.data.dataset import Dataset
 
@@ -13,13 +14,23 @@ import flair
 from flair import file_utils
 from flair.data import DataPoint, Sentence
 from flair.datasets import DataLoader
-from flair.training_utils import Result
+from flair.tokenization import SentenceSplitter, SegtokSentenceSplitter
+from flair.training_utils import Result, check_inference_precision, inference_autocast
 
 
 class Model(torch.nn.Module):
     """Abstract base class for all downstream task models in Flair, such as SequenceTagger and TextClassifier.
     Every new type of model must implement these methods."""
 
+    # settings used by predict if none are passed, e.g. found by flair.inference_utils.tune_batch_size
+    inference_settings: Dict = None
+
+    # set by quantize, e.g. {"dtype": "qint8"}
+    quantization: Dict = None
+
+    # "bfloat16" to predict in reduced precision, see set_inference_precision
+    inference_precision: str = "float32"
+
     @abstractmethod
     def forward_loss(
         self, data_points: Union[List[DataPoint], DataPoint]
@@ -62,12 +73,173 @@ class Model(torch.nn.Module):
     def _fetch_model(model_name) -> str:
         return model_name
 
+    def _resolve_mini_batch_size(self, mini_batch_size: Optional[int]) -> int:
+        """Returns the given mini-batch size, or else the one in the inference settings of the model, or else 32."""
+        if mini_batch_size is not None:
+            return mini_batch_size
+        return (self.inference_settings or {}).get("mini_batch_size", 32)
+
+    def predict_stream(
+        self,
+        sentences: Iterable[Sentence],
+        max_tokens_per_batch: int = None,
+        window_size: int = 1000,
+        **predict_kwargs,
+    ) -> Iterator[Sentence]:
+        """
+        Predicts the sentences of an iterable lazily and yields them in input order, with the predictions added.
+        At most window_size sentences are read ahead. They are sorted by length and grouped into mini-batches of at
+        most max_tokens_per_batch tokens (counting padding). A sentence is yielded as soon as it and all sentences
+        before it are predicted, so memory use depends on the window size and not on the number of sentences.
+        :param sentences: an iterable of Sentences, e.g. a generator that reads them from a file
+        :param max_tokens_per_batch: maximum number of tokens in a mini-batch, counted as the length of its longest
+        sentence times the number of sentences. Longer sentences are predicted in a mini-batch of their own. By
+        default the one in the inference settings of the model, or else 2000
+        :param window_size: number of sentences that are read ahead and sorted by length
+        :param predict_kwargs: further arguments passed to the predict method of the model, e.g. label_name
+        """
+        predict_kwargs.pop("mini_batch_size", None)
+
+        if max_tokens_per_batch is None:
+            max_tokens_per_batch = (self.inference_settings or {}).get("max_tokens_per_batch", 2000)
+
+        iterator = iter(sentences)
+        while True:
+            window: List[Sentence] = list(islice(iterator, window_size))
+            if not window:
+                return
+
+            # sort by length so that sentences of similar length share a mini-batch
+            order = sorted(range(len(window)), key=lambda index: len(window[index]), reverse=True)
+
+            predicted = [False] * len(window)
+            next_index = 0
+            for batch_indices in self._split_by_token_budget(order, [len(sentence) for sentence in window],
+                                                             max_tokens_per_batch):
+                batch = [window[index] for index in batch_indices]
+                self.predict(batch, mini_batch_size=len(batch), **predict_kwargs)
+
+                for index in batch_indices:
+                    predicted[index] = True
+                while next_index < len(window) and predicted[next_index]:
+                    yield window[next_index]
+                    window[next_index] = None
+                    next_index += 1
+
+    @staticmethod
+    def _split_by_token_budget(order: List[int], lengths: List[int], max_tokens: int) -> List[List[int]]:
+        """
+        Splits indices ordered by decreasing length into batches in which the longest length times the batch size
+        does not exceed max_tokens.
+        """
+        batches = []
+        batch = []
+        for index in order:
+            # the first sentence of a batch is its longest
+            if batch and (len(batch) + 1) * max(lengths[batch[0]], 1) > max_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def predict_documents(
+        self,
+        documents: Union[str, List[str]],
+        sentence_splitter: SentenceSplitter = None,
+        **predict_kwargs,
+    ) -> List[List[Sentence]]:
+        """
+        Splits documents into sentences and predicts the sentences of all documents in one call, so that mini-batches
+        are filled with sentences of similar length from different documents. Returns the predicted sentences of
+        each document. Their start_pos and end_pos are character offsets in the document, so sentence labels can be
+        mapped back directly. Use Sentence.get_document_spans to get the spans of a tagger at document offsets.
+        Sentences without tokens are left out, so empty documents have no sentences.
+        :param documents: a document or a list of documents
+        :param sentence_splitter: the SentenceSplitter used to split the documents, SegtokSentenceSplitter by default
+        :param predict_kwargs: further arguments passed to the predict method of the model, e.g. mini_batch_size
+        """
+        if isinstance(documents, str):
+            documents = [documents]
+
+        if sentence_splitter is None:
+            sentence_splitter = SegtokSentenceSplitter()
+
+        # sentences without tokens are dropped, e.g. the empty sentence some splitters return for empty documents
+        document_sentences = [
+            [sentence for sentence in sentence_splitter.split(document) if len(sentence) > 0] for document in documents
+        ]
+
+        # predict sorts all sentences by length before batching them
+        all_sentences = [sentence for sentences in document_sentences for sentence in sentences]
+        if all_sentences:
+            self.predict(all_sentences, **predict_kwargs)
+
+        return document_sentences
+
+    def quantize(self, dtype: torch.dtype = torch.qint8):
+        """
+        Applies dynamic quantization to all LSTM, GRU and Linear layers of the model and its embeddings, e.g. the
+        RNN and linear layers of a SequenceTagger, the decoder of a TextClassifier, the language model of
+        FlairEmbeddings and the transformer of TransformerWordEmbeddings. Their weights are stored as 8 bit integers
+        and activations are quantized on the fly, which makes inference on CPU faster and the model smaller.
+        Quantized models only run on CPU and cannot be trained. They are saved and loaded like other models.
+        See flair.inference_utils.quantize_and_evaluate to measure the change in accuracy.
+        :param dtype: torch.qint8, or torch.float16 to only store the weights in half precision
+        """
+        if any(parameter.device.type != "cpu" for parameter in self.parameters()):
+            raise ValueError("Only models on CPU can be quantized, set flair.device to 'cpu' before loading the model.")
+
+        self.eval()
+        torch.quantization.quantize_dynamic(
+            self, {torch.nn.LSTM, torch.nn.GRU, torch.nn.Linear}, dtype=dtype, inplace=True
+        )
+        self.quantization = {"dtype": str(dtype).replace("torch.", "")}
+        return self
+
+    def load_state_dict(self, state_dict, strict: bool = True):
+        # the layers of a quantized model are quantized before their weights are loaded
+        if isinstance(state_dict, _QuantizedStateDict):
+            self.quantize(dtype=getattr(torch, state_dict.quantization["dtype"]))
+            state_dict = state_dict.state_dict
+        return super(Model, self).load_state_dict(state_dict, strict)
+
+    def set_inference_precision(self, precision: str):
+        """
+        Sets the precision of predict. With "bfloat16", the embeddings and the layers of the model run under bfloat16
+        autocast and the embeddings of tokens are stored in bfloat16, which halves their memory and bandwidth. RNNs,
+        the CRF and the softmax confidences still run in float32. This is fastest on CPUs with native bfloat16
+        support and needs torch 1.10 or newer. The precision is saved with the model.
+        :param precision: "float32" or "bfloat16"
+        """
+        check_inference_precision(precision)
+        for module in self.modules():
+            if isinstance(module, flair.embeddings.Embeddings):
+                module.inference_precision = precision
+        self.inference_precision = precision
+        return self
+
+    def _inference_autocast(self):
+        """Returns the context in which predict runs the model, which applies the inference precision."""
+        return inference_autocast(self.inference_precision if not self.training else "float32")
+
+    @property
+    def _inference_dtype(self) -> torch.dtype:
+        return torch.bfloat16 if self.inference_precision == "bfloat16" and not self.training else torch.float
+
     def save(self, model_file: Union[str, Path]):
         """
         Saves the current model to the provided file.
         :param model_file: the model file
         """
         model_state = self._get_state_dict()
+        if self.inference_settings:
+            model_state["inference_settings"] = self.inference_settings
+        if self.quantization:
+            model_state["quantization"] = self.quantization
+        if self.inference_precision != "float32":
+            model_state["inference_precision"] = self.inference_precision
 
         torch.save(model_state, str(model_file), pickle_protocol=4)
 
@@ -87,7 +259,14 @@ class Model(torch.nn.Module):
             f = file_utils.load_big_file(str(model_file))
             state = torch.load(f, map_location='cpu')
 
+        if "quantization" in state:
+            state["state_dict"] = _QuantizedStateDict(state["state_dict"], state["quantization"])
+
         model = cls._init_model_with_state_dict(state)
+        if "inference_settings" in state:
+            model.inference_settings = state["inference_settings"]
+        if "inference_precision" in state:
+            model.set_inference_precision(state["inference_precision"])
 
         model.eval()
         model.to(flair.device)
@@ -95,6 +274,14 @@ class Model(torch.nn.Module):
         return model
 
 
+class _QuantizedStateDict:
+    """The weights of a quantized model, which Model.load_state_dict loads after quantizing the model."""
+
+    def __init__(self, state_dict: Dict, quantization: Dict):
+        self.state_dict = state_dict
+        self.quantization = quantization
+
+
 class LockedDropout(torch.nn.Module):
     """
     Implementation of locked (or variational) dropout. Randomly drops out entire parameters in embedding space.
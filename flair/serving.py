@@ -0,0 +1,406 @@
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import List, Union, Dict
+
+import numpy as np
+
+from flair.data import Sentence, Token
+from flair.inference_utils import _label_names, _predictions_to_dict
+
+log = logging.getLogger("flair")
+
+
+class _Request:
+    def __init__(self, sentences: List[Sentence]):
+        self.sentences = sentences
+        self.received = time.time()
+        self.done = threading.Event()
+        self.error: Exception = None
+
+
+class ServedModel:
+    """
+    A SequenceTagger, MultiTagger or TextClassifier that is kept loaded and predicts the requests of many clients.
+
+    Requests are put into a bounded queue and collected by a worker thread into batches of up to max_batch_size
+    sentences, waiting at most max_wait_time seconds after the first request for more to arrive. If the queue is
+    full, new requests are rejected, so clients can back off instead of piling up latency.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size: int = 32,
+        max_wait_time: float = 0.005,
+        max_queue_size: int = 256,
+        **predict_kwargs,
+    ):
+        """
+        :param model: a SequenceTagger, MultiTagger or TextClassifier
+        :param max_batch_size: maximum number of sentences predicted at once. A request with more sentences is
+        predicted on its own
+        :param max_wait_time: maximum time in seconds a request waits for further requests to share its batch
+        :param max_queue_size: maximum number of waiting requests, further requests are rejected
+        :param predict_kwargs: further arguments passed to the predict method of the model, e.g. label_name
+        """
+        if predict_kwargs.get("return_loss", False):
+            raise ValueError("Losses cannot be computed by a ServedModel.")
+
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.predict_kwargs = predict_kwargs
+        self.label_names: List[str] = _label_names(model, predict_kwargs)
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._next_request: _Request = None
+        self._worker: threading.Thread = None
+
+        # metrics, guarded by the lock
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._requests = 0
+        self._rejected = 0
+        self._failed = 0
+        self._sentences = 0
+        self._batches = 0
+        self._latencies: deque = deque(maxlen=1000)
+
+    def start(self):
+        """Starts the worker thread."""
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        """Stops the worker thread after the requests in the queue are predicted."""
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def submit(self, sentences: List[Sentence]) -> _Request:
+        """
+        Queues the sentences for prediction. Wait for the done event of the returned request to get the results.
+        :raises queue.Full: if the queue holds max_queue_size requests
+        """
+        request = _Request(sentences)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise
+        return request
+
+    def predict(self, sentences: List[Sentence], timeout: float = None) -> List[Sentence]:
+        """
+        Predicts the sentences together with the requests of other threads and returns them.
+        :raises queue.Full: if the queue holds max_queue_size requests
+        """
+        request = self.submit(sentences)
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"No predictions after {timeout} seconds.")
+        if request.error is not None:
+            raise request.error
+        return sentences
+
+    def _get_request(self, timeout: float = None) -> _Request:
+        if self._next_request is not None:
+            request, self._next_request = self._next_request, None
+            return request
+        return self._queue.get(timeout=timeout)
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            request = self._get_request()
+            if request is None:
+                break
+            requests = [request]
+            size = len(request.sentences)
+
+            deadline = time.time() + self.max_wait_time
+            while size < self.max_batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._get_request(timeout)
+                except queue.Empty:
+                    break
+
+                if request is None:
+                    stopped = True
+                    break
+                # a request that does not fit starts the next batch
+                if size + len(request.sentences) > self.max_batch_size:
+                    self._next_request = request
+                    break
+                requests.append(request)
+                size += len(request.sentences)
+
+            self._predict(requests)
+
+    def _predict(self, requests: List[_Request]):
+        batch = [sentence for request in requests for sentence in request.sentences]
+        error = None
+        try:
+            # models of a registry predict in parallel, each with the embedding storage mode of its own thread
+            self.model.predict(batch, mini_batch_size=self.max_batch_size, **self.predict_kwargs)
+        except Exception as exception:
+            log.exception(f"Prediction of {len(batch)} sentence(s) failed")
+            error = exception
+
+        now = time.time()
+        with self._lock:
+            self._batches += 1
+            for request in requests:
+                self._requests += 1
+                if error is not None:
+                    self._failed += 1
+                else:
+                    self._sentences += len(request.sentences)
+                    self._latencies.append(now - request.received)
+
+        for request in requests:
+            request.error = error
+            request.done.set()
+
+    def metrics(self) -> Dict:
+        """
+        Returns the number of predicted, rejected and failed requests, the throughput in sentences per second since
+        the model was loaded and the latency percentiles in milliseconds of the last 1000 requests.
+        """
+        with self._lock:
+            elapsed = time.time() - self._started
+            metrics = {
+                "requests": self._requests,
+                "rejected": self._rejected,
+                "failed": self._failed,
+                "sentences": self._sentences,
+                "batches": self._batches,
+                "queued": self._queue.qsize(),
+                "mean_batch_size": self._sentences / self._batches if self._batches > 0 else 0.0,
+                "sentences_per_second": self._sentences / elapsed if elapsed > 0 else 0.0,
+            }
+            if self._latencies:
+                latencies = np.array(self._latencies) * 1000
+                for percentile in [50, 95, 99]:
+                    metrics[f"latency_p{percentile}_ms"] = float(np.percentile(latencies, percentile))
+        return metrics
+
+    def to_dict(self, sentence: Sentence) -> Dict:
+        """Returns the predicted sentence labels and spans of a sentence in a form that can be serialized to JSON."""
+        return _predictions_to_dict(sentence, self.label_names)
+
+
+class ModelRegistry:
+    """
+    Loads models by name and keeps them warm for serving.
+
+    >>> from flair.serving import ModelRegistry, InferenceServer
+    >>> registry = ModelRegistry()
+    >>> registry.load("ner", "ner-fast")
+    >>> registry.load("sentiment", "sentiment", model_type="classifier")
+    >>> InferenceServer(registry, port=8080).serve_forever()
+    """
+
+    def __init__(self):
+        self.models: Dict[str, ServedModel] = {}
+
+    def register(self, name: str, model, **options) -> ServedModel:
+        """
+        Serves an already loaded model under the given name.
+        :param options: arguments of ServedModel, e.g. max_batch_size, and of the predict method of the model
+        """
+        if name in self.models:
+            raise ValueError(f'A model with the name "{name}" is already registered.')
+        served_model = ServedModel(model, **options)
+        served_model.start()
+        self.models[name] = served_model
+        return served_model
+
+    def load(self, name: str, model: Union[str, List[str]], model_type: str = "tagger", **options) -> ServedModel:
+        """
+        Loads a model and serves it under the given name.
+        :param model: a model name or path, or a list of them for a 'multi-tagger'
+        :param model_type: 'tagger', 'multi-tagger' or 'classifier'
+        :param options: arguments of ServedModel, e.g. max_batch_size, and of the predict method of the model
+        """
+        from flair.models import SequenceTagger, MultiTagger, TextClassifier
+
+        if model_type == "tagger":
+            loaded_model = SequenceTagger.load(model)
+        elif model_type == "multi-tagger":
+            loaded_model = MultiTagger.load(model)
+        elif model_type == "classifier":
+            loaded_model = TextClassifier.load(model)
+        else:
+            raise ValueError(f'Unknown model type "{model_type}", use "tagger", "multi-tagger" or "classifier".')
+
+        log.info(f'Serving {type(loaded_model).__name__} "{model}" as "{name}"')
+        return self.register(name, loaded_model, **options)
+
+    def __getitem__(self, name: str) -> ServedModel:
+        return self.models[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.models
+
+    def metrics(self) -> Dict[str, Dict]:
+        return {name: served_model.metrics() for name, served_model in self.models.items()}
+
+    def stop(self):
+        """Stops the worker threads of all models."""
+        for served_model in self.models.values():
+            served_model.stop()
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /models                 names and types of the served models
+    GET  /metrics                metrics of all served models
+    POST /models/<name>/predict  {"sentences": ["I love Berlin .", ...], "use_tokenizer": true}
+    """
+
+    server: "InferenceServer"
+
+    def do_GET(self):
+        if self.path == "/models":
+            models = {name: type(served_model.model).__name__ for name, served_model in self.server.registry.models.items()}
+            self._send_json(200, {"models": models})
+        elif self.path == "/metrics":
+            self._send_json(200, {"models": self.server.registry.metrics()})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "models" or parts[2] != "predict":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        if parts[1] not in self.server.registry:
+            self._send_json(404, {"error": f'Unknown model "{parts[1]}"'})
+            return
+        served_model = self.server.registry[parts[1]]
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+            texts = body["sentences"]
+            use_tokenizer = body.get("use_tokenizer", True)
+            if not isinstance(texts, list):
+                raise ValueError('"sentences" must be a list')
+            if not isinstance(use_tokenizer, bool):
+                raise ValueError('"use_tokenizer" must be true or false')
+            sentences = [_to_sentence(text, use_tokenizer) for text in texts]
+        except (ValueError, KeyError, TypeError) as error:
+            self._send_json(400, {"error": f"Invalid request: {error}"})
+            return
+
+        non_empty = [sentence for sentence in sentences if len(sentence) > 0]
+        if non_empty:
+            try:
+                request = served_model.submit(non_empty)
+            except queue.Full:
+                self._send_json(503, {"error": "Too many requests, try again later"}, {"Retry-After": "1"})
+                return
+            request.done.wait()
+            if request.error is not None:
+                self._send_json(500, {"error": f"Prediction failed: {request.error}"})
+                return
+
+        self._send_json(200, {"sentences": [served_model.to_dict(sentence) for sentence in sentences]})
+
+    def _send_json(self, status: int, content: Dict, headers: Dict[str, str] = None):
+        data = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.debug(f"{self.address_string()} {format % args}")
+
+
+def _to_sentence(text: Union[str, List[str]], use_tokenizer: bool) -> Sentence:
+    """Returns the Sentence of a plain text, or of a list of tokens, which are used as they are."""
+    if isinstance(text, str):
+        return Sentence(text, use_tokenizer=use_tokenizer)
+
+    if not isinstance(text, list) or not all(isinstance(token, str) and token.strip() for token in text):
+        raise ValueError("sentences must be strings or lists of non-empty strings")
+    sentence = Sentence()
+    for token in text:
+        sentence.add_token(Token(token))
+    return sentence
+
+
+class InferenceServer(ThreadingMixIn, HTTPServer):
+    """
+    A local HTTP server that predicts JSON batches of sentences with the models of a ModelRegistry. Each request
+    is handled in its own thread and waits for its batch, the models are applied by their own worker threads.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, registry: ModelRegistry, host: str = "127.0.0.1", port: int = 8080):
+        super(InferenceServer, self).__init__((host, port), _RequestHandler)
+        self.registry = registry
+
+
+def main(arguments: List[str] = None):
+    parser = argparse.ArgumentParser(description="Serve Flair models over HTTP.")
+    parser.add_argument("--tagger", action="append", default=[], metavar="NAME=MODEL", help="serve a SequenceTagger")
+    parser.add_argument(
+        "--multi-tagger", action="append", default=[], metavar="NAME=MODEL[,MODEL...]", help="serve a MultiTagger"
+    )
+    parser.add_argument(
+        "--classifier", action="append", default=[], metavar="NAME=MODEL", help="serve a TextClassifier"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-time", type=float, default=0.005, help="in seconds")
+    parser.add_argument("--max-queue-size", type=int, default=256)
+    args = parser.parse_args(arguments)
+
+    options = dict(
+        max_batch_size=args.max_batch_size, max_wait_time=args.max_wait_time, max_queue_size=args.max_queue_size
+    )
+
+    registry = ModelRegistry()
+    for model_type, specs in [("tagger", args.tagger), ("multi-tagger", args.multi_tagger),
+                              ("classifier", args.classifier)]:
+        for spec in specs:
+            name, _, model = spec.partition("=")
+            if not model:
+                parser.error(f'"{spec}" is not of the form NAME=MODEL')
+            registry.load(name, model.split(",") if model_type == "multi-tagger" else model, model_type, **options)
+
+    if not registry.models:
+        parser.error("Pass at least one model with --tagger, --multi-tagger or --classifier")
+
+    server = InferenceServer(registry, args.host, args.port)
+    log.info(f"Serving {len(registry.models)} model(s) on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        registry.stop()
+
+
+if __name__ == "__main__":
+    main()
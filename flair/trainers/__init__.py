@@ -1 +1,2 @@
 from .trainer import ModelTrainer
+from .distillation_trainer import DistillationTrainer
@@ -0,0 +1,244 @@
+import logging
+from pathlib import Path
+from typing import List, Union, Dict
+
+import torch
+import torch.nn.functional as F
+from torch.optim.sgd import SGD
+
+import flair
+from flair.data import Corpus, Dictionary, Sentence
+from flair.datasets import DataLoader
+from flair.models import SequenceTagger, TextClassifier
+from flair.trainers.trainer import ModelTrainer
+from flair.training_utils import log_line, store_embeddings
+
+log = logging.getLogger("flair")
+
+
+class DistillationTrainer(ModelTrainer):
+    def __init__(
+        self,
+        model: Union[SequenceTagger, TextClassifier],
+        teacher: Union[SequenceTagger, TextClassifier],
+        corpus: Corpus,
+        optimizer: torch.optim.Optimizer = SGD,
+        epoch: int = 0,
+        use_tensorboard: bool = False,
+        temperature: float = 2.0,
+        alpha: float = 0.5,
+    ):
+        """
+        Initialize a trainer that distills a large teacher into a smaller student model. The student is trained on
+        the soft targets of the teacher mixed with its regular loss on the gold labels. The teacher scores are
+        computed once per sentence and cached, so the teacher does not run again in later epochs.
+        :param model: The student model, a SequenceTagger (with or without CRF) or a TextClassifier
+        :param teacher: A trained model of the same type that predicts the same tag or label type. If it is a
+        SequenceTagger with CRF, its tag marginals are used as soft targets
+        :param corpus: The dataset used to train the model, should be of type Corpus
+        :param optimizer: The optimizer to use (typically SGD or Adam)
+        :param epoch: The starting epoch (normally 0 but could be higher if you continue training model)
+        :param use_tensorboard: If True, writes out tensorboard information
+        :param temperature: Teacher and student scores are divided by the temperature to soften the distributions.
+        For taggers with CRF, the emission and transition scores are divided before the marginals are computed
+        :param alpha: Weight of the distillation loss. The loss on the gold labels is weighted with 1 - alpha
+        """
+        super(DistillationTrainer, self).__init__(
+            model, corpus, optimizer=optimizer, epoch=epoch, use_tensorboard=use_tensorboard
+        )
+
+        if isinstance(model, SequenceTagger) and isinstance(teacher, SequenceTagger):
+            teacher_dictionary, student_dictionary = teacher.tag_dictionary, model.tag_dictionary
+        elif isinstance(model, TextClassifier) and isinstance(teacher, TextClassifier):
+            if model.multi_label != teacher.multi_label:
+                raise ValueError("Student and teacher must both be multi-label or both be single-label classifiers.")
+            teacher_dictionary, student_dictionary = teacher.label_dictionary, model.label_dictionary
+        else:
+            raise ValueError(
+                f"Student and teacher must both be SequenceTaggers or both be TextClassifiers, "
+                f"but are {type(model).__name__} and {type(teacher).__name__}."
+            )
+
+        if not 0.0 <= alpha <= 1.0:
+            raise ValueError(f"alpha must be between 0 and 1, but is {alpha}.")
+
+        self.teacher = teacher
+        self.teacher.eval()
+        self.temperature: float = temperature
+        self.alpha: float = alpha
+
+        self.teacher_columns: torch.Tensor = self._map_dictionaries(teacher_dictionary, student_dictionary)
+
+        # teacher scores in the order of the student dictionary, keyed by the tokenized text of each sentence
+        self.teacher_scores: Dict[str, torch.Tensor] = {}
+
+    def train(self, base_path: Union[Path, str], *args, teacher_mini_batch_size: int = 32, **kwargs) -> dict:
+        """
+        Computes the teacher scores of all training sentences and then trains the student like ModelTrainer.train.
+        Scores of sentences that are not in the training split (or the dev split if train_with_dev is set) are
+        computed when they are first seen.
+        :param teacher_mini_batch_size: Size of the mini-batches in which the teacher is applied
+        """
+        train_data = [self.corpus.train]
+        if kwargs.get("train_with_dev", False) and self.corpus.dev:
+            train_data.append(self.corpus.dev)
+
+        log_line(log)
+        log.info(f'Computing teacher scores with "{type(self.teacher).__name__}"')
+        for data in train_data:
+            for batch in DataLoader(data, batch_size=teacher_mini_batch_size):
+                self._add_teacher_scores(batch)
+        log.info(f"Cached teacher scores of {len(self.teacher_scores)} sentence(s)")
+
+        return super(DistillationTrainer, self).train(base_path, *args, **kwargs)
+
+    def _forward_loss(self, data_points: List[Sentence]) -> torch.Tensor:
+
+        # the teacher runs before the student embeds the batch, so embeddings with the same name do not clash
+        self._add_teacher_scores(data_points)
+
+        teacher_scores = [self.teacher_scores[sentence.to_tokenized_string()] for sentence in data_points]
+
+        if isinstance(self.model, SequenceTagger):
+            features = self.model._forward_features(data_points)
+            gold_loss = self.model._calculate_loss(features, data_points)
+            distillation_loss = self._tagger_distillation_loss(features, teacher_scores, data_points)
+        else:
+            scores = self.model.forward(data_points)
+            gold_loss = self.model._calculate_loss(scores, data_points)
+            distillation_loss = self._classifier_distillation_loss(scores, teacher_scores)
+
+        return self.alpha * distillation_loss + (1.0 - self.alpha) * gold_loss
+
+    def _tagger_distillation_loss(
+        self, features: torch.Tensor, teacher_scores: List[torch.Tensor], sentences: List[Sentence]
+    ) -> torch.Tensor:
+
+        lengths: List[int] = [len(sentence.tokens) for sentence in sentences]
+
+        # log probabilities of all tokens without padding, as [total_tokens, tagset_size]
+        if self.model.use_crf:
+            student_log_probs = self.model._log_marginals(features, lengths, temperature=self.temperature)
+        else:
+            student_log_probs = F.log_softmax(features / self.temperature, dim=-1)
+        if not self.model._flat_token_mode:
+            mask = torch.arange(features.shape[1], device=flair.device)[None, :] < \
+                   torch.tensor(lengths, device=flair.device)[:, None]
+            student_log_probs = student_log_probs[mask]
+
+        # the log marginals of CRF teachers are cached at the temperature already
+        teacher_scores = torch.cat(teacher_scores).to(flair.device)
+        if not self.teacher.use_crf:
+            teacher_scores = teacher_scores / self.temperature
+        teacher_log_probs = F.log_softmax(teacher_scores, dim=1)
+
+        token_losses = self._kl_divergence(teacher_log_probs, student_log_probs)
+
+        # reduce like the gold loss: CRF losses are summed over the tokens of a sentence, others averaged
+        sentence_index = self.model._token_to_sentence_index(lengths)
+        sentence_losses = token_losses.new_zeros(len(lengths)).index_add(0, sentence_index, token_losses)
+        if not self.model.use_crf:
+            sentence_losses = sentence_losses / torch.tensor(lengths, dtype=torch.float, device=flair.device)
+
+        return sentence_losses.mean() * self.temperature ** 2
+
+    def _classifier_distillation_loss(self, scores: torch.Tensor, teacher_scores: List[torch.Tensor]) -> torch.Tensor:
+
+        teacher_scores = torch.stack(teacher_scores).to(flair.device) / self.temperature
+
+        if self.model.multi_label:
+            loss = F.binary_cross_entropy_with_logits(scores / self.temperature, torch.sigmoid(teacher_scores))
+        else:
+            loss = self._kl_divergence(
+                F.log_softmax(teacher_scores, dim=1), F.log_softmax(scores / self.temperature, dim=1)
+            ).mean()
+
+        return loss * self.temperature ** 2
+
+    @staticmethod
+    def _kl_divergence(target_log_probs: torch.Tensor, log_probs: torch.Tensor) -> torch.Tensor:
+        return (target_log_probs.exp() * (target_log_probs - log_probs)).sum(dim=-1)
+
+    def _add_teacher_scores(self, sentences: List[Sentence]):
+        """
+        Computes the teacher scores of the sentences that have none cached yet. The scores are the logits of the
+        teacher, or for taggers with CRF the log marginals at the temperature of the trainer, in the order of the
+        student dictionary.
+        """
+        keys = []
+        batch = []
+        for sentence in sentences:
+            key = sentence.to_tokenized_string()
+            if key not in self.teacher_scores and key not in keys:
+                keys.append(key)
+                batch.append(sentence)
+
+        if not batch:
+            return
+
+        with torch.no_grad():
+            if isinstance(self.teacher, SequenceTagger):
+                lengths: List[int] = [len(sentence.tokens) for sentence in batch]
+                features = self.teacher._forward_features(batch)
+                if self.teacher.use_crf:
+                    features = self.teacher._log_marginals(features, lengths, temperature=self.temperature)
+                features = features.cpu()
+
+                if self.teacher._flat_token_mode:
+                    sentence_scores = self.teacher._split_by_lengths(features, lengths)
+                else:
+                    sentence_scores = [features[index, :length] for index, length in enumerate(lengths)]
+            else:
+                sentence_scores = list(self.teacher.forward(batch).cpu())
+
+        for key, scores in zip(keys, sentence_scores):
+            self.teacher_scores[key] = self._to_student_columns(scores)
+
+        # the embeddings of the teacher are not needed by the student
+        store_embeddings(batch, "none")
+
+    def _to_student_columns(self, scores: torch.Tensor) -> torch.Tensor:
+        # tags or labels the teacher does not know get a very low score
+        student_scores = scores.new_full(scores.shape[:-1] + self.teacher_columns.shape, -10000.0)
+        known = self.teacher_columns >= 0
+        student_scores[..., known] = scores[..., self.teacher_columns[known]]
+        return student_scores
+
+    @staticmethod
+    def _map_dictionaries(teacher_dictionary: Dictionary, student_dictionary: Dictionary) -> torch.Tensor:
+        """
+        Returns for each item of the student dictionary the index of the same item in the teacher dictionary, or -1
+        if the teacher dictionary does not contain it.
+        """
+        columns = [teacher_dictionary.item2idx.get(item, -1) for item in student_dictionary.idx2item]
+
+        missing = [
+            item.decode("UTF-8") for item, column in zip(student_dictionary.idx2item, columns)
+            if column < 0 and item.decode("UTF-8") not in ["<unk>", "<START>", "<STOP>"]
+        ]
+        if len(missing) == len(columns):
+            raise ValueError("Student and teacher dictionary have no tags or labels in common.")
+        if missing:
+            log.warning(f"The teacher does not predict {missing}, these get no probability in the soft targets.")
+
+        return torch.tensor(columns, dtype=torch.long)
+
+    def save_checkpoint(self, model_file: Union[str, Path]):
+        teacher, teacher_scores = self.teacher, self.teacher_scores
+        self.teacher, self.teacher_scores = None, {}
+        super(DistillationTrainer, self).save_checkpoint(model_file)
+        self.teacher, self.teacher_scores = teacher, teacher_scores
+
+    @classmethod
+    def load_checkpoint(
+        cls, checkpoint: Union[Path, str], corpus: Corpus, teacher: Union[SequenceTagger, TextClassifier] = None
+    ):
+        """
+        Loads a checkpoint. The teacher is not part of the checkpoint and must be passed again.
+        """
+        if teacher is None:
+            raise ValueError("Pass the teacher to continue distillation from a checkpoint.")
+        trainer: DistillationTrainer = super(DistillationTrainer, cls).load_checkpoint(checkpoint, corpus)
+        teacher.eval()
+        trainer.teacher = teacher
+        return trainer
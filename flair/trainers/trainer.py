@@ -18,7 +18,7 @@ except ImportError:
 
 import flair
 import flair.nn
-from flair.data import MultiCorpus, Corpus
+from flair.data import MultiCorpus, Corpus, DataPoint
 from flair.datasets import DataLoader
 from flair.optim import ExpAnnealLR
 from flair.training_utils import (
@@ -368,7 +368,7 @@ class ModelTrainer:
                     for batch_step in batch_steps:
 
                         # forward pass
-                        loss = self.model.forward_loss(batch_step)
+                        loss = self._forward_loss(batch_step)
 
                         # Backward
                         if use_amp:
@@ -623,6 +623,10 @@ class ModelTrainer:
             "dev_loss_history": dev_loss_history,
         }
 
+    def _forward_loss(self, data_points: List[DataPoint]) -> torch.Tensor:
+        """Returns the training loss of the model on a mini-batch. Override this to train with another objective."""
+        return self.model.forward_loss(data_points)
+
     def save_checkpoint(self, model_file: Union[str, Path]):
         corpus = self.corpus
         self.corpus = None
@@ -722,7 +726,7 @@ class ModelTrainer:
                 step += 1
 
                 # forward pass
-                loss = self.model.forward_loss(batch)
+                loss = self._forward_loss(batch)
 
                 # update optimizer and scheduler
                 optimizer.zero_grad()
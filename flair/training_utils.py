@@ -1,3 +1,4 @@
+import contextlib
 import itertools
 import random
 import logging
@@ -7,6 +8,7 @@ from math import inf
 from pathlib import Path
 from typing import Union, List
 
+import torch
 from torch.optim import Optimizer
 
 import flair
@@ -36,17 +38,17 @@ class Metric(object):
         self._tns = defaultdict(int)
         self._fns = defaultdict(int)
 
-    def add_tp(self, class_name):
-        self._tps[class_name] += 1
+    def add_tp(self, class_name, count: int = 1):
+        self._tps[class_name] += count
 
-    def add_tn(self, class_name):
-        self._tns[class_name] += 1
+    def add_tn(self, class_name, count: int = 1):
+        self._tns[class_name] += count
 
-    def add_fp(self, class_name):
-        self._fps[class_name] += 1
+    def add_fp(self, class_name, count: int = 1):
+        self._fps[class_name] += count
 
-    def add_fn(self, class_name):
-        self._fns[class_name] += 1
+    def add_fn(self, class_name, count: int = 1):
+        self._fns[class_name] += count
 
     def get_tp(self, class_name=None):
         if class_name is None:
@@ -542,5 +544,20 @@ def store_embeddings(sentences: List[Sentence], storage_mode: str):
         for sentence in sentences:
             sentence.to("cpu", pin_memory=pin_memory)
 
-    # record current embedding storage mode to allow optimization (for instance in FlairEmbeddings class)
-    flair.embedding_storage_mode = storage_mode
+    # record current embedding storage mode to allow optimization (for instance in FlairEmbeddings class), only for
+    # the current thread, so that threads predicting with other storage modes are not affected
+    flair._thread_local.embedding_storage_mode = storage_mode
+
+
+def check_inference_precision(precision: str):
+    if precision not in ["float32", "bfloat16"]:
+        raise ValueError(f"Inference precision must be 'float32' or 'bfloat16', not '{precision}'")
+    if precision == "bfloat16" and not hasattr(torch, "autocast"):
+        raise ValueError("bfloat16 inference needs torch 1.10 or newer")
+
+
+def inference_autocast(precision: str):
+    """Returns a context in which operations on flair.device run in the given inference precision."""
+    if precision == "bfloat16":
+        return torch.autocast(device_type=torch.device(flair.device).type, dtype=torch.bfloat16)
+    return contextlib.ExitStack()
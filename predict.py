@@ -1,11 +1,11 @@
-from flair.data import Sentence
-from flair.models import SequenceTagger
+# Bulk prediction from the command line, for example
+#
+#   python predict.py --model ner --sentence-splitter segtok < input.txt > output.jsonl
+#   python predict.py --model ner --input-format conll --output-format conll --workers 4 input.conll
+#
+# See "python predict.py --help" for all options.
 
-tagger: SequenceTagger = SequenceTagger.load("ner")
+from flair.bulk_inference import main
 
-sentence: Sentence = Sentence("George Washington went to Washington .")
-tagger.predict(sentence)
-
-print("Analysing %s" % sentence)
-print("\nThe following NER tags are found: \n")
-print(sentence.to_tagged_string())
+if __name__ == "__main__":
+    main()
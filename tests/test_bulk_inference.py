@@ -0,0 +1,70 @@
+import io
+import json
+
+import pytest
+
+import flair.datasets
+from flair.bulk_inference import bulk_predict, read_text, read_jsonl, read_conll, JsonlWriter, ConllWriter
+from flair.data import Sentence
+from flair.embeddings import WordEmbeddings
+from flair.models import SequenceTagger
+from flair.tokenization import SegtokSentenceSplitter, NoSentenceSplitter
+
+
+@pytest.fixture
+def tagger(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tagger = SequenceTagger(
+        hidden_size=32,
+        embeddings=WordEmbeddings("turian"),
+        tag_dictionary=corpus.make_tag_dictionary("ner"),
+        tag_type="ner",
+    )
+    tagger.eval()
+    return tagger
+
+
+@pytest.mark.integration
+def test_bulk_predict_text(tagger):
+    lines = ["I love Berlin. Ich liebe Paris.\n", "\n", "Berlin\n"] * 5
+
+    output = io.StringIO()
+    statistics = bulk_predict(
+        tagger, read_text(lines, SegtokSentenceSplitter()), JsonlWriter(output, ["ner"]), chunk_size=4
+    )
+    assert statistics["documents"] == 15 and statistics["sentences"] == 15
+
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [record["text"] for record in records] == [line.rstrip("\n") for line in lines]
+    assert [len(record["sentences"]) for record in records[:3]] == [2, 0, 1]
+
+    first = records[0]["sentences"][1]
+    assert lines[0][first["start_pos"]:first["end_pos"]] == first["text"] == "Ich liebe Paris."
+
+    expected = Sentence("Ich liebe Paris.")
+    tagger.predict(expected)
+    assert [entity["text"] for entity in first["entities"]] == [span.text for span in expected.get_spans("ner")]
+
+
+@pytest.mark.integration
+def test_bulk_predict_jsonl_and_conll(tagger):
+    lines = [json.dumps({"id": index, "body": "I love Berlin ."}) + "\n" for index in range(3)]
+
+    output = io.StringIO()
+    bulk_predict(tagger, read_jsonl(lines, NoSentenceSplitter(), text_field="body"), ConllWriter(output, ["ner"]))
+    assert output.getvalue().count("\n\n") == 3
+
+    conll = output.getvalue().splitlines(keepends=True)
+    output = io.StringIO()
+    bulk_predict(tagger, read_conll(conll), ConllWriter(output, ["ner"]), chunk_size=2)
+
+    # the columns of the input are kept and a column is added for the new predictions
+    rows = [line.split("\t") for line in output.getvalue().splitlines() if line]
+    assert len(rows) == 12
+    assert all(len(row) == 3 and row[1] == row[2] for row in rows)
+
+    output = io.StringIO()
+    bulk_predict(tagger, read_jsonl(lines, NoSentenceSplitter(), text_field="body"), JsonlWriter(output, ["ner"]))
+    assert [json.loads(line)["id"] for line in output.getvalue().splitlines()] == [0, 1, 2]
@@ -0,0 +1,86 @@
+import pytest
+
+import flair.datasets
+from flair.data import Sentence
+from flair.embeddings import WordEmbeddings, DocumentPoolEmbeddings
+from flair.models import SequenceTagger, TextClassifier, CascadeModel
+
+turian_embeddings = WordEmbeddings("turian")
+
+
+def _make_tagger(tag_dictionary, use_crf):
+    tagger = SequenceTagger(
+        hidden_size=32,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=use_crf,
+    )
+    tagger.eval()
+    return tagger
+
+
+@pytest.mark.integration
+def test_cascade_tagger(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    fast_tagger = _make_tagger(tag_dictionary, use_crf=False)
+    accurate_tagger = _make_tagger(tag_dictionary, use_crf=True)
+
+    # nothing is below a threshold of 0, everything is below a threshold above 1
+    for criterion in ["token", "span"]:
+        for threshold, stage in [(0.0, "fast"), (1.1, "accurate")]:
+            sentences = [Sentence("I love Berlin"), Sentence("Ich liebe Berlin und Paris ."), Sentence("")]
+            expected = [Sentence("I love Berlin"), Sentence("Ich liebe Berlin und Paris ."), Sentence("")]
+
+            cascade = CascadeModel(fast_tagger, accurate_tagger, criterion=criterion, threshold=threshold)
+            cascade.predict(sentences)
+
+            expected_model = fast_tagger if stage == "fast" else accurate_tagger
+            expected_model.predict(expected)
+
+            for sentence, expected_sentence in zip(sentences[:2], expected[:2]):
+                assert sentence.get_labels("ner-stage")[0].value == stage
+                for token, expected_token in zip(sentence, expected_sentence):
+                    assert token.get_tag("ner").value == expected_token.get_tag("ner").value
+                    assert token.get_tag("ner").score == pytest.approx(expected_token.get_tag("ner").score)
+
+            # empty sentences count as fully confident
+            assert sentences[2].get_labels("ner-stage")[0].score == 1.0
+
+    # a custom criterion decides per sentence
+    sentences = [Sentence("I love Berlin"), Sentence("Ich liebe Berlin und Paris .")]
+    cascade = CascadeModel(
+        fast_tagger, accurate_tagger, criterion=lambda sentence, label_name: 1.0 / len(sentence), threshold=0.3
+    )
+    cascade.predict(sentences)
+    assert [sentence.get_labels("ner-stage")[0].value for sentence in sentences] == ["fast", "accurate"]
+
+
+@pytest.mark.integration
+def test_cascade_classifier(tasks_base_path):
+    corpus = flair.datasets.ClassificationCorpus(tasks_base_path / "imdb")
+    label_dict = corpus.make_label_dictionary()
+
+    fast_classifier = TextClassifier(DocumentPoolEmbeddings([turian_embeddings]), label_dict, multi_label=False)
+    accurate_classifier = TextClassifier(DocumentPoolEmbeddings([turian_embeddings]), label_dict, multi_label=False)
+    fast_classifier.eval()
+    accurate_classifier.eval()
+
+    cascade = CascadeModel(fast_classifier, accurate_classifier, criterion="label", threshold=1.1)
+
+    sentence = Sentence("Berlin is a really nice city.")
+    expected = Sentence("Berlin is a really nice city.")
+    cascade.predict(sentence)
+    accurate_classifier.predict(expected)
+
+    # only the labels of the accurate model remain
+    assert len(sentence.get_labels("label")) == 1
+    assert sentence.get_labels("label")[0].value == expected.get_labels("label")[0].value
+    assert sentence.get_labels("label-stage")[0].value == "accurate"
+
+    with pytest.raises(ValueError):
+        CascadeModel(fast_classifier, accurate_classifier, criterion="token")
@@ -2,6 +2,8 @@ import flair
 import os
 import pytest
 
+import numpy as np
+
 from typing import List
 
 from flair.data import (
@@ -518,6 +520,118 @@ def test_dictionary_save_and_load():
     os.remove(file_path)
 
 
+def test_sentence_tag_indices_are_cached():
+    dictionary: Dictionary = Dictionary(add_unk=False)
+    dictionary.add_item("O")
+    dictionary.add_item("B-LOC")
+
+    sentence: Sentence = Sentence("I love Berlin")
+    sentence[2].add_tag("ner", "B-LOC")
+
+    tag_indices = sentence.get_tag_indices("ner", dictionary)
+    assert [0, 0, 1] == tag_indices.tolist()
+    assert tag_indices is sentence.get_tag_indices("ner", dictionary)
+
+    # labels of other types do not invalidate the cache
+    sentence[0].add_tag("pos", "PRP")
+    assert tag_indices is sentence.get_tag_indices("ner", dictionary)
+
+    # changing a tag of this type does
+    sentence[2].add_tag("ner", "O")
+    assert [0, 0, 0] == sentence.get_tag_indices("ner", dictionary).tolist()
+
+    # so does growing the dictionary
+    sentence[1].add_tag("ner", "B-PER")
+    assert [0, 0, 0] == sentence.get_tag_indices("ner", dictionary).tolist()
+    dictionary.add_item("B-PER")
+    assert [0, 2, 0] == sentence.get_tag_indices("ner", dictionary).tolist()
+
+
+def test_sentence_label_tensors_are_cached():
+    dictionary: Dictionary = Dictionary(add_unk=False)
+    dictionary.add_item("class_1")
+    dictionary.add_item("class_2")
+    dictionary.add_item("class_3")
+
+    sentence: Sentence = Sentence("sentence 1").add_label("label", "class_2")
+
+    indices = sentence.get_label_indices("label", dictionary)
+    assert [1] == indices.tolist()
+    assert indices is sentence.get_label_indices("label", dictionary)
+    assert [0., 1., 0.] == sentence.get_label_one_hot("label", dictionary).tolist()
+
+    sentence.add_label("label", "class_3")
+    assert [1, 2] == sentence.get_label_indices("label", dictionary).tolist()
+    assert [0., 1., 1.] == sentence.get_label_one_hot("label", dictionary).tolist()
+
+    sentence.remove_labels("label")
+    assert [] == sentence.get_label_indices("label", dictionary).tolist()
+
+
+def test_sentence_tags_proba_dist():
+    dictionary: Dictionary = Dictionary(add_unk=False)
+    dictionary.add_item("O")
+    dictionary.add_item("B-LOC")
+
+    sentence: Sentence = Sentence("I love Berlin")
+    proba_dist = np.array([[0.9, 0.1], [0.8, 0.2], [0.3, 0.7]])
+
+    sentence.add_tags_proba_dist("ner", proba_dist, dictionary)
+
+    assert proba_dist is sentence.get_tags_proba_dist("ner")
+    assert sentence.get_tags_proba_dist("pos") is None
+
+    # labels for single tokens are created from the array
+    labels = sentence[2].get_tags_proba_dist("ner")
+    assert ["O", "B-LOC"] == [label.value for label in labels]
+    assert [0.3, 0.7] == [label.score for label in labels]
+    assert [] == sentence[2].get_tags_proba_dist("pos")
+
+
+def test_sentence_tag_predictions():
+    dictionary: Dictionary = Dictionary(add_unk=False)
+    dictionary.add_item("O")
+    dictionary.add_item("B-LOC")
+    dictionary.add_item("I-LOC")
+
+    sentence: Sentence = Sentence("I love New York")
+    sentence[0].add_tag("pos", "PRP")
+
+    sentence.add_tag_predictions("ner", np.array([0, 0, 1, 2]), np.array([0.9, 0.8, 0.7, 0.5]), dictionary)
+
+    assert [(2, 4, "LOC", 0.6)] == sentence.get_span_predictions("ner")
+
+    # labels are created on first access
+    assert "B-LOC" == sentence[2].get_tag("ner").value
+    assert 0.7 == sentence[2].get_tag("ner").score
+    assert "PRP" == sentence[0].get_tag("pos").value
+
+    spans = sentence.get_spans("ner")
+    assert 1 == len(spans)
+    assert "New York" == spans[0].text
+    assert "LOC" == spans[0].tag
+
+    tag_ids, scores = sentence.get_tag_predictions("ner")
+    assert [0, 0, 1, 2] == tag_ids.tolist()
+    assert sentence.get_tag_predictions("pos") is None
+
+
+def test_sentence_document_spans():
+    dictionary: Dictionary = Dictionary(add_unk=False)
+    dictionary.add_item("O")
+    dictionary.add_item("B-LOC")
+    dictionary.add_item("I-LOC")
+
+    document = "Hello there. I love New York."
+    sentence: Sentence = Sentence("I love New York.", use_tokenizer=SegtokTokenizer(), start_position=13)
+
+    sentence.add_tag_predictions("ner", np.array([0, 0, 1, 2, 0]), np.array([0.9, 0.8, 0.7, 0.5, 0.9]), dictionary)
+
+    spans = sentence.get_document_spans("ner")
+    assert [(20, 28, "LOC", 0.6)] == spans
+    assert "New York" == document[spans[0][0]:spans[0][1]]
+
+
 def test_tagged_corpus_get_all_sentences():
     train_sentence = Sentence("I'm used in training.", use_tokenizer=SegtokTokenizer())
     dev_sentence = Sentence("I'm a dev sentence.", use_tokenizer=SegtokTokenizer())
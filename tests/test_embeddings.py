@@ -1,3 +1,7 @@
+import io
+import re
+
+import numpy as np
 import pytest
 import torch
 
@@ -48,6 +52,67 @@ def test_keep_batch_order():
     del embeddings
 
 
+def _expected_word_vector(word_embeddings, word):
+    keyed_vectors = word_embeddings.precomputed_word_embeddings
+    for candidate in [word, word.lower(), re.sub(r"\d", "#", word.lower()), re.sub(r"\d", "0", word.lower())]:
+        if candidate in keyed_vectors:
+            return torch.tensor(keyed_vectors[candidate]).float()
+    return torch.zeros(word_embeddings.embedding_length)
+
+
+def test_word_embeddings_fallbacks():
+    text = "Berlin BERLIN berlin 1999 qwxzvbnm"
+    sentence = Sentence(text)
+    glove.embed(sentence)
+
+    for token in sentence:
+        assert torch.allclose(token.get_embedding().cpu(), _expected_word_vector(glove, token.text))
+    assert torch.count_nonzero(sentence[4].get_embedding()) == 0
+
+    # the vectors of the lookup follow the device of the module, but are not in the state_dict
+    assert "_lookup_vectors" in dict(glove.named_buffers())
+    assert "_lookup_vectors" not in glove.state_dict()
+
+    # the lookup is not pickled, but built again on first use
+    buffer = io.BytesIO()
+    torch.save(glove, buffer)
+    buffer.seek(0)
+    loaded = torch.load(buffer)
+    assert loaded.__dict__["_lookup"] is None
+    assert "_lookup_vectors" not in dict(loaded.named_buffers())
+
+    loaded_sentence = Sentence(text)
+    loaded.embed(loaded_sentence)
+    for token, expected_token in zip(loaded_sentence, sentence):
+        assert torch.equal(token.get_embedding(), expected_token.get_embedding())
+
+
+def test_memory_mapped_word_embeddings():
+    embeddings = WordEmbeddings("turian", memory_mapped=True)
+    assert isinstance(embeddings.precomputed_word_embeddings.vectors, np.memmap)
+
+    sentence = Sentence("I love Berlin .")
+    embeddings.embed(sentence)
+    expected = Sentence("I love Berlin .")
+    glove.embed(expected)
+    for token, expected_token in zip(sentence, expected):
+        assert torch.equal(token.get_embedding(), expected_token.get_embedding())
+
+    # saved embeddings reference the file instead of containing the vectors
+    buffer = io.BytesIO()
+    torch.save(embeddings, buffer)
+    assert buffer.tell() < embeddings.precomputed_word_embeddings.vectors.nbytes
+    buffer.seek(0)
+    loaded = torch.load(buffer)
+    assert loaded.vectors_file == embeddings.vectors_file
+    assert isinstance(loaded.precomputed_word_embeddings.vectors, np.memmap)
+
+    sentence = Sentence("I love Berlin .")
+    loaded.embed(sentence)
+    for token, expected_token in zip(sentence, expected):
+        assert torch.equal(token.get_embedding(), expected_token.get_embedding())
+
+
 def test_stacked_embeddings():
 
     embeddings: StackedEmbeddings = StackedEmbeddings([glove, flair_embedding])
@@ -184,6 +249,46 @@ def test_fine_tunable_flair_embedding():
     del embeddings
 
 
+def test_scripted_flair_embedding():
+    for is_forward_lm, nout in [(True, None), (False, 16)]:
+        language_model = LanguageModel(
+            Dictionary.load("chars"), is_forward_lm=is_forward_lm, hidden_size=32, nlayers=2, nout=nout
+        )
+        language_model.eval()
+
+        eager = FlairEmbeddings(language_model, chars_per_chunk=4)
+        scripted = FlairEmbeddings(language_model, chars_per_chunk=4, scripted_lm=True)
+
+        # non-ASCII characters, also ones missing from the dictionary, take one position each like in eager mode
+        texts = ["I love Berlin .", "Ich liebe Berlin und Paris und London .", "Berlin", "Müller wohnt in Köln , 5 € ☃ ."]
+        expected = [Sentence(text) for text in texts]
+        eager.embed(expected)
+        sentences = [Sentence(text) for text in texts]
+        scripted.embed(sentences)
+
+        for sentence, expected_sentence in zip(sentences, expected):
+            for token, expected_token in zip(sentence, expected_sentence):
+                assert torch.allclose(token.get_embedding(), expected_token.get_embedding(), atol=1e-6)
+
+        # the compiled language model is not pickled, but compiled again after loading
+        buffer = io.BytesIO()
+        torch.save(scripted, buffer)
+        buffer.seek(0)
+        loaded = torch.load(buffer)
+        assert loaded._get_compiled_lm() is not None
+
+        sentence = Sentence(texts[0])
+        loaded.embed(sentence)
+        assert torch.allclose(sentence[2].get_embedding(), expected[0][2].get_embedding(), atol=1e-6)
+
+    # fine-tuning runs the language model eagerly
+    fine_tuned = FlairEmbeddings(language_model, fine_tune=True, scripted_lm=True)
+    fine_tuned.train()
+    sentence = Sentence("I love Berlin .")
+    fine_tuned.embed(sentence)
+    assert sentence[0].get_embedding().requires_grad
+
+
 def test_document_lstm_embeddings():
     sentence: Sentence = Sentence("I love Berlin. Berlin is a great place to live.")
 
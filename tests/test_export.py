@@ -0,0 +1,103 @@
+import shutil
+
+import pytest
+import torch
+
+import flair.datasets
+from flair.data import Sentence
+from flair.embeddings import WordEmbeddings, FlairEmbeddings, StackedEmbeddings, DocumentPoolEmbeddings
+from flair.export import export_torchscript, ExportedModel
+from flair.models import SequenceTagger, TextClassifier
+
+turian_embeddings = WordEmbeddings("turian")
+flair_embeddings = FlairEmbeddings("news-forward-fast")
+
+
+def _padded_token_embeddings(sentences, embedding):
+    embedding.embed(sentences)
+    padded = torch.zeros(len(sentences), max(len(sentence) for sentence in sentences), embedding.embedding_length)
+    for index, sentence in enumerate(sentences):
+        for position, token in enumerate(sentence):
+            padded[index, position] = token.get_embedding([embedding.name])
+    return padded
+
+
+@pytest.mark.integration
+def test_export_tagger(tasks_base_path, results_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tagger = SequenceTagger(
+        hidden_size=32,
+        embeddings=StackedEmbeddings([turian_embeddings, flair_embeddings]),
+        tag_dictionary=corpus.make_tag_dictionary("ner"),
+        tag_type="ner",
+        reproject_embeddings=16,
+    )
+    tagger.eval()
+
+    # unknown non-ASCII words fall back to their lowercase and digit forms like in WordEmbeddings
+    texts = [
+        "I love Berlin", "Ich liebe Berlin und Paris 2020 .", "Berlin", "ÉCOLE in MÜNCHEN , ZÜRICH ٢٠٢٠ ÜBER"
+    ]
+    expected = [Sentence(text) for text in texts]
+    tagger.predict(expected)
+
+    results_base_path.mkdir(parents=True, exist_ok=True)
+    export_torchscript(tagger, results_base_path / "tagger.pt")
+    exported = ExportedModel(results_base_path / "tagger.pt")
+
+    assert exported.model_type == "SequenceTagger"
+    assert exported.external_embedding_names == [flair_embeddings.name]
+
+    external_embeddings = [_padded_token_embeddings([Sentence(text) for text in texts], flair_embeddings)]
+    results = exported.predict(texts, external_embeddings)
+
+    for result, expected_sentence in zip(results, expected):
+        assert result["tokens"] == [token.text for token in expected_sentence]
+        assert result["labels"] == [token.get_tag("ner").value for token in expected_sentence]
+        assert result["scores"] == pytest.approx([token.get_tag("ner").score for token in expected_sentence], abs=1e-5)
+
+    # the words are resolved to the rows WordEmbeddings looks up
+    words = texts[3].split()
+    lookup = turian_embeddings._get_lookup()
+    word_ids = exported._get_word_ids([words], exported.vocabularies[0])
+    assert word_ids[0].tolist() == [turian_embeddings._get_word_id(word, lookup) for word in words]
+
+    # empty sentences get no predictions, and the external embeddings of all sentences are passed in
+    results = exported.predict(["", texts[0]], [torch.cat([external_embeddings[0][:1]] * 2)])
+    assert results[0]["labels"] == []
+    assert results[1]["labels"] == [token.get_tag("ner").value for token in expected[0]]
+
+    with pytest.raises(ValueError):
+        exported.predict(texts)
+
+    # clean up results directory
+    shutil.rmtree(results_base_path)
+
+
+@pytest.mark.integration
+def test_export_classifier(tasks_base_path, results_base_path):
+    corpus = flair.datasets.ClassificationCorpus(tasks_base_path / "imdb")
+    classifier = TextClassifier(
+        DocumentPoolEmbeddings([turian_embeddings], fine_tune_mode="linear"), corpus.make_label_dictionary()
+    )
+    classifier.eval()
+
+    texts = ["Berlin is a really nice city .", "I hate 42 rainy days"]
+    expected = [Sentence(text) for text in texts]
+    classifier.predict(expected)
+
+    results_base_path.mkdir(parents=True, exist_ok=True)
+    export_torchscript(classifier, results_base_path / "classifier.pt")
+
+    # the bundle only needs torch to run
+    module = torch.jit.load(str(results_base_path / "classifier.pt"))
+    labels, scores = module([text.split() for text in texts], [])
+
+    for sentence_labels, sentence_scores, expected_sentence in zip(labels, scores, expected):
+        assert sentence_labels == [expected_sentence.labels[0].value]
+        assert sentence_scores == pytest.approx([expected_sentence.labels[0].score], abs=1e-5)
+
+    # clean up results directory
+    shutil.rmtree(results_base_path)
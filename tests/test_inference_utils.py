@@ -0,0 +1,289 @@
+import asyncio
+import shutil
+import time
+
+import pytest
+import torch
+
+import flair.datasets
+from flair.data import Sentence
+from flair.embeddings import WordEmbeddings, DocumentPoolEmbeddings
+from flair.inference_utils import (
+    PredictionCache,
+    MultiProcessPredictor,
+    AsyncPredictor,
+    tune_batch_size,
+    quantize_and_evaluate,
+    _resident_memory_mb,
+    _ResidentMemorySampler,
+)
+from flair.models import SequenceTagger, MultiTagger, TextClassifier
+
+turian_embeddings = WordEmbeddings("turian")
+
+
+def _make_tagger(tag_dictionary, use_crf=True):
+    tagger = SequenceTagger(
+        hidden_size=32,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=use_crf,
+    )
+    tagger.eval()
+    return tagger
+
+
+def _assert_same_tags(sentences, expected_sentences, label_name):
+    for sentence, expected_sentence in zip(sentences, expected_sentences):
+        for token, expected_token in zip(sentence, expected_sentence):
+            assert token.get_tag(label_name).value == expected_token.get_tag(label_name).value
+            assert token.get_tag(label_name).score == pytest.approx(expected_token.get_tag(label_name).score)
+
+
+@pytest.mark.integration
+def test_prediction_cache_tagger(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tagger = _make_tagger(corpus.make_tag_dictionary("ner"))
+
+    texts = ["I love Berlin", "Ich liebe Berlin und Paris .", "I love Berlin", ""]
+    expected = [Sentence(text) for text in texts]
+    tagger.predict(expected)
+
+    cache = PredictionCache(max_size=2)
+
+    # duplicates within a call are predicted once
+    sentences = [Sentence(text) for text in texts]
+    cache.predict(tagger, sentences)
+    _assert_same_tags(sentences, expected, "ner")
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert len(cache) == 2
+
+    # only the most recently used sentences stay cached
+    sentences = [Sentence(text) for text in texts]
+    cache.predict(tagger, sentences, lazy_labels=True)
+    _assert_same_tags(sentences, expected, "ner")
+    assert (cache.hits, cache.misses) == (2, 6)
+
+    sentences = [Sentence(text) for text in texts]
+    cache.predict(tagger, sentences, lazy_labels=True)
+    _assert_same_tags(sentences, expected, "ner")
+    assert (cache.hits, cache.misses) == (5, 7)
+    assert cache.hit_rate == pytest.approx(5 / 12)
+
+    cache.clear()
+    assert len(cache) == 0 and cache.hits == 0 and cache.misses == 0
+
+
+@pytest.mark.integration
+def test_prediction_cache_multi_tagger(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+    multi_tagger = MultiTagger({"crf": _make_tagger(tag_dictionary), "softmax": _make_tagger(tag_dictionary, False)})
+
+    texts = ["I love Berlin", "I love Berlin", "Ich liebe Berlin und Paris ."]
+    expected = [Sentence(text) for text in texts]
+    multi_tagger.predict(expected)
+
+    cache = PredictionCache()
+    sentences = [Sentence(text) for text in texts]
+    cache.predict(multi_tagger, sentences)
+    cache.predict(multi_tagger, sentences)
+
+    _assert_same_tags(sentences, expected, "crf")
+    _assert_same_tags(sentences, expected, "softmax")
+    assert (cache.hits, cache.misses) == (4, 2)
+
+
+@pytest.mark.integration
+def test_prediction_cache_classifier(tasks_base_path):
+    corpus = flair.datasets.ClassificationCorpus(tasks_base_path / "imdb")
+    classifier = TextClassifier(DocumentPoolEmbeddings([turian_embeddings]), corpus.make_label_dictionary())
+    classifier.eval()
+
+    expected = Sentence("Berlin is a really nice city.")
+    classifier.predict(expected)
+
+    cache = PredictionCache()
+    sentences = [Sentence("Berlin is a really nice city."), Sentence("Berlin is a really nice city.")]
+    cache.predict(classifier, sentences)
+    cache.predict(classifier, sentences)
+
+    for sentence in sentences:
+        assert [label.value for label in sentence.labels] == [label.value for label in expected.labels]
+        assert sentence.labels[0].score == pytest.approx(expected.labels[0].score)
+    assert (cache.hits, cache.misses) == (3, 1)
+
+    # other prediction options are cached separately
+    cache.predict(classifier, sentences, label_name="other")
+    assert (cache.hits, cache.misses) == (4, 2)
+    assert sentences[1].get_labels("other")[0].value == expected.labels[0].value
+
+    # a cached prediction without labels replaces earlier labels
+    classifier.multi_label = True
+    classifier.multi_label_threshold = 1.0
+    sentences = [Sentence("Berlin is a really nice city."), Sentence("Berlin is a really nice city.")]
+    sentences[1].add_label("multi", "outdated")
+    cache.predict(classifier, sentences, label_name="multi")
+    assert [sentence.get_labels("multi") for sentence in sentences] == [[], []]
+
+    sentence = Sentence("Berlin is a really nice city.")
+    sentence.add_label("multi", "outdated")
+    cache.predict(classifier, sentence, label_name="multi")
+    assert sentence.get_labels("multi") == []
+
+
+@pytest.mark.integration
+def test_prediction_cache_model_identity(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    # each model is freed after its call, so later models may get its id, but not its cached predictions
+    cache = PredictionCache()
+    for _ in range(3):
+        cache.predict(_make_tagger(tag_dictionary), Sentence("I love Berlin"))
+    assert (cache.hits, cache.misses) == (0, 3)
+
+
+@pytest.mark.integration
+def test_multi_process_predictor(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tagger = _make_tagger(corpus.make_tag_dictionary("ner"))
+
+    texts = ["I love Berlin", "Ich liebe Berlin und Paris .", "", "Berlin", "I love Berlin and Paris and London ."] * 3
+    expected = [Sentence(text) for text in texts]
+    tagger.predict(expected, label_name="predicted")
+
+    with MultiProcessPredictor(tagger, num_workers=2, threads_per_worker=1) as predictor:
+        sentences = [Sentence(text) for text in texts]
+        predictor.predict(sentences, mini_batch_size=2, shard_size=3, label_name="predicted")
+        _assert_same_tags(sentences, expected, "predicted")
+
+        sentences = [Sentence(text) for text in texts]
+        predictor.predict(sentences, mini_batch_size=2, label_name="predicted", lazy_labels=True, all_tag_prob=True)
+        _assert_same_tags(sentences, expected, "predicted")
+
+        # the predictions refer to the tag dictionary of the model in the main process
+        assert sentences[0]._tag_predictions["predicted"][2] is tagger.tag_dictionary
+        assert sentences[0].tags_proba_dist["predicted"][1] is tagger.tag_dictionary
+
+
+@pytest.mark.integration
+def test_async_predictor(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+    multi_tagger = MultiTagger({"crf": _make_tagger(tag_dictionary), "softmax": _make_tagger(tag_dictionary, False)})
+
+    texts = ["I love Berlin", "Ich liebe Berlin und Paris .", "Berlin", "I love Berlin and Paris and London ."] * 3
+    expected = [Sentence(text) for text in texts]
+    multi_tagger.predict(expected)
+
+    async def predict_concurrently(sentences):
+        async with AsyncPredictor(multi_tagger, max_batch_size=4, max_wait_time=0.05) as predictor:
+            single = await asyncio.gather(*[predictor.apredict(sentence) for sentence in sentences[:-2]])
+            batch = await predictor.apredict(sentences[-2:])
+        return single + batch
+
+    sentences = [Sentence(text) for text in texts]
+    results = asyncio.get_event_loop().run_until_complete(predict_concurrently(sentences))
+
+    assert results == sentences
+    _assert_same_tags(sentences, expected, "crf")
+    _assert_same_tags(sentences, expected, "softmax")
+
+
+@pytest.mark.integration
+def test_tune_batch_size(tasks_base_path, results_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tagger = _make_tagger(corpus.make_tag_dictionary("ner"))
+
+    sentences = [Sentence(text) for text in ["I love Berlin", "Ich liebe Berlin und Paris .", "Berlin"] * 4]
+
+    settings = tune_batch_size(tagger, sentences, batch_sizes=[1, 4, 32], token_budgets=[10, 100], repeats=1)
+
+    assert settings["mini_batch_size"] in [1, 4, 12]
+    assert settings["max_tokens_per_batch"] in [10, 100]
+    assert len(settings["benchmarks"]) == 5
+    assert tagger.inference_settings == {
+        "mini_batch_size": settings["mini_batch_size"], "max_tokens_per_batch": settings["max_tokens_per_batch"]
+    }
+
+    # the sample sentences are not changed
+    assert all(token.get_tag("ner").value == "" for sentence in sentences for token in sentence)
+
+    # the settings are saved with the model
+    results_base_path.mkdir(parents=True, exist_ok=True)
+    tagger.save(results_base_path / "tuned-tagger.pt")
+    loaded_tagger = SequenceTagger.load(results_base_path / "tuned-tagger.pt")
+    assert loaded_tagger.inference_settings == tagger.inference_settings
+    loaded_tagger.predict(sentences)
+    list(loaded_tagger.predict_stream(sentences))
+
+    # a memory cap below the current memory use cannot be met
+    with pytest.raises(RuntimeError):
+        tune_batch_size(tagger, sentences, batch_sizes=[1], max_memory_mb=0.001, repeats=1)
+
+    # clean up results directory
+    shutil.rmtree(results_base_path)
+
+
+def test_resident_memory_sampler():
+    if _resident_memory_mb() is None:
+        pytest.skip("the resident memory cannot be measured on this system")
+
+    with _ResidentMemorySampler() as sampler:
+        before = _resident_memory_mb()
+        buffer = torch.ones(16 * 2 ** 20)
+        time.sleep(0.05)
+        del buffer
+    assert sampler.peak_memory_mb >= before + 32
+
+    # the peak of later samplers does not include the freed memory
+    with _ResidentMemorySampler() as later_sampler:
+        time.sleep(0.05)
+    assert later_sampler.peak_memory_mb < sampler.peak_memory_mb
+
+
+@pytest.mark.integration
+def test_quantize_and_evaluate(tasks_base_path, results_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tagger = _make_tagger(corpus.make_tag_dictionary("ner"))
+
+    report = quantize_and_evaluate(tagger, corpus.dev, num_workers=0)
+
+    assert report["delta"] == pytest.approx(report["quantized_main_score"] - report["main_score"])
+    assert tagger.quantization == {"dtype": "qint8"}
+    assert isinstance(tagger.rnn, torch.nn.quantized.dynamic.LSTM)
+    assert isinstance(tagger.linear, torch.nn.quantized.dynamic.Linear)
+
+    texts = ["I love Berlin", "Ich liebe Berlin und Paris ."]
+    expected = [Sentence(text) for text in texts]
+    tagger.predict(expected)
+
+    # quantized models are saved and loaded quantized
+    results_base_path.mkdir(parents=True, exist_ok=True)
+    tagger.save(results_base_path / "quantized-tagger.pt")
+    loaded_tagger = SequenceTagger.load(results_base_path / "quantized-tagger.pt")
+    assert loaded_tagger.quantization == {"dtype": "qint8"}
+    assert isinstance(loaded_tagger.rnn, torch.nn.quantized.dynamic.LSTM)
+
+    sentences = [Sentence(text) for text in texts]
+    loaded_tagger.predict(sentences)
+    _assert_same_tags(sentences, expected, "ner")
+
+    # clean up results directory
+    shutil.rmtree(results_base_path)
@@ -1,6 +1,9 @@
+import copy
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
+import torch
 from torch.optim import SGD
 from torch.optim.adam import Adam
 
@@ -9,9 +12,10 @@ from flair.data import Sentence, MultiCorpus
 from flair.embeddings import (
     WordEmbeddings,
     FlairEmbeddings,
+    StackedEmbeddings,
 )
-from flair.models import SequenceTagger
-from flair.trainers import ModelTrainer
+from flair.models import SequenceTagger, MultiTagger
+from flair.trainers import ModelTrainer, DistillationTrainer
 
 turian_embeddings = WordEmbeddings("turian")
 flair_embeddings = FlairEmbeddings("news-forward-fast")
@@ -327,3 +331,505 @@ def test_find_learning_rate(results_base_path, tasks_base_path):
     shutil.rmtree(results_base_path)
     del trainer, tagger, tag_dictionary, corpus
 
+
+@pytest.mark.integration
+def test_batched_viterbi_decoding(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    tagger: SequenceTagger = SequenceTagger(
+        hidden_size=64,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=True,
+    )
+    tagger.eval()
+
+    sentences = [
+        Sentence("I love Berlin"),
+        Sentence("Ich liebe Berlin und Paris ."),
+        Sentence("Berlin"),
+    ]
+
+    # decoding the padded batch gives the same result as decoding each sentence on its own
+    tagger.predict(sentences, mini_batch_size=3, all_tag_prob=True, label_name="batched")
+    for sentence in sentences:
+        tagger.predict(sentence, mini_batch_size=1, all_tag_prob=True, label_name="single")
+
+        for token in sentence:
+            assert token.get_tag("batched").value == token.get_tag("single").value
+            assert token.get_tag("batched").score == pytest.approx(token.get_tag("single").score)
+            batched_dist = token.get_tags_proba_dist("batched")
+            single_dist = token.get_tags_proba_dist("single")
+            assert len(batched_dist) == len(tag_dictionary)
+            for batched, single in zip(batched_dist, single_dist):
+                assert batched.score == pytest.approx(single.score)
+
+        # the tag marginals are attached to each sentence as one compact array
+        marginals = sentence.get_tags_proba_dist("batched")
+        assert marginals.shape == (len(sentence), len(tag_dictionary))
+        for token_marginals in marginals:
+            assert token_marginals.sum() == pytest.approx(1.0, rel=1e-5)
+
+
+@pytest.mark.integration
+def test_batched_crf_loss(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    tagger: SequenceTagger = SequenceTagger(
+        hidden_size=64,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=True,
+    )
+    tagger.eval()
+
+    sentences = corpus.train[:4]
+
+    # the loss of a padded batch is the mean of the losses of its sentences
+    batch_loss = tagger.forward_loss(sentences)
+    single_losses = [tagger.forward_loss([sentence]) for sentence in sentences]
+
+    assert batch_loss.item() == pytest.approx(sum(single_losses).item() / len(sentences), rel=1e-4)
+
+
+@pytest.mark.integration
+def test_train_load_use_tagger_without_rnn(results_base_path, tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    tagger: SequenceTagger = SequenceTagger(
+        hidden_size=64,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=False,
+        use_rnn=False,
+    )
+
+    # initialize trainer
+    trainer: ModelTrainer = ModelTrainer(tagger, corpus)
+
+    trainer.train(
+        results_base_path,
+        learning_rate=0.1,
+        mini_batch_size=2,
+        max_epochs=2,
+        shuffle=False,
+    )
+
+    del trainer, tagger, tag_dictionary, corpus
+    loaded_model: SequenceTagger = SequenceTagger.load(
+        results_base_path / "final-model.pt"
+    )
+
+    sentence = Sentence("I love Berlin")
+    sentence_long = Sentence("I love Berlin and Paris in the spring")
+    sentence_empty = Sentence("       ")
+
+    loaded_model.predict(sentence)
+    loaded_model.predict([sentence, sentence_long, sentence_empty], all_tag_prob=True)
+    loaded_model.predict([sentence_empty])
+
+    for token in sentence_long:
+        assert token.get_tag("ner").value != ""
+        assert len(token.get_tags_proba_dist("ner")) == len(loaded_model.tag_dictionary)
+
+    # forward() returns padded scores like taggers with RNN
+    features = loaded_model.forward([sentence, sentence_long])
+    assert features.shape == (2, len(sentence_long), len(loaded_model.tag_dictionary))
+    assert torch.all(features[0, len(sentence):] == 0)
+
+    # clean up results directory
+    shutil.rmtree(results_base_path)
+    del loaded_model
+
+
+@pytest.mark.integration
+def test_predict_lazy_labels(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    tagger: SequenceTagger = SequenceTagger(
+        hidden_size=64,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=True,
+    )
+    tagger.eval()
+
+    sentences = [Sentence("I love Berlin"), Sentence("Ich liebe Berlin und Paris .")]
+
+    tagger.predict(sentences, label_name="eager")
+    tagger.predict(sentences, label_name="lazy", lazy_labels=True)
+
+    for sentence in sentences:
+        tag_ids, scores = sentence.get_tag_predictions("lazy")
+        assert len(tag_ids) == len(scores) == len(sentence)
+
+        # spans can be read from the arrays without creating labels
+        span_predictions = sentence.get_span_predictions("lazy")
+        assert "lazy" in sentence._tag_predictions_pending
+
+        # accessing the labels creates them from the arrays
+        for token, tag_id in zip(sentence, tag_ids):
+            assert token.get_tag("lazy").value == tag_dictionary.get_item_for_index(tag_id)
+            assert token.get_tag("lazy").value == token.get_tag("eager").value
+            assert token.get_tag("lazy").score == pytest.approx(token.get_tag("eager").score)
+
+        assert [repr(span) for span in sentence.get_spans("lazy")] == \
+               [repr(span) for span in sentence.get_spans("eager")]
+        assert span_predictions == sentence.get_span_predictions("eager")
+
+
+@pytest.mark.integration
+def test_multi_tagger_shared_embeddings(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    crf_tagger: SequenceTagger = SequenceTagger(
+        hidden_size=64,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=True,
+    )
+    flat_tagger: SequenceTagger = SequenceTagger(
+        hidden_size=64,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=False,
+        use_rnn=False,
+    )
+    crf_tagger.eval()
+    flat_tagger.eval()
+
+    multi_tagger = MultiTagger({"crf": crf_tagger, "flat": flat_tagger})
+
+    sentences = [Sentence("I love Berlin"), Sentence(""), Sentence("Ich liebe Berlin und Paris .")]
+
+    crf_tagger.predict(sentences, label_name="crf-single")
+    flat_tagger.predict(sentences, label_name="flat-single")
+
+    for num_threads in [1, 2]:
+        losses = multi_tagger.predict(sentences, mini_batch_size=1, num_threads=num_threads, return_loss=True)
+        assert set(losses.keys()) == {"crf", "flat"}
+
+        for sentence in sentences:
+            for token in sentence:
+                for name in ["crf", "flat"]:
+                    assert token.get_tag(name).value == token.get_tag(f"{name}-single").value
+                    assert token.get_tag(name).score == pytest.approx(token.get_tag(f"{name}-single").score)
+
+            # embeddings are cleared after predicting
+            assert all(not token._embeddings for token in sentence)
+
+
+@pytest.mark.integration
+def test_distill_tagger(results_base_path, tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+
+    for teacher_crf, student_crf in [(True, False), (False, True)]:
+        teacher: SequenceTagger = SequenceTagger(
+            hidden_size=64,
+            embeddings=turian_embeddings,
+            tag_dictionary=corpus.make_tag_dictionary("ner"),
+            tag_type="ner",
+            use_crf=teacher_crf,
+        )
+        student: SequenceTagger = SequenceTagger(
+            hidden_size=8,
+            embeddings=turian_embeddings,
+            tag_dictionary=corpus.make_tag_dictionary("ner"),
+            tag_type="ner",
+            use_crf=student_crf,
+        )
+
+        trainer = DistillationTrainer(student, teacher, corpus, temperature=2.0, alpha=0.5)
+
+        # teacher scores are cached in the order of the student dictionary
+        sentence = corpus.train[0]
+        trainer._add_teacher_scores([sentence])
+        scores = trainer.teacher_scores[sentence.to_tokenized_string()]
+        assert scores.shape == (len(sentence), len(student.tag_dictionary))
+
+        loss = trainer._forward_loss([corpus.train[0], corpus.train[1]])
+        assert loss.item() > 0
+        loss.backward()
+
+        trainer.train(results_base_path, learning_rate=0.1, mini_batch_size=2, max_epochs=2, shuffle=False)
+        assert len(trainer.teacher_scores) >= len(corpus.train)
+
+        loaded_model: SequenceTagger = SequenceTagger.load(results_base_path / "final-model.pt")
+        sentence = Sentence("I love Berlin")
+        loaded_model.predict(sentence)
+        assert all(token.get_tag("ner").value != "" for token in sentence)
+
+        # clean up results directory
+        shutil.rmtree(results_base_path)
+        del loaded_model, trainer
+
+
+@pytest.mark.integration
+def test_distill_tagger_from_copy(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+
+    # a student that equals its teacher predicts the soft targets exactly
+    for use_crf in [True, False]:
+        teacher: SequenceTagger = SequenceTagger(
+            hidden_size=16,
+            embeddings=turian_embeddings,
+            tag_dictionary=corpus.make_tag_dictionary("ner"),
+            tag_type="ner",
+            use_crf=use_crf,
+        )
+        student = copy.deepcopy(teacher)
+        student.eval()
+
+        trainer = DistillationTrainer(student, teacher, corpus, temperature=2.0, alpha=1.0)
+        loss = trainer._forward_loss([corpus.train[0], corpus.train[1]])
+        assert loss.item() == pytest.approx(0.0, abs=1e-4)
+
+
+@pytest.mark.integration
+def test_evaluate_span_f1(results_base_path, tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    tagger: SequenceTagger = SequenceTagger(
+        hidden_size=32,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=False,
+    )
+    tagger.eval()
+
+    results_base_path.mkdir(parents=True, exist_ok=True)
+    result, _ = tagger.evaluate(corpus.test, out_path=results_base_path / "test.tsv", mini_batch_size=2)
+
+    # count matches of the Span objects of all sentences
+    tp, fp, fn = 0, 0, 0
+    for sentence in corpus.test:
+        gold = {(span.tag, repr(span)) for span in sentence.get_spans("ner")}
+        predicted = {(span.tag, repr(span)) for span in sentence.get_spans("predicted")}
+        tp += len(gold & predicted)
+        fp += len(predicted - gold)
+        fn += len(gold - predicted)
+
+    precision = tp / (tp + fp) if tp + fp > 0 else 0.0
+    recall = tp / (tp + fn) if tp + fn > 0 else 0.0
+    assert result.log_line == f"{precision:.4f}\t{recall:.4f}\t{result.main_score:.4f}"
+
+    # the BIO file has one line per token and an empty line after each sentence
+    lines = (results_base_path / "test.tsv").read_text(encoding="utf-8").split("\n")
+    assert len([line for line in lines if line]) == sum(len(sentence) for sentence in corpus.test)
+    for line in lines:
+        if line:
+            assert line.split(" ")[1][0] in "BIO" and line.split(" ")[2][0] in "BIO"
+
+    # gold spans with tags missing from the tag dictionary count as false negatives
+    sentence = Sentence("Berlin is nice")
+    sentence[0].add_tag("ner", "S-UNSEEN")
+    result, _ = tagger.evaluate([sentence], mini_batch_size=1)
+    assert "UNSEEN     tp: 0 - fp: 0 - fn: 1" in result.detailed_results
+
+    # evaluating again does not create labels for the predictions of the earlier evaluation
+    sentences = list(corpus.dev)
+    tagger.evaluate(sentences, mini_batch_size=2)
+    tagger.evaluate(sentences, mini_batch_size=2)
+    assert all("predicted" in sentence._tag_predictions_pending for sentence in sentences)
+
+    # clean up results directory
+    shutil.rmtree(results_base_path)
+
+
+@pytest.mark.integration
+def test_predict_stream(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    tagger: SequenceTagger = SequenceTagger(
+        hidden_size=32,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=True,
+    )
+    tagger.eval()
+
+    texts = ["I love Berlin", "Ich liebe Berlin und Paris .", "", "Berlin", "I love Berlin and Paris and London ."]
+
+    def read_sentences():
+        for text in texts * 3:
+            yield Sentence(text)
+
+    expected = [Sentence(text) for text in texts * 3]
+    tagger.predict(expected, label_name="predicted")
+
+    streamed = list(tagger.predict_stream(read_sentences(), max_tokens_per_batch=10, window_size=4,
+                                          label_name="predicted"))
+
+    # all sentences are returned in input order
+    assert [sentence.to_tokenized_string() for sentence in streamed] == \
+           [sentence.to_tokenized_string() for sentence in expected]
+    for sentence, expected_sentence in zip(streamed, expected):
+        for token, expected_token in zip(sentence, expected_sentence):
+            assert token.get_tag("predicted").value == expected_token.get_tag("predicted").value
+            assert token.get_tag("predicted").score == pytest.approx(expected_token.get_tag("predicted").score)
+
+    # no batch exceeds the token budget unless it holds a single sentence
+    batches = SequenceTagger._split_by_token_budget([0, 1, 2, 3], [7, 3, 2, 0], max_tokens=6)
+    assert batches == [[0], [1, 2], [3]]
+
+
+@pytest.mark.integration
+def test_predict_documents(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    tagger: SequenceTagger = SequenceTagger(
+        hidden_size=32,
+        embeddings=turian_embeddings,
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=True,
+    )
+    tagger.eval()
+
+    documents = ["I love Berlin. Ich liebe Berlin und Paris.", "", "Berlin is big.  And Paris is nice too!"]
+
+    document_sentences = tagger.predict_documents(documents, mini_batch_size=2)
+
+    assert len(document_sentences) == 3
+    assert document_sentences[1] == []
+
+    for document, sentences in zip(documents, document_sentences):
+        for sentence in sentences:
+            # sentence offsets point into the document
+            assert document[sentence.start_pos:sentence.end_pos] == sentence.to_original_text()
+
+            # predictions are the same as for a single sentence
+            expected = Sentence(sentence.to_original_text())
+            tagger.predict(expected)
+            assert [token.get_tag("ner").value for token in sentence] == \
+                   [token.get_tag("ner").value for token in expected]
+
+            for (start, end, tag, score), span in zip(sentence.get_document_spans("ner"), sentence.get_spans("ner")):
+                assert document[start:end] == span.to_original_text()
+                assert tag == span.tag
+
+
+@pytest.mark.integration
+def test_predict_from_threads(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tag_dictionary = corpus.make_tag_dictionary("ner")
+
+    tagger: SequenceTagger = SequenceTagger(
+        hidden_size=32,
+        embeddings=StackedEmbeddings([turian_embeddings, flair_embeddings]),
+        tag_dictionary=tag_dictionary,
+        tag_type="ner",
+        use_crf=True,
+    )
+    tagger.eval()
+
+    texts = ["I love Berlin", "Ich liebe Berlin und Paris .", "Berlin", "I love Berlin and Paris and London ."] * 5
+    expected = [Sentence(text) for text in texts]
+    tagger.predict(expected)
+
+    storage_modes = ["none", "cpu"] * 4
+
+    def predict(storage_mode: str):
+        sentences = [Sentence(text) for text in texts]
+        for _ in range(3):
+            tagger.predict(sentences, mini_batch_size=3, embedding_storage_mode=storage_mode)
+        assert flair.get_embedding_storage_mode() == storage_mode
+        return sentences
+
+    global_storage_mode = flair.embedding_storage_mode
+    try:
+        flair.embedding_storage_mode = "default"
+        with ThreadPoolExecutor(max_workers=len(storage_modes)) as executor:
+            results = list(executor.map(predict, storage_modes))
+
+        # the storage modes of the threads do not change the global setting
+        assert flair.embedding_storage_mode == "default"
+    finally:
+        flair.embedding_storage_mode = global_storage_mode
+
+    for storage_mode, sentences in zip(storage_modes, results):
+        for sentence, expected_sentence in zip(sentences, expected):
+            assert len(sentence[0]._embeddings) == (0 if storage_mode == "none" else 2)
+            for token, expected_token in zip(sentence, expected_sentence):
+                assert token.get_tag("ner").value == expected_token.get_tag("ner").value
+                assert token.get_tag("ner").score == pytest.approx(expected_token.get_tag("ner").score)
+
+
+@pytest.mark.integration
+def test_predict_bfloat16(tasks_base_path, results_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tagger: SequenceTagger = SequenceTagger(
+        hidden_size=32,
+        embeddings=StackedEmbeddings([turian_embeddings, flair_embeddings]),
+        tag_dictionary=corpus.make_tag_dictionary("ner"),
+        tag_type="ner",
+        use_crf=True,
+    )
+    tagger.eval()
+
+    with pytest.raises(ValueError):
+        tagger.set_inference_precision("float16")
+
+    # the embeddings are shared with the other tests, so they are always reset to float32
+    try:
+        tagger.set_inference_precision("bfloat16")
+        assert turian_embeddings.inference_precision == "bfloat16"
+
+        sentences = [Sentence("I love Berlin"), Sentence("Ich liebe Berlin und Paris .")]
+        tagger.predict(sentences, embedding_storage_mode="cpu")
+        for sentence in sentences:
+            assert all(embedding.dtype == torch.bfloat16 for embedding in sentence[0]._embeddings.values())
+            for token in sentence:
+                assert token.get_tag("ner").value != ""
+                assert 0.0 <= token.get_tag("ner").score <= 1.0
+
+        # the precision is saved with the model
+        tagger.save(results_base_path / "bfloat16-tagger.pt")
+        loaded_tagger = SequenceTagger.load(results_base_path / "bfloat16-tagger.pt")
+        assert loaded_tagger.inference_precision == "bfloat16"
+        loaded_tagger.predict(Sentence("I love Berlin"))
+    finally:
+        tagger.set_inference_precision("float32")
+
+    # clean up results directory
+    shutil.rmtree(results_base_path)
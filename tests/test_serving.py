@@ -0,0 +1,112 @@
+import json
+import queue
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import flair.datasets
+from flair.data import Sentence
+from flair.embeddings import WordEmbeddings, DocumentPoolEmbeddings
+from flair.models import SequenceTagger, TextClassifier
+from flair.serving import ModelRegistry, InferenceServer, ServedModel
+
+turian_embeddings = WordEmbeddings("turian")
+
+
+def _post(url: str, content: dict):
+    request = urllib.request.Request(url, data=json.dumps(content).encode("utf-8"), method="POST")
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+@pytest.mark.integration
+def test_inference_server(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tagger = SequenceTagger(
+        hidden_size=32, embeddings=turian_embeddings, tag_dictionary=corpus.make_tag_dictionary("ner"), tag_type="ner"
+    )
+    tagger.eval()
+
+    classification_corpus = flair.datasets.ClassificationCorpus(tasks_base_path / "imdb")
+    classifier = TextClassifier(
+        DocumentPoolEmbeddings([turian_embeddings]), classification_corpus.make_label_dictionary()
+    )
+    classifier.eval()
+
+    registry = ModelRegistry()
+    registry.register("ner", tagger, max_batch_size=4)
+    registry.register("sentiment", classifier)
+
+    server = InferenceServer(registry, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        with urllib.request.urlopen(f"{url}/models") as response:
+            assert json.loads(response.read().decode("utf-8"))["models"] == {
+                "ner": "SequenceTagger", "sentiment": "TextClassifier"
+            }
+
+        expected = Sentence("I love Berlin .")
+        tagger.predict(expected)
+        result = _post(f"{url}/models/ner/predict", {"sentences": ["I love Berlin .", ""]})["sentences"]
+        assert [entity["text"] for entity in result[0]["entities"]] == [span.text for span in expected.get_spans("ner")]
+        assert result[1] == {"text": "", "labels": [], "entities": []}
+
+        expected = Sentence("Berlin is a really nice city.")
+        classifier.predict(expected)
+        result = _post(f"{url}/models/sentiment/predict", {"sentences": [["Berlin", "is", "nice"]] * 2})
+        assert len(result["sentences"]) == 2
+        assert result["sentences"][0]["text"] == "Berlin is nice"
+        assert len(result["sentences"][0]["labels"]) == 1
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            _post(f"{url}/models/sentiment/predict", {"sentences": [["Berlin", 42]]})
+        assert error.value.code == 400
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            _post(f"{url}/models/pos/predict", {"sentences": ["I love Berlin ."]})
+        assert error.value.code == 404
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            _post(f"{url}/models/ner/predict", {"texts": ["I love Berlin ."]})
+        assert error.value.code == 400
+
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            metrics = json.loads(response.read().decode("utf-8"))["models"]
+        assert metrics["ner"]["requests"] == 1 and metrics["ner"]["sentences"] == 1
+        assert metrics["sentiment"]["sentences"] == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+        registry.stop()
+
+
+@pytest.mark.integration
+def test_served_model_rejects_when_full(tasks_base_path):
+    corpus = flair.datasets.ColumnCorpus(
+        data_folder=tasks_base_path / "fashion", column_format={0: "text", 3: "ner"}
+    )
+    tagger = SequenceTagger(
+        hidden_size=32, embeddings=turian_embeddings, tag_dictionary=corpus.make_tag_dictionary("ner"), tag_type="ner"
+    )
+
+    # without a running worker, the queue is not emptied
+    served_model = ServedModel(tagger, max_queue_size=2)
+    requests = [served_model.submit([Sentence("I love Berlin")]) for _ in range(2)]
+    with pytest.raises(queue.Full):
+        served_model.submit([Sentence("I love Berlin")])
+    assert served_model.metrics()["rejected"] == 1
+
+    # queued requests are predicted in one batch once the worker runs
+    served_model.start()
+    for request in requests:
+        assert request.done.wait(10)
+        assert request.error is None
+    served_model.stop()
+    assert served_model.metrics()["batches"] == 1
@@ -12,7 +12,7 @@ from flair.embeddings import (
 )
 from flair.models import TextClassifier
 from flair.samplers import ImbalancedClassificationDatasetSampler
-from flair.trainers import ModelTrainer
+from flair.trainers import ModelTrainer, DistillationTrainer
 
 turian_embeddings = WordEmbeddings("turian")
 flair_embeddings = FlairEmbeddings("news-forward-fast")
@@ -286,4 +286,50 @@ def test_labels_to_one_hot(tasks_base_path):
             if idx == expected:
                 assert actual[idx] == 1
             else:
-                assert actual[idx] == 0
\ No newline at end of file
+                assert actual[idx] == 0
+
+
+@pytest.mark.integration
+def test_distill_classifier(results_base_path, tasks_base_path):
+    corpus = flair.datasets.ClassificationCorpus(tasks_base_path / "imdb")
+    label_dict = corpus.make_label_dictionary()
+
+    teacher: TextClassifier = TextClassifier(document_embeddings, label_dict, multi_label=False)
+    student: TextClassifier = TextClassifier(
+        DocumentRNNEmbeddings([turian_embeddings], 16, 1, False, 16, False, False), label_dict, multi_label=False
+    )
+
+    trainer = DistillationTrainer(student, teacher, corpus, temperature=2.0, alpha=0.5)
+    trainer.train(results_base_path, max_epochs=2, shuffle=False)
+
+    # the teacher ran once per training sentence
+    assert len(trainer.teacher_scores) <= len(corpus.train)
+    for scores in trainer.teacher_scores.values():
+        assert scores.shape == (len(label_dict),)
+
+    loaded_model = TextClassifier.load(results_base_path / "final-model.pt")
+    sentence = Sentence("Berlin is a really nice city.")
+    loaded_model.predict(sentence)
+    assert 0.0 <= sentence.labels[0].score <= 1.0
+
+    # clean up results directory
+    shutil.rmtree(results_base_path)
+    del loaded_model, trainer
+
+
+@pytest.mark.integration
+def test_predict_stream_classifier(tasks_base_path):
+    corpus = flair.datasets.ClassificationCorpus(tasks_base_path / "imdb")
+    label_dict = corpus.make_label_dictionary()
+
+    model: TextClassifier = TextClassifier(document_embeddings, label_dict, multi_label=False)
+    model.eval()
+
+    texts = ["Berlin is a really nice city.", "I love Berlin", "Not good at all, sadly."] * 4
+
+    streamed = list(model.predict_stream((Sentence(text) for text in texts), max_tokens_per_batch=16, window_size=5))
+
+    assert [sentence.to_plain_string() for sentence in streamed] == [Sentence(text).to_plain_string() for text in texts]
+    for sentence in streamed:
+        assert len(sentence.labels) == 1
+        assert 0.0 <= sentence.labels[0].score <= 1.0